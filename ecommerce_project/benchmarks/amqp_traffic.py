@@ -0,0 +1,83 @@
+"""
+Capture real broker traffic and replay it against a test stack (shared/capture.py).
+
+capture: records every message published to order_queue, inventory_queue and
+    notification_queue into a capture file, without consuming anything. On
+    RabbitMQ this reads the firehose, so enable it first with `rabbitmqctl trace_on`
+    (and `trace_off` afterwards; it costs the broker a copy of every publish).
+replay:  publishes a capture into the broker the environment points at, at the
+    recorded pace (--speed 1), N times faster (--speed N) or as fast as possible
+    (--speed max), then reports throughput, schedule lag and queue backlog.
+inspect: message counts per queue and the recorded duration.
+
+To replay into the in-process transport with the services attached, use
+`python services/run_local.py --replay FILE --speed N` instead.
+
+    python benchmarks/amqp_traffic.py capture orders.cap --duration 600
+    python benchmarks/amqp_traffic.py replay orders.cap --speed 10
+    python benchmarks/amqp_traffic.py replay orders.cap --speed max --queues order_queue
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services"))
+from shared import capture  # noqa: E402
+
+def parse_speed(value: str):
+    """'max' (None), or a positive factor such as 1, 10 or 10x"""
+    if value.lower() == "max":
+        return None
+    speed = float(value.lower().rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("capture", help="Record published messages to a capture file")
+    record.add_argument("path")
+    record.add_argument("--queues", nargs="+", default=list(capture.QUEUES))
+    record.add_argument("--duration", type=float, help="Seconds to record (default: until Ctrl-C)")
+    record.add_argument("--max-messages", type=int)
+
+    play = commands.add_parser("replay", help="Publish a capture into the broker")
+    play.add_argument("path")
+    play.add_argument("--speed", type=parse_speed, default=1.0, help="1, N, Nx or max (default 1)")
+    play.add_argument("--queues", nargs="+", help="Only replay these queues")
+    play.add_argument("--concurrency", type=int, default=64, help="Publishes awaiting a confirm at once")
+    play.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between queue depth samples")
+    play.add_argument("--drain-timeout", type=float, default=60.0,
+                      help="Seconds to wait for consumers to empty the queues (0 to skip)")
+
+    inspect = commands.add_parser("inspect", help="Summarize a capture file")
+    inspect.add_argument("path")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "capture":
+        try:
+            result = asyncio.run(capture.capture(args.path, args.queues, args.duration, args.max_messages))
+        except KeyboardInterrupt:
+            # The writer is closed on cancellation; everything recorded so far is readable
+            reader = capture.CaptureReader(args.path)
+            result = reader.summary()
+            reader.close()
+    elif args.command == "replay":
+        result = asyncio.run(capture.replay(
+            args.path, args.speed, args.queues, args.concurrency, args.sample_interval, args.drain_timeout
+        ))
+    else:
+        reader = capture.CaptureReader(args.path)
+        result = reader.summary()
+        reader.close()
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark for the order history endpoint's query pattern.
+
+Loads a long order history for a single synthetic user and times one page
+at increasing depths with keyset pagination (what GET /users/{id}/orders
+does) and with OFFSET for comparison. Keyset pages should stay flat while
+OFFSET grows linearly with depth.
+
+    python benchmarks/order_history.py --rows 10000000
+    python benchmarks/order_history.py --rows 10000000 --skip-load   # reuse loaded rows
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from asyncpg import connect
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BENCH_USER_ID = -1  # not a real user, so benchmark rows are easy to remove
+PAGE_SIZE = 20
+
+KEYSET_QUERY = """
+SELECT id, product_id, user_id, quantity, status, updated_at FROM orders
+WHERE user_id = $1 AND id < $2
+ORDER BY id DESC LIMIT $3
+"""
+OFFSET_QUERY = """
+SELECT id, product_id, user_id, quantity, status, updated_at FROM orders
+WHERE user_id = $1
+ORDER BY id DESC OFFSET $2 LIMIT $3
+"""
+
+async def load_history(conn, rows):
+    start_id = await conn.fetchval("SELECT COALESCE(MAX(id), 0) + 1 FROM orders")
+    print(f"Loading {rows} orders for user {BENCH_USER_ID} (ids from {start_id})...")
+    started = time.perf_counter()
+    await conn.execute(
+        """
+        INSERT INTO orders (id, product_id, user_id, quantity, status, updated_at)
+        SELECT g, 1 + (g % 1000), $1, 1 + (g % 5), 'completed', NOW() - (g % 365) * INTERVAL '1 day'
+        FROM generate_series($2::int, $3::int) AS g
+        """,
+        BENCH_USER_ID, start_id, start_id + rows - 1,
+    )
+    await conn.execute("ANALYZE orders")
+    # Index-only scans need an up-to-date visibility map
+    await conn.execute("VACUUM orders")
+    print(f"Loaded in {time.perf_counter() - started:.1f}s")
+
+async def time_query(conn, query, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await conn.fetch(query, *params)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), max(samples)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Order history pagination benchmark")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--skip-offset", action="store_true", help="Only time keyset pages")
+    parser.add_argument("--cleanup", action="store_true", help="Delete benchmark rows afterwards")
+    args = parser.parse_args()
+
+    conn = await connect(
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        database=os.getenv("DB_NAME"),
+    )
+    try:
+        if not args.skip_load:
+            await load_history(conn, args.rows)
+
+        total, newest = await conn.fetchrow(
+            "SELECT COUNT(*), MAX(id) FROM orders WHERE user_id = $1", BENCH_USER_ID
+        )
+        plan = await conn.fetch("EXPLAIN " + KEYSET_QUERY, BENCH_USER_ID, newest, PAGE_SIZE)
+        print(f"History size: {total} orders. Keyset plan:")
+        for row in plan:
+            print(f"  {row[0]}")
+
+        print(f"{'depth':>12} {'keyset p50':>12} {'keyset max':>12} {'offset p50':>12} {'offset max':>12}")
+        depth = 0
+        while depth < total:
+            # Benchmark ids are contiguous, so the cursor at a given depth is newest - depth
+            keyset = await time_query(
+                conn, KEYSET_QUERY, (BENCH_USER_ID, newest + 1 - depth, PAGE_SIZE), args.repeat
+            )
+            if args.skip_offset:
+                offset = (float("nan"), float("nan"))
+            else:
+                offset = await time_query(
+                    conn, OFFSET_QUERY, (BENCH_USER_ID, depth, PAGE_SIZE), max(1, args.repeat // 5)
+                )
+            print(f"{depth:>12} {keyset[0]:>10.2f}ms {keyset[1]:>10.2f}ms {offset[0]:>10.2f}ms {offset[1]:>10.2f}ms")
+            depth = depth * 10 if depth else 1000
+    finally:
+        if args.cleanup:
+            await conn.execute("DELETE FROM orders WHERE user_id = $1", BENCH_USER_ID)
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Benchmark for the response serialization path (shared/responses.py).
+
+Runs two copies of each endpoint in-process through the ASGI app (no network,
+broker or database) and reports CPU time per request:
+
+  - default: dict returned, FastAPI validates it against response_model and
+    encodes it with the stdlib encoder; the broker message is json.dumps-ed separately
+  - fast:    the payload is encoded once with orjson, reused for the broker message,
+    and returned as a FastJSONResponse, skipping response_model validation
+
+Endpoints: the gateway's POST /orders and a 100-item GET /products page.
+
+    python benchmarks/response_serialization.py --requests 20000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import List, Optional
+
+import httpx
+from fastapi import FastAPI, status
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services"))
+from shared.responses import FastJSONResponse, dumps, with_fields  # noqa: E402
+
+PAGE_SIZE = 100
+
+class OrderCreateRequest(BaseModel):
+    product_id: int
+    user_id: int
+    quantity: int
+
+class OrderResponse(BaseModel):
+    id: int
+    product_id: int
+    user_id: int
+    quantity: int
+    status: str
+    message: Optional[str] = None
+
+class Product(BaseModel):
+    id: int
+    name: str
+    stock: int
+    updated_at: Optional[datetime] = None
+
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_after_id: Optional[int] = None
+
+PRODUCTS = [
+    {"id": i, "name": f"Product {i}", "stock": i % 50, "updated_at": datetime(2024, 1, 1, 12, i % 60).isoformat()}
+    for i in range(1, PAGE_SIZE + 1)
+]
+
+published = []
+
+def build_app() -> FastAPI:
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+    def order_data(request: OrderCreateRequest) -> dict:
+        return {"id": 1700000000000, **request.model_dump(), "status": "received"}
+
+    @app.post("/default/orders", response_model=OrderResponse, status_code=status.HTTP_202_ACCEPTED)
+    async def default_order(request: OrderCreateRequest):
+        data = order_data(request)
+        published.append(json.dumps(data).encode())
+        return {**data, "message": "Order received and being processed"}
+
+    @app.post("/fast/orders", response_model=OrderResponse, status_code=status.HTTP_202_ACCEPTED)
+    async def fast_order(request: OrderCreateRequest):
+        body = dumps(order_data(request))
+        published.append(body)
+        return FastJSONResponse(
+            with_fields(body, message="Order received and being processed"),
+            status_code=status.HTTP_202_ACCEPTED
+        )
+
+    @app.get("/default/products", response_model=ProductPage)
+    async def default_products():
+        return {"items": PRODUCTS, "next_after_id": PAGE_SIZE}
+
+    @app.get("/fast/products", response_model=ProductPage)
+    async def fast_products():
+        return FastJSONResponse({"items": PRODUCTS, "next_after_id": PAGE_SIZE})
+
+    return app
+
+async def measure(client: httpx.AsyncClient, method: str, url: str, requests: int, payload=None) -> float:
+    """CPU microseconds per request"""
+    for _ in range(min(500, requests)):  # warm-up
+        await client.request(method, url, json=payload)
+    published.clear()
+    started = time.process_time()
+    for _ in range(requests):
+        response = await client.request(method, url, json=payload)
+    elapsed = time.process_time() - started
+    assert response.status_code < 300, response.text
+    published.clear()
+    return elapsed / requests * 1e6
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10000)
+    args = parser.parse_args()
+
+    app = build_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Both variants must produce the same document
+        for name, method, payload in (("orders", "POST", {"product_id": 1, "user_id": 2, "quantity": 3}),
+                                      ("products", "GET", None)):
+            default = await client.request(method, f"/default/{name}", json=payload)
+            fast = await client.request(method, f"/fast/{name}", json=payload)
+            assert default.json() == fast.json(), name
+
+        print(f"{'endpoint':<16}{'default us/req':>16}{'fast us/req':>14}{'saved':>9}")
+        for name, method, payload in (("POST /orders", "POST", {"product_id": 1, "user_id": 2, "quantity": 3}),
+                                      ("GET /products", "GET", None)):
+            path = name.split()[1]
+            default = await measure(client, method, f"/default{path}", args.requests, payload)
+            fast = await measure(client, method, f"/fast{path}", args.requests, payload)
+            print(f"{name:<16}{default:>16.1f}{fast:>14.1f}{(1 - fast / default):>9.0%}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
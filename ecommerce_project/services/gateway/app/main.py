@@ -1,20 +1,27 @@
 import os
 import asyncio
 import logging
+from collections import deque
 from fastapi import FastAPI, HTTPException, status, Security, Depends, Form
 from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from typing import Optional
-import json
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 
 from shared.rabbitmq import RabbitMQ
+from shared.database import Database
+from shared.responses import FastJSONResponse, dumps, with_fields
+from shared.idset import IdSet
+from shared.log_config import configure_logging, correlation_id_middleware
+from shared.startup import StartupOrchestrator
+from shared.diagnostics import LoopDiagnostics
+from shared.workers import run_workers
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging("gateway")
 logger = logging.getLogger(__name__)
 
 load_dotenv(override=True)
@@ -22,6 +29,59 @@ load_dotenv(override=True)
 # Setup RabbitMQ instance
 rabbitmq = RabbitMQ(queue_name="order_queue")
 
+diagnostics = LoopDiagnostics("gateway")
+startup = StartupOrchestrator("gateway")
+startup.add("rabbitmq", rabbitmq._ensure_connection)
+
+# Edge validation: reject orders for unknown products/users before they are queued
+ID_VALIDATION = os.getenv("GATEWAY_ID_VALIDATION", "true").lower() == "true"
+ID_REFRESH_INTERVAL = float(os.getenv("GATEWAY_ID_REFRESH_INTERVAL", 5))
+ID_FULL_RELOAD_INTERVAL = float(os.getenv("GATEWAY_ID_FULL_RELOAD_INTERVAL", 3600))
+
+db = Database(max_size=int(os.getenv("DB_POOL_MAX_SIZE", 4)))
+product_ids = IdSet(
+    db, "products",
+    refresh_interval=ID_REFRESH_INTERVAL, full_reload_interval=ID_FULL_RELOAD_INTERVAL
+)
+user_ids = IdSet(
+    db, "users", active_column="COALESCE(is_active, TRUE)",
+    refresh_interval=ID_REFRESH_INTERVAL, full_reload_interval=ID_FULL_RELOAD_INTERVAL
+)
+
+async def start_id_sets():
+    product_ids.start()
+    user_ids.start()
+
+startup.add("database", db._ensure_connection)
+if ID_VALIDATION:
+    # Not required: until the sets are loaded the gateway accepts orders unvalidated
+    startup.add("id_sets", start_id_sets, after=["database"], required=False)
+
+# Order ids come from the orders table's own sequence, so they are unique across
+# gateway workers and hosts and never collide with ids the order service assigns.
+# Each worker reserves a block at a time to keep the sequence off the request path.
+ORDER_ID_BLOCK = int(os.getenv("GATEWAY_ORDER_ID_BLOCK", 100))
+
+class OrderIdAllocator:
+    def __init__(self, db: Database, block: int):
+        self.db = db
+        self.block = block
+        self._ids = deque()
+        self._lock = asyncio.Lock()
+
+    async def next(self) -> int:
+        if not self._ids:
+            async with self._lock:
+                if not self._ids:
+                    rows = await self.db.execute_query(
+                        "SELECT nextval('orders_id_seq') AS id FROM generate_series(1, $1)",
+                        [self.block], fetch=True
+                    )
+                    self._ids.extend(row["id"] for row in rows)
+        return self._ids.popleft()
+
+order_ids = OrderIdAllocator(db, ORDER_ID_BLOCK)
+
 API_KEY_NAME = "X-API-KEY"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 
@@ -79,47 +139,33 @@ class OrderResponse(BaseModel):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup: connect in the background; /readyz reports when the broker is up
     logger.info("Starting gateway service initialization...")
-    
-    # Initialize RabbitMQ connection
-    app.state.rabbitmq_ready = asyncio.Event()
-    app.state.startup_task = asyncio.create_task(_initialize_rabbitmq(app))
-    
-    try:
-        await asyncio.wait_for(app.state.rabbitmq_ready.wait(), timeout=30.0)
-        logger.info("Gateway service initialization complete")
-    except asyncio.TimeoutError:
-        logger.error("RabbitMQ initialization timed out")
-        if hasattr(app.state, 'startup_task'):
-            app.state.startup_task.cancel()
-        raise
+    diagnostics.start()
+    await startup.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down gateway service...")
-    if hasattr(app.state, 'startup_task') and not app.state.startup_task.done():
-        app.state.startup_task.cancel()
+    await startup.stop()
+    diagnostics.stop()
+    await product_ids.stop()
+    await user_ids.stop()
     
     await rabbitmq.close()
+    await db.close()
     logger.info("Gateway service shutdown complete")
 
-async def _initialize_rabbitmq(app: FastAPI):
-    try:
-        await rabbitmq._ensure_connection()
-        app.state.rabbitmq_ready.set()
-    except Exception as e:
-        logger.error(f"Failed to initialize RabbitMQ: {str(e)}")
-        if not app.state.rabbitmq_ready.is_set():
-            app.state.rabbitmq_ready.set()  # Ensure we don't hang
-        raise
-
 app = FastAPI(
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
     title="Order Gateway Service",
     description="Handles order creation and routing to the order service"
 )
+app.middleware("http")(correlation_id_middleware)
+startup.install_routes(app)
+diagnostics.install_routes(app)
 
 @app.post("/token")
 async def get_token_from_api_key(api_key: str = Form(...)):
@@ -127,15 +173,33 @@ async def get_token_from_api_key(api_key: str = Form(...)):
     access_token = create_access_token(data={"sub": api_key})
     return {"access_token": access_token, "token_type": "bearer"}
 
+async def validate_order_ids(order_request: OrderCreateRequest):
+    """422 for ids known not to exist; fails open while the id sets are loading or the DB is down"""
+    for field, id_set, value in (
+        ("product_id", product_ids, order_request.product_id),
+        ("user_id", user_ids, order_request.user_id),
+    ):
+        try:
+            known = await id_set.contains(value)
+        except Exception as e:
+            logger.warning("Could not validate %s %s: %s", field, value, e)
+            continue
+        if known is False:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Unknown {field} {value}"
+            )
+
 @app.post("/orders", response_model=OrderResponse, status_code=status.HTTP_202_ACCEPTED)
 async def create_order(order_request: OrderCreateRequest, api_key: str = Depends(get_current_api_user)):
     """
     Create a new order by publishing to RabbitMQ.
     Requires valid JWT Bearer token.
     """
+    if ID_VALIDATION:
+        await validate_order_ids(order_request)
     try:
-        # Generate a unique order ID (in production, use a proper ID generator)
-        order_id = int(asyncio.get_running_loop().time() * 1000)
+        order_id = await order_ids.next()
         
         order_data = {
             "id": order_id,
@@ -145,14 +209,17 @@ async def create_order(order_request: OrderCreateRequest, api_key: str = Depends
             "status": "received"
         }
         
-        await rabbitmq.publish_message(json.dumps(order_data))
+        # Encoded once: the same bytes are the broker message and the start of the response
+        body = dumps(order_data)
+        await rabbitmq.publish_message(body)
         
-        return {
-            **order_data,
-            "message": "Order received and being processed"
-        }
+        # Built above from a validated request, so skip response_model validation
+        return FastJSONResponse(
+            with_fields(body, message="Order received and being processed"),
+            status_code=status.HTTP_202_ACCEPTED
+        )
     except Exception as e:
-        logger.error(f"Failed to create order: {str(e)}")
+        logger.error("Failed to create order: %s", e)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Unable to process order at this time"
@@ -175,15 +242,17 @@ async def health_check():
         }
     }
 
+@app.get("/validation/stats")
+async def validation_stats():
+    return {
+        "enabled": ID_VALIDATION,
+        "products": product_ids.stats(),
+        "users": user_ids.stats(),
+    }
+
 @app.get("/")
 async def root():
     return {"message": "Order Gateway Service"}
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", 5050)),
-        log_level="info"
-    )
\ No newline at end of file
+    run_workers("app.main:app", port=int(os.getenv("PORT", 5050)))
\ No newline at end of file
@@ -6,13 +6,7 @@ import json
 from fastapi import FastAPI, HTTPException, Depends, Request, status
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+from typing import Optional
 
 load_dotenv(override=True)
 
@@ -22,13 +16,107 @@ sys.path.append(shared_path)
 
 from shared.rabbitmq import RabbitMQ
 from shared.database import Database  # Updated to use async Database class
+from shared.log_config import configure_logging, correlation_context
+from shared.startup import StartupOrchestrator
+from shared.diagnostics import LoopDiagnostics
+from shared.responses import FastJSONResponse
+from shared.workers import run_workers, runs_consumers, is_primary_worker
+
+# Configure logging
+configure_logging("inventory")
+logger = logging.getLogger(__name__)
 
 # Initialize services
 rabbitmq = RabbitMQ(queue_name="inventory_queue")
+# Stock changes are broadcast to every subscriber (product service replicas)
+stock_events = RabbitMQ(queue_name="", exchange_name="stock_events")
 db = Database()
 
 API_TOKEN = os.getenv("API_TOKEN", "your-secret-token")
 
+# Deductions are appended to stock_movements instead of updating products.stock in place
+STOCK_LEDGER = os.getenv("STOCK_LEDGER", "true").lower() == "true"
+STOCK_COMPACTION_INTERVAL = float(os.getenv("STOCK_COMPACTION_INTERVAL", 60))
+COMPACTION_LOCK = "stock_ledger_compaction"
+
+# Current stock is the last snapshot in products plus the movements not folded into it yet;
+# the lateral aggregate is an index-only scan on stock_movements_product_idx
+PRODUCT_STOCK_VIEW = """
+CREATE OR REPLACE VIEW product_stock AS
+SELECT p.id, p.name, p.updated_at,
+       p.stock + COALESCE(pending.delta, 0) AS stock,
+       p.stock_version + pending.movements AS stock_version
+FROM products p
+CROSS JOIN LATERAL (
+    SELECT sum(m.delta) AS delta, count(*) AS movements
+    FROM stock_movements m
+    WHERE m.product_id = p.id AND m.id > p.stock_movement_id
+) pending
+"""
+
+SCHEMA_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS stock_version BIGINT NOT NULL DEFAULT 0",
+    # Last movement folded into products.stock
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS stock_movement_id BIGINT NOT NULL DEFAULT 0",
+    """
+    CREATE TABLE IF NOT EXISTS stock_movements (
+        id BIGSERIAL PRIMARY KEY,
+        product_id INT NOT NULL REFERENCES products (id),
+        delta INT NOT NULL,
+        order_id BIGINT,
+        reason VARCHAR(32) NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS stock_movements_product_idx ON stock_movements (product_id, id) INCLUDE (delta)",
+    # A redelivered deduction for the same order is a no-op
+    "CREATE UNIQUE INDEX IF NOT EXISTS stock_movements_order_key ON stock_movements (order_id) WHERE order_id IS NOT NULL",
+    """
+    CREATE TABLE IF NOT EXISTS stock_compactions (
+        id SERIAL PRIMARY KEY,
+        movement_id BIGINT NOT NULL,
+        products INT NOT NULL,
+        movements INT NOT NULL,
+        compacted_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    PRODUCT_STOCK_VIEW,
+]
+
+RECORD_MOVEMENT = """
+INSERT INTO stock_movements (product_id, delta, order_id, reason)
+SELECT $1, -$2::int, $3, 'order'
+WHERE EXISTS (SELECT 1 FROM products WHERE id = $1)
+ON CONFLICT (order_id) WHERE order_id IS NOT NULL DO NOTHING
+RETURNING id
+"""
+
+CURRENT_STOCK = "SELECT stock, stock_version FROM product_stock WHERE id = $1"
+
+# Folds movements in ($1, $2] into the snapshots and records the compaction
+COMPACT_MOVEMENTS = """
+WITH folded AS (
+    SELECT m.product_id, sum(m.delta) AS delta, count(*) AS movements
+    FROM stock_movements m JOIN products p ON p.id = m.product_id
+    WHERE m.id > $1 AND m.id <= $2 AND m.id > p.stock_movement_id
+    GROUP BY m.product_id
+), applied AS (
+    UPDATE products p
+    SET stock = p.stock + f.delta,
+        stock_version = p.stock_version + f.movements,
+        stock_movement_id = $2,
+        updated_at = NOW()
+    FROM folded f
+    WHERE p.id = f.product_id
+    RETURNING f.movements
+)
+INSERT INTO stock_compactions (movement_id, products, movements)
+SELECT $2, count(*), COALESCE(sum(movements), 0) FROM applied
+RETURNING products, movements
+"""
+
+compaction_task = None
+
 def verify_token(request: Request):
     auth = request.headers.get("Authorization")
     if not auth or auth != f"Bearer {API_TOKEN}":
@@ -37,57 +125,91 @@ def verify_token(request: Request):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Async context manager for FastAPI lifespan events"""
-    # Startup
+    # Startup: DB and broker connect in parallel in the background; the consumer
+    # starts once both are up and /readyz flips when everything is ready
     logger.info("Starting inventory service initialization...")
+    diagnostics.start()
+    await startup.start()
     
     try:
-        # Initialize database connection
-        logger.info("Connecting to database...")
-        await db._ensure_connection()
-        
-        # Connect to RabbitMQ and start consumer
-        logger.info("Initializing RabbitMQ...")
-        app.state.rabbitmq_ready = asyncio.Event()
-        app.state.startup_task = asyncio.create_task(_initialize_rabbitmq(app))
-        
-        # Wait for initialization to complete
-        await asyncio.wait_for(app.state.rabbitmq_ready.wait(), timeout=30.0)
-        logger.info("Inventory service initialization complete")
-        
         yield
-        
-    except asyncio.TimeoutError:
-        logger.error("Initialization timed out")
-        raise
-    except Exception as e:
-        logger.error(f"Startup failed: {str(e)}")
-        raise
     finally:
         # Shutdown
         logger.info("Shutting down inventory service...")
-        if hasattr(app.state, 'startup_task') and not app.state.startup_task.done():
-            app.state.startup_task.cancel()
+        await startup.stop()
+        diagnostics.stop()
+        if compaction_task is not None:
+            compaction_task.cancel()
+            await asyncio.gather(compaction_task, return_exceptions=True)
         
+        # In-flight updates still publish stock events, so drain before closing either
+        await rabbitmq.drain()
         await rabbitmq.close()
+        await stock_events.close()
         await db.close()
         logger.info("Inventory service shutdown complete")
 
-async def _initialize_rabbitmq(app: FastAPI):
-    """Initialize RabbitMQ connection and start consuming messages"""
+async def _start_consumer():
+    await rabbitmq.start_consuming(process_inventory_update)
+
+async def ensure_schema():
+    """Create the stock ledger and the product_stock view. Serialized by an advisory
+    lock so concurrently starting workers do not race on the DDL."""
+    async with db.get_connection() as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('stock_ledger_schema'))")
+            for statement in SCHEMA_DDL:
+                await conn.execute(statement)
+
+async def compact_stock_ledger() -> dict:
+    """
+    Fold committed movements into products.stock and record the last folded id.
+    Readers see the same stock before and after: the snapshot grows by exactly
+    what leaves the unfolded tail, in one transaction.
+    """
+    async with db.get_connection() as conn:
+        if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", COMPACTION_LOCK):
+            return {"skipped": "another instance holds the compaction lock"}
+        try:
+            async with conn.transaction():
+                # SHARE waits for in-flight inserts to commit and is released right after,
+                # so no movement at or below `upto` can appear once it is read
+                await conn.execute("LOCK TABLE stock_movements IN SHARE MODE")
+                upto = await conn.fetchval("SELECT COALESCE(max(id), 0) FROM stock_movements")
+            since = await conn.fetchval("SELECT COALESCE(max(movement_id), 0) FROM stock_compactions")
+            if upto <= since:
+                return {"movement_id": since, "products": 0, "movements": 0}
+            async with conn.transaction():
+                row = await conn.fetchrow(COMPACT_MOVEMENTS, since, upto)
+            return {"movement_id": upto, "products": row["products"], "movements": row["movements"]}
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", COMPACTION_LOCK)
+
+async def _compaction_loop():
+    while True:
+        await asyncio.sleep(STOCK_COMPACTION_INTERVAL)
+        try:
+            result = await compact_stock_ledger()
+            if result.get("movements"):
+                logger.info("Stock ledger compacted", extra={"compaction": result})
+        except Exception as e:
+            logger.error("Stock ledger compaction failed: %s", e, exc_info=True)
+
+async def _start_compaction():
+    global compaction_task
+    compaction_task = asyncio.create_task(_compaction_loop())
+
+async def publish_stock_change(product_id: int, stock: int, version: int):
+    """Broadcast a committed stock change. Failures are logged, not raised: the
+    update is already committed and redelivering the message would deduct twice."""
     try:
-        logger.info("Connecting to RabbitMQ...")
-        await rabbitmq._ensure_connection()
-        logger.info("RabbitMQ connection established. Starting consumer...")
-        
-        await rabbitmq.start_consuming(process_inventory_update)
-        logger.info("RabbitMQ consumer started successfully")
-        
-        app.state.rabbitmq_ready.set()
+        await stock_events.publish_message(json.dumps({
+            "product_id": product_id,
+            "stock": stock,
+            "version": version
+        }))
     except Exception as e:
-        logger.error(f"Failed to initialize RabbitMQ: {str(e)}", exc_info=True)
-        if not app.state.rabbitmq_ready.is_set():
-            app.state.rabbitmq_ready.set()
-        raise
+        logger.error("Failed to publish stock change for product %s: %s", product_id, e)
 
 async def process_inventory_update(message):
     """Process inventory update messages from RabbitMQ"""
@@ -95,29 +217,71 @@ async def process_inventory_update(message):
         try:
             # Parse message
             inventory_data = json.loads(message.body.decode())
-            logger.info(f"Processing inventory update: {inventory_data}")
+            logger.debug("Processing inventory update: %s", inventory_data)
             
             # Extract data
             product_id = inventory_data["product_id"]
             quantity = inventory_data["quantity"]
-            
-            # Update inventory
-            query = "UPDATE products SET stock = stock - $1 WHERE id = $2"
-            await db.execute_query(query, [quantity, product_id], fetch=False)
-            
-            logger.info(f"Inventory updated - Product: {product_id}, Quantity: {quantity}")
-            
         except json.JSONDecodeError as e:
-            logger.error(f"Invalid message format: {str(e)}")
+            logger.error("Invalid message format: %s", e)
             raise
         except KeyError as e:
-            logger.error(f"Missing required field in message: {str(e)}")
-            raise
-        except Exception as e:
-            logger.error(f"Error processing inventory update: {str(e)}", exc_info=True)
+            logger.error("Missing required field in message: %s", e)
             raise
 
-app = FastAPI(lifespan=lifespan)
+        order_id = inventory_data.get("order_id")
+        with correlation_context(order_id):
+            await apply_inventory_update(product_id, quantity, order_id)
+
+async def apply_inventory_update(product_id: int, quantity: int, order_id: Optional[int] = None):
+    """Deduct stock and broadcast the committed change"""
+    try:
+        if STOCK_LEDGER:
+            # An insert never waits on other deductions for the same product
+            rows = await db.execute_query(RECORD_MOVEMENT, [product_id, quantity, order_id], fetch=True)
+            if not rows:
+                found = await db.execute_query("SELECT 1 FROM products WHERE id = $1", [product_id], fetch=True)
+                if found:
+                    logger.info("Stock for order %s already deducted; skipping duplicate", order_id)
+                else:
+                    logger.error("Product with ID %s not found", product_id)
+                return
+        else:
+            query = """
+            UPDATE products
+            SET stock = stock - $1, stock_version = stock_version + 1, updated_at = NOW()
+            WHERE id = $2
+            RETURNING id
+            """
+            rows = await db.execute_query(query, [quantity, product_id], fetch=True)
+            if not rows:
+                logger.error("Product with ID %s not found", product_id)
+                return
+
+        # Read after commit: the version counts every movement visible now, so a later
+        # read never reports a lower version than an earlier one
+        rows = await db.execute_query(CURRENT_STOCK, [product_id], fetch=True)
+        logger.info("Inventory updated", extra={"product_id": product_id, "quantity": quantity})
+        await publish_stock_change(product_id, rows[0]["stock"], rows[0]["stock_version"])
+
+    except Exception as e:
+        logger.error("Error processing inventory update: %s", e, exc_info=True)
+        raise
+
+diagnostics = LoopDiagnostics("inventory")
+startup = StartupOrchestrator("inventory")
+startup.add("database", db._ensure_connection)
+startup.add("schema", ensure_schema, after=["database"])
+startup.add("rabbitmq", rabbitmq._ensure_connection)
+startup.add("stock_events", stock_events._ensure_connection)
+if runs_consumers():
+    startup.add("consumer", _start_consumer, after=["schema", "rabbitmq", "stock_events"])
+if STOCK_LEDGER and is_primary_worker():
+    startup.add("stock_compaction", _start_compaction, after=["schema"])
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+startup.install_routes(app)
+diagnostics.install_routes(app)
 
 @app.get("/status")
 async def status(dep=Depends(verify_token)):
@@ -130,6 +294,37 @@ async def status(dep=Depends(verify_token)):
         }
     }
 
+@app.get("/stock/{product_id}")
+async def get_stock(product_id: int, dep=Depends(verify_token)):
+    """Snapshot, the latest unfolded movements and current stock of one product"""
+    query = """
+    SELECT p.stock AS snapshot, p.stock_movement_id, s.stock, s.stock_version
+    FROM products p JOIN product_stock s ON s.id = p.id
+    WHERE p.id = $1
+    """
+    rows = await db.execute_query(query, [product_id], fetch=True)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Product not found")
+    movements = await db.execute_query(
+        """
+        SELECT id, delta, order_id, reason, created_at FROM stock_movements
+        WHERE product_id = $1 AND id > $2 ORDER BY id DESC LIMIT 100
+        """,
+        [product_id, rows[0]["stock_movement_id"]], fetch=True
+    )
+    return {
+        "product_id": product_id,
+        "stock": rows[0]["stock"],
+        "version": rows[0]["stock_version"],
+        "snapshot": {"stock": rows[0]["snapshot"], "movement_id": rows[0]["stock_movement_id"]},
+        "pending_movements": [dict(row) for row in movements],
+    }
+
+@app.post("/stock/compact")
+async def compact_stock(dep=Depends(verify_token)):
+    """Run a ledger compaction now"""
+    return await compact_stock_ledger()
+
 @app.get("/health")
 async def health_check(dep=Depends(verify_token)):
     """Health check endpoint"""
@@ -148,11 +343,4 @@ async def health_check(dep=Depends(verify_token)):
     return {"status": "healthy"}
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        "app:app",  # Assuming your file is named app.py
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", 5002)),
-        log_level="info",
-        reload=False  # Disable reload in production
-    )
\ No newline at end of file
+    run_workers("app.main:app", port=int(os.getenv("PORT", 5002)))
\ No newline at end of file
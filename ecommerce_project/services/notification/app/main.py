@@ -6,9 +6,6 @@ from fastapi import FastAPI, HTTPException, Depends, Request, status
 from dotenv import load_dotenv
 from contextlib import asynccontextmanager
 import json 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
 load_dotenv(override=True)
 
@@ -18,11 +15,29 @@ sys.path.append(shared_path)
 
 from shared.rabbitmq import RabbitMQ
 from shared.database import Database 
+from shared.log_config import configure_logging, correlation_context
+from shared.startup import StartupOrchestrator
+from shared.diagnostics import LoopDiagnostics
+from shared.responses import FastJSONResponse
+from shared.workers import run_workers, runs_consumers
+from shared.batching import MessageBatcher
+
+# Configure logging
+configure_logging("notification")
+logger = logging.getLogger(__name__)
 
 db=Database()
 
-# Setup RabbitMQ instance globally
-rabbitmq = RabbitMQ(queue_name="notification_queue")
+# Batching settings: messages are coalesced for up to the window or max batch
+NOTIFICATION_BATCHING = os.getenv("NOTIFICATION_BATCHING", "true").lower() == "true"
+NOTIFICATION_BATCH_WINDOW_MS = int(os.getenv("NOTIFICATION_BATCH_WINDOW_MS", 200))
+NOTIFICATION_MAX_BATCH = int(os.getenv("NOTIFICATION_MAX_BATCH", 100))
+
+# Setup RabbitMQ instance globally; prefetch must cover a full batch
+rabbitmq = RabbitMQ(
+    queue_name="notification_queue",
+    prefetch_count=max(10, NOTIFICATION_MAX_BATCH * 2) if NOTIFICATION_BATCHING else 10
+)
 
 API_TOKEN = os.getenv("API_TOKEN", "your-secret-token")
 
@@ -33,42 +48,27 @@ def verify_token(request: Request):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup: DB and broker connect in parallel; the consumer starts once both are up
     logger.info("Starting notification service initialization...")
-    
-    # Connect to RabbitMQ and start consumer
-    app.state.rabbitmq_ready = asyncio.Event()
-    app.state.startup_task = asyncio.create_task(_initialize_rabbitmq(app))
-    
-    try:
-        await asyncio.wait_for(app.state.rabbitmq_ready.wait(), timeout=30.0)
-        logger.info("Notification service initialization complete")
-    except asyncio.TimeoutError:
-        logger.error("RabbitMQ initialization timed out")
-        if hasattr(app.state, 'startup_task'):
-            app.state.startup_task.cancel()
-        raise
+    diagnostics.start()
+    await startup.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down notification service...")
-    if hasattr(app.state, 'startup_task') and not app.state.startup_task.done():
-        app.state.startup_task.cancel()
+    await startup.stop()
+    diagnostics.stop()
     
+    # Stop deliveries, let running handlers finish and settle buffered batches
+    await rabbitmq.drain(flush=batcher.close)
     await rabbitmq.close()
+    await db.close()
     logger.info("Notification service shutdown complete")
 
-async def _initialize_rabbitmq(app: FastAPI):
-    try:
-        await rabbitmq._ensure_connection()
-        await rabbitmq.start_consuming(process_notification_message)
-        app.state.rabbitmq_ready.set()
-    except Exception as e:
-        logger.error(f"Failed to initialize RabbitMQ: {str(e)}")
-        if not app.state.rabbitmq_ready.is_set():
-            app.state.rabbitmq_ready.set()
-        raise
+async def _start_consumer():
+    handler = batcher.add if NOTIFICATION_BATCHING else process_notification_message
+    await rabbitmq.start_consuming(handler)
 
 async def process_notification_message(message):
     """Process notification messages from RabbitMQ"""
@@ -76,7 +76,7 @@ async def process_notification_message(message):
         try:
             # Parse message
             notification_data = json.loads(message.body.decode())
-            logger.info(f"Processing notification: {notification_data}")
+            logger.debug("Processing notification: %s", notification_data)
             
             # Extract data
             user_id = notification_data["user_id"]
@@ -85,32 +85,112 @@ async def process_notification_message(message):
             
             # Look up user email
             query = "SELECT email FROM users WHERE id = $1"
-            result = await db.execute_query(query, [user_id], fetch=True)
+            result = await db.execute_query(query, [user_id], fetch=True, readonly=True, coalesce=True)
             if not result:
-                logger.error(f"User with ID {user_id} not found")
+                logger.error("User with ID %s not found", user_id)
                 return
             
             email = result[0]["email"]
             
             # Simulate sending email
-            logger.info(f"Sending email to {email}: Order {order_id} is {status}")
+            with correlation_context(order_id):
+                logger.info("Sending email", extra={"user_id": user_id, "order_id": order_id, "status": status})
             
         except json.JSONDecodeError as e:
-            logger.error(f"Invalid message format: {str(e)}")
+            logger.error("Invalid message format: %s", e)
             raise
         except KeyError as e:
-            logger.error(f"Missing required field in message: {str(e)}")
+            logger.error("Missing required field in message: %s", e)
             raise
         except Exception as e:
-            logger.error(f"Error processing notification: {str(e)}", exc_info=True)
+            logger.error("Error processing notification: %s", e, exc_info=True)
             raise
 
-app = FastAPI(lifespan=lifespan)
+def send_digest(email: str, notifications: list):
+    """Simulate sending one email covering all of a user's pending notifications"""
+    logger.info(
+        "Sending digest email",
+        extra={"order_ids": [n["order_id"] for n in notifications], "count": len(notifications)}
+    )
+
+def parse_notification(body: bytes) -> dict:
+    """Validate a notification message; user ids are looked up as an INT array"""
+    notification_data = json.loads(body.decode())
+    try:
+        notification = {
+            "user_id": notification_data["user_id"],
+            "order_id": notification_data["order_id"],
+            "status": notification_data["status"],
+        }
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed notification: {e!r}")
+    for field in ("user_id", "order_id"):
+        value = notification[field]
+        if type(value) is not int or not -2**31 <= value < 2**31:
+            raise ValueError(f"Invalid {field}: {value!r}")
+    if not isinstance(notification["status"], str):
+        raise ValueError(f"Invalid status: {notification['status']!r}")
+    return notification
+
+class NotificationBatcher(MessageBatcher):
+    """
+    Coalesces notification messages over a short window (see shared.batching).
+    Each flush resolves all emails with one query, sends one digest per user and
+    settles the whole batch with a single ack.
+    """
+
+    def __init__(self, window_ms: int, max_batch: int):
+        super().__init__(window_ms, max_batch)
+        self.emails = 0
+
+    def parse(self, message) -> dict:
+        return parse_notification(message.body)
+
+    async def process(self, batch: list):
+        by_user = {}
+        for notification in batch:
+            by_user.setdefault(notification["user_id"], []).append(notification)
+
+        query = "SELECT id, email FROM users WHERE id = ANY($1::int[])"
+        rows = await db.execute_query(query, [list(by_user)], fetch=True, readonly=True)
+        emails = {row["id"]: row["email"] for row in rows}
+
+        for user_id, notifications in by_user.items():
+            email = emails.get(user_id)
+            if email is None:
+                logger.error("User with ID %s not found", user_id)
+                continue
+            send_digest(email, notifications)
+            self.emails += 1
+
+    def stats(self):
+        return {**super().stats(), "emails": self.emails}
+
+batcher = NotificationBatcher(NOTIFICATION_BATCH_WINDOW_MS, NOTIFICATION_MAX_BATCH)
+
+diagnostics = LoopDiagnostics("notification")
+startup = StartupOrchestrator("notification")
+startup.add("database", db._ensure_connection)
+startup.add("rabbitmq", rabbitmq._ensure_connection)
+if runs_consumers():
+    startup.add("consumer", _start_consumer, after=["database", "rabbitmq"])
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+startup.install_routes(app)
+diagnostics.install_routes(app)
 
 @app.get("/status")
 def status(dep=Depends(verify_token)):
     return {"status": "Notification service is running"}
 
+@app.get("/batching/stats")
+async def batching_stats(dep=Depends(verify_token)):
+    return {"enabled": NOTIFICATION_BATCHING, **batcher.stats()}
+
+@app.get("/db/stats")
+async def db_stats(dep=Depends(verify_token)):
+    return db.stats()
+
 @app.get("/health")
 async def health_check(dep=Depends(verify_token)):
     if not rabbitmq._is_connected.is_set():
@@ -118,5 +198,4 @@ async def health_check(dep=Depends(verify_token)):
     return {"status": "healthy", "rabbitmq": "connected"}
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5003)
\ No newline at end of file
+    run_workers("app.main:app", port=int(os.getenv("PORT", 5003)))
\ No newline at end of file
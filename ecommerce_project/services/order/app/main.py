@@ -1,79 +1,236 @@
 import os
+import sys
 import asyncio
 import logging
 import json
-from fastapi import FastAPI, HTTPException, Depends, Request, status
+import time
+import argparse
+from datetime import date, datetime, timedelta, timezone
+from typing import Annotated, List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
 from dotenv import load_dotenv
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, Field, ValidationError
 from contextlib import asynccontextmanager
 from shared.rabbitmq import RabbitMQ
 from shared.database import Database
+from shared.redis import redis_util
+from shared.log_config import configure_logging, correlation_context
+from shared.startup import StartupOrchestrator
+from shared.diagnostics import LoopDiagnostics
+from shared.responses import FastJSONResponse
+from shared.workers import run_workers, runs_consumers, is_primary_worker
+from shared.partitions import MonthlyPartitionManager
+from shared.batching import MessageBatcher
 
 db=Database()
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging("order")
 logger = logging.getLogger(__name__)
 
 load_dotenv(override=True)
 
-# Initialize RabbitMQ connections globally
-order_rabbitmq = RabbitMQ(queue_name="order_queue")
+# Batching settings: orders are written in one multi-row UPSERT per window or max batch
+ORDER_BATCHING = os.getenv("ORDER_BATCHING", "true").lower() == "true"
+ORDER_BATCH_WINDOW_MS = int(os.getenv("ORDER_BATCH_WINDOW_MS", 20))
+ORDER_MAX_BATCH = int(os.getenv("ORDER_MAX_BATCH", 200))
+
+# Initialize RabbitMQ connections globally; the consumer's prefetch must cover a full batch
+order_rabbitmq = RabbitMQ(
+    queue_name="order_queue",
+    prefetch_count=max(10, ORDER_MAX_BATCH * 2) if ORDER_BATCHING else 10
+)
 inventory_rabbitmq = RabbitMQ(queue_name="inventory_queue")
 notification_rabbitmq = RabbitMQ(queue_name="notification_queue")
 
+# Sales rollups: order events are pre-aggregated in memory and flushed per product/hour
+# and user/day; the rollup queue is shared by every consumer worker
+SALES_ROLLUPS = os.getenv("SALES_ROLLUPS", "true").lower() == "true"
+ROLLUP_FLUSH_INTERVAL_MS = int(os.getenv("ROLLUP_FLUSH_INTERVAL_MS", 1000))
+ROLLUP_MAX_BATCH = int(os.getenv("ROLLUP_MAX_BATCH", 1000))
+MAX_ANALYTICS_DAYS = 366
+
+# Every processed order is broadcast on order_events for subscribers such as the rollups
+order_events = RabbitMQ(queue_name="", exchange_name="order_events")
+rollup_rabbitmq = RabbitMQ(
+    queue_name="sales_rollups",
+    exchange_name="order_events",
+    prefetch_count=ROLLUP_MAX_BATCH * 2
+)
+
 API_TOKEN = os.getenv("API_TOKEN", "your-secret-token")
 
+ORDER_CACHE_TTL = int(os.getenv("ORDER_CACHE_TTL", 3600))
+MAX_HISTORY_PAGE = 100
+
+# Monthly partitions of orders by created_at, archived to disk once past retention
+ORDER_PARTITIONING = os.getenv("ORDER_PARTITIONING", "true").lower() == "true"
+ORDER_PARTITIONS_AHEAD = int(os.getenv("ORDER_PARTITIONS_AHEAD", 3))
+ORDER_RETAIN_MONTHS = int(os.getenv("ORDER_RETAIN_MONTHS", 12))
+ORDER_ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", "/app/archive")
+ORDER_ARCHIVE_FORMAT = os.getenv("ORDER_ARCHIVE_FORMAT", "csv")
+ORDER_MAINTENANCE_INTERVAL = int(os.getenv("ORDER_MAINTENANCE_INTERVAL", 3600))
+
+# created_at is the partition key, so it is part of the primary key
+ORDERS_PARTITIONED_DDL = """
+CREATE SEQUENCE IF NOT EXISTS orders_id_seq;
+CREATE TABLE orders (
+    id INTEGER NOT NULL DEFAULT nextval('orders_id_seq'),
+    product_id INT NOT NULL,
+    user_id INT NOT NULL,
+    quantity INT NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    updated_at TIMESTAMP DEFAULT NOW(),
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE orders_id_seq OWNED BY orders.id;
+"""
+
+ORDER_UPSERT = """
+INSERT INTO orders (id, product_id, user_id, quantity, status)
+VALUES ($1, $2, $3, $4, $5)
+ON CONFLICT (id) DO UPDATE 
+SET product_id = EXCLUDED.product_id,
+    user_id = EXCLUDED.user_id,
+    quantity = EXCLUDED.quantity,
+    status = EXCLUDED.status,
+    updated_at = NOW()
+RETURNING id, product_id, user_id, quantity, status, updated_at
+"""
+
+# An update must land on the row's existing partition: reuse its created_at and
+# only take NOW() for a new order. Callers hold a per-order advisory lock.
+PARTITIONED_ORDER_UPSERT = """
+INSERT INTO orders (id, product_id, user_id, quantity, status, created_at)
+VALUES ($1, $2, $3, $4, $5, COALESCE((SELECT created_at FROM orders WHERE id = $1), NOW()))
+ON CONFLICT (id, created_at) DO UPDATE 
+SET product_id = EXCLUDED.product_id,
+    user_id = EXCLUDED.user_id,
+    quantity = EXCLUDED.quantity,
+    status = EXCLUDED.status,
+    updated_at = NOW()
+RETURNING id, product_id, user_id, quantity, status, updated_at
+"""
+
+# Batch forms of the UPSERTs above: one row per distinct order id, passed as arrays
+ORDER_BATCH_UPSERT = """
+INSERT INTO orders (id, product_id, user_id, quantity, status)
+SELECT * FROM unnest($1::int[], $2::int[], $3::int[], $4::int[], $5::varchar[])
+ON CONFLICT (id) DO UPDATE 
+SET product_id = EXCLUDED.product_id,
+    user_id = EXCLUDED.user_id,
+    quantity = EXCLUDED.quantity,
+    status = EXCLUDED.status,
+    updated_at = NOW()
+RETURNING id, product_id, user_id, quantity, status, updated_at
+"""
+
+PARTITIONED_ORDER_BATCH_UPSERT = """
+INSERT INTO orders (id, product_id, user_id, quantity, status, created_at)
+SELECT b.id, b.product_id, b.user_id, b.quantity, b.status, COALESCE(o.created_at, NOW())
+FROM unnest($1::int[], $2::int[], $3::int[], $4::int[], $5::varchar[])
+    AS b(id, product_id, user_id, quantity, status)
+LEFT JOIN orders o ON o.id = b.id
+ON CONFLICT (id, created_at) DO UPDATE 
+SET product_id = EXCLUDED.product_id,
+    user_id = EXCLUDED.user_id,
+    quantity = EXCLUDED.quantity,
+    status = EXCLUDED.status,
+    updated_at = NOW()
+RETURNING id, product_id, user_id, quantity, status, updated_at
+"""
+
+partitions = MonthlyPartitionManager(
+    db, "orders", "created_at",
+    months_ahead=ORDER_PARTITIONS_AHEAD,
+    retain_months=ORDER_RETAIN_MONTHS,
+    archive_dir=ORDER_ARCHIVE_DIR,
+    archive_format=ORDER_ARCHIVE_FORMAT,
+)
+orders_partitioned = False
+maintenance_task = None
+
+# Covering index for user history pages: keyset on (user_id, id) with the
+# remaining columns included so pages are served by index-only scans
+ORDER_INDEXES = {
+    "orders_user_id_id_covering_idx": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_user_id_id_covering_idx
+        ON orders (user_id, id DESC) INCLUDE (product_id, quantity, status, updated_at)
+    """,
+}
+
 def verify_token(request: Request):
     auth = request.headers.get("Authorization")
     if not auth or auth != f"Bearer {API_TOKEN}":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or missing API token")
 
+# Bounds of the orders columns (INT, VARCHAR(50)), so a value the table cannot hold
+# is rejected when the message is parsed rather than failing the batch it lands in
+PgInt = Annotated[int, Field(ge=-2**31, le=2**31 - 1)]
+
 class Order(BaseModel):
-    id: int
-    product_id: int
-    user_id: int
-    quantity: int
-    status: str
+    id: PgInt
+    product_id: PgInt
+    user_id: PgInt
+    quantity: PgInt
+    status: str = Field(max_length=50)
+
+class OrderRecord(Order):
+    updated_at: Optional[datetime] = None
+
+class OrderHistoryPage(BaseModel):
+    orders: List[OrderRecord]
+    next_before_id: Optional[int] = None
+
+def _order_cache_key(order_id: int) -> str:
+    return f"order:{order_id}"
+
+def _row_to_order(row) -> dict:
+    order = dict(row)
+    if order.get("updated_at"):
+        order["updated_at"] = order["updated_at"].isoformat()
+    return order
+
+def parse_order(order_data: str) -> Order:
+    """Parse and validate an order message body"""
+    # First try standard JSON parsing
+    try:
+        order_dict = json.loads(order_data)
+    except json.JSONDecodeError:
+        # Fallback for malformed JSON (single quotes)
+        try:
+            # Safely evaluate the string as Python literal
+            import ast
+            order_dict = ast.literal_eval(order_data)
+        except (ValueError, SyntaxError) as e:
+            logger.error("Failed to parse message: %s\nRaw message: %s", e, order_data)
+            raise
+        
+    # Validate the order data
+    return Order.model_validate(order_dict)
 
 async def process_order_message(message):
     async with message.process():
         try:
-            order_data = message.body.decode()
+            order = parse_order(message.body.decode())
             
-            # First try standard JSON parsing
-            try:
-                order_dict = json.loads(order_data)
-            except json.JSONDecodeError:
-                # Fallback for malformed JSON (single quotes)
-                try:
-                    # Safely evaluate the string as Python literal
-                    import ast
-                    order_dict = ast.literal_eval(order_data)
-                except (ValueError, SyntaxError) as e:
-                    logger.error(f"Failed to parse message: {e}\nRaw message: {order_data}")
-                    raise
+            with correlation_context(order.id):
+                # Process the order (database operations)
+                saved = await process_order_in_db(order)
                 
-            # Validate the order data
-            order = Order.model_validate(order_dict)
-            
-            # Process the order (database operations)
-            await process_order_in_db(order)
-            
-            # Publish to downstream queues
-            await publish_downstream_messages(order)
+                # Publish to downstream queues
+                await publish_downstream_messages(order, saved["updated_at"])
             
         except Exception as e:
-            logger.error(f"Failed to process order: {e}")
+            logger.error("Failed to process order: %s", e)
             raise  # This will cause the message to be requeued
 
-async def publish_downstream_messages(order: Order):
-    """Publish messages to inventory and notification queues"""
+async def publish_downstream_messages(order: Order, ordered_at: Optional[str] = None):
+    """Publish messages to inventory and notification queues and the order event"""
     # Inventory message
     inventory_msg = json.dumps({
+        "order_id": order.id,
         "product_id": order.product_id,
         "quantity": order.quantity,
         "operation": "deduct"
@@ -88,63 +245,506 @@ async def publish_downstream_messages(order: Order):
     })
     await notification_rabbitmq.publish_message(notification_msg)
 
+    # Order event; ordered_at is the saved row's updated_at. The rollups only take the
+    # order id from it and read the order row itself
+    order_event = json.dumps({
+        "order_id": order.id,
+        "product_id": order.product_id,
+        "user_id": order.user_id,
+        "quantity": order.quantity,
+        "status": order.status,
+        "ordered_at": ordered_at
+    })
+    await order_events.publish_message(order_event)
+
 
 async def process_order_in_db(order: Order):
     """Handle database operations for the order"""
     try:
         # UPSERT operation
-        query = """
-        INSERT INTO orders (id, product_id, user_id, quantity, status)
-        VALUES ($1, $2, $3, $4, $5)
-        ON CONFLICT (id) DO UPDATE 
-        SET product_id = EXCLUDED.product_id,
-            user_id = EXCLUDED.user_id,
-            quantity = EXCLUDED.quantity,
-            status = EXCLUDED.status,
-            updated_at = NOW()
-        """
         params = (order.id, order.product_id, order.user_id, order.quantity, order.status)
-        await db.execute_query(query, params)
+        if orders_partitioned:
+            # Two first deliveries of the same order would otherwise both see no row
+            # and insert with different created_at values
+            async with db.get_connection() as conn:
+                async with conn.transaction():
+                    await conn.execute("SELECT pg_advisory_xact_lock(hashtext('orders'), $1)", order.id)
+                    rows = await conn.fetch(PARTITIONED_ORDER_UPSERT, *params)
+        else:
+            rows = await db.execute_query(ORDER_UPSERT, params, fetch=True)
         
     except Exception as e:
-        logger.error(f"Database operation failed: {e}")
+        logger.error("Database operation failed: %s", e)
         raise
 
+    saved = _row_to_order(rows[0])
+    await cache_order(saved)
+    return saved
+
+async def persist_orders(orders: List[Order]) -> List[dict]:
+    """Write a batch of orders in one transaction; the last delivery of an id wins"""
+    # ON CONFLICT cannot touch the same row twice in one statement
+    latest = {order.id: order for order in orders}
+    ids = sorted(latest)
+    columns = [
+        ids,
+        [latest[i].product_id for i in ids],
+        [latest[i].user_id for i in ids],
+        [latest[i].quantity for i in ids],
+        [latest[i].status for i in ids],
+    ]
+    try:
+        async with db.get_connection() as conn:
+            async with conn.transaction():
+                if orders_partitioned:
+                    # Same per-order locks as the single-row path, taken in id order
+                    await conn.execute(
+                        "SELECT pg_advisory_xact_lock(hashtext('orders'), id) FROM unnest($1::int[]) AS id", ids
+                    )
+                    rows = await conn.fetch(PARTITIONED_ORDER_BATCH_UPSERT, *columns)
+                else:
+                    rows = await conn.fetch(ORDER_BATCH_UPSERT, *columns)
+    except Exception as e:
+        logger.error("Batch database operation failed: %s", e)
+        raise
+    return [_row_to_order(row) for row in rows]
+
+async def cache_orders(orders: List[dict]):
+    """Pipelined write-through for a batch; failures are logged like cache_order"""
+    try:
+        await asyncio.to_thread(
+            redis_util.set_many,
+            {_order_cache_key(order["id"]): json.dumps(order) for order in orders},
+            ORDER_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning("Failed to cache %d orders: %s", len(orders), e)
+
+class OrderBatcher(MessageBatcher):
+    """
+    Coalesces order deliveries over a short window (see shared.batching).
+    Each flush writes the whole batch with one multi-row UPSERT in a single
+    transaction, publishes every downstream message concurrently and settles the
+    batch with a single ack.
+    """
+
+    # Messages failing parse() with one of these are rejected without requeue
+    parse_errors = (ValueError, SyntaxError, ValidationError)
+
+    def parse(self, message) -> Order:
+        return parse_order(message.body.decode())
+
+    async def process(self, orders: List[Order]):
+        saved = await persist_orders(orders)
+        await cache_orders(saved)
+        ordered_at = {order["id"]: order["updated_at"] for order in saved}
+        await asyncio.gather(
+            *(publish_downstream_messages(order, ordered_at.get(order.id)) for order in orders)
+        )
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "orders": self.messages,
+            "rejected": self.rejected,
+            "pending": len(self._pending),
+        }
+
+order_batcher = OrderBatcher(ORDER_BATCH_WINDOW_MS, ORDER_MAX_BATCH)
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales_product_hourly (
+    product_id INT NOT NULL,
+    hour TIMESTAMP NOT NULL,
+    orders INT NOT NULL,
+    units BIGINT NOT NULL,
+    PRIMARY KEY (product_id, hour)
+);
+CREATE TABLE IF NOT EXISTS sales_user_daily (
+    user_id INT NOT NULL,
+    day DATE NOT NULL,
+    orders INT NOT NULL,
+    units BIGINT NOT NULL,
+    PRIMARY KEY (user_id, day)
+);
+-- What each order currently contributes to the rollups (NULL product_id: nothing yet),
+-- so a later event or a backfill only applies the difference to its current state
+CREATE TABLE IF NOT EXISTS sales_rollup_orders (
+    order_id BIGINT PRIMARY KEY,
+    product_id INT,
+    user_id INT,
+    ordered_at TIMESTAMP,
+    orders INT,
+    units BIGINT,
+    rolled_up_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS sales_rollup_orders_ordered_at_idx ON sales_rollup_orders (ordered_at);
+"""
+
+# Rollups count every order in its current state, bucketed by when it was created:
+# a quantity change moves units, a cancelled order counts for nothing, and neither
+# moves the order to another hour or day. Live events and backfills both go through
+# refresh_rollups() below, so they always agree.
+ROLLUP_CANCELLED_STATUS = "cancelled"
+
+# Creation time of an order. Rows from a migrated legacy table have created_at =
+# '-infinity', and a table that was never partitioned has no created_at at all; for
+# those updated_at is the best there is. Set by ensure_rollup_schema().
+rollup_ordered_at = "o.updated_at"
+
+# Placeholders for orders seen for the first time, then a lock on every order's
+# state row: concurrent refreshes of the same order (a live flush and a backfill
+# chunk, two consumer workers) take turns, in id order
+TRACK_ROLLUP_ORDERS = """
+INSERT INTO sales_rollup_orders (order_id)
+SELECT id FROM ({ids}) AS ids(id) ORDER BY id
+ON CONFLICT DO NOTHING
+"""
+
+LOCK_ROLLUP_ORDERS = """
+SELECT order_id FROM sales_rollup_orders
+WHERE order_id IN (SELECT id FROM ({ids}) AS ids(id))
+ORDER BY order_id
+FOR UPDATE
+"""
+
+# Runs after the locks are held, so it reads orders rows at least as new as the
+# ones any earlier refresh of the same orders saw. Applies, per changed order, its
+# new contribution minus the one it had, grouped and upserted in key order.
+REFRESH_ROLLUPS = """
+WITH latest AS (
+    SELECT s.order_id,
+           s.product_id AS old_product_id, s.user_id AS old_user_id, s.ordered_at AS old_ordered_at,
+           s.orders AS old_orders, s.units AS old_units,
+           o.product_id, o.user_id, {ordered_at} AS ordered_at,
+           CASE WHEN o.status = $2 THEN 0 ELSE 1 END AS orders,
+           CASE WHEN o.status = $2 THEN 0 ELSE o.quantity END AS units
+    FROM sales_rollup_orders s JOIN orders o ON o.id = s.order_id
+    WHERE s.order_id = ANY($1::bigint[]) AND {ordered_at} IS NOT NULL
+), changed AS (
+    SELECT * FROM latest
+    WHERE (old_product_id, old_user_id, old_ordered_at, old_orders, old_units)
+          IS DISTINCT FROM (product_id, user_id, ordered_at, orders, units)
+), saved AS (
+    UPDATE sales_rollup_orders s
+    SET product_id = c.product_id, user_id = c.user_id, ordered_at = c.ordered_at,
+        orders = c.orders, units = c.units, rolled_up_at = NOW()
+    FROM changed c WHERE s.order_id = c.order_id
+), deltas AS (
+    SELECT product_id, user_id, ordered_at, orders, units FROM changed
+    UNION ALL
+    SELECT old_product_id, old_user_id, old_ordered_at, -old_orders, -old_units
+    FROM changed WHERE old_product_id IS NOT NULL
+), by_product AS (
+    INSERT INTO sales_product_hourly AS r (product_id, hour, orders, units)
+    SELECT product_id, date_trunc('hour', ordered_at), sum(orders), sum(units)
+    FROM deltas GROUP BY 1, 2 ORDER BY 1, 2
+    ON CONFLICT (product_id, hour) DO UPDATE
+    SET orders = r.orders + EXCLUDED.orders, units = r.units + EXCLUDED.units
+), by_user AS (
+    INSERT INTO sales_user_daily AS r (user_id, day, orders, units)
+    SELECT user_id, ordered_at::date, sum(orders), sum(units)
+    FROM deltas GROUP BY 1, 2 ORDER BY 1, 2
+    ON CONFLICT (user_id, day) DO UPDATE
+    SET orders = r.orders + EXCLUDED.orders, units = r.units + EXCLUDED.units
+)
+SELECT count(*) AS changed FROM changed
+"""
+
+# Order id sources for the statements above: a batch of event ids, or a backfill id range
+EVENT_IDS = "SELECT unnest($1::bigint[])"
+RANGE_IDS = "SELECT id FROM orders WHERE id >= $1 AND id < $2"
+
+rollup_prune_task = None
+
+async def ensure_rollup_schema():
+    global rollup_ordered_at
+    async with db.get_connection() as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('sales_rollup_schema'))")
+            await conn.execute(ROLLUP_SCHEMA)
+        has_created_at = await conn.fetchval(
+            """
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'orders' AND column_name = 'created_at'
+            )
+            """
+        )
+    rollup_ordered_at = (
+        "CASE WHEN o.created_at = '-infinity' THEN o.updated_at ELSE o.created_at END"
+        if has_created_at else "o.updated_at"
+    )
+
+async def refresh_rollups(conn, ids_sql: str, args: list) -> int:
+    """
+    Bring the rollups up to date with the current orders rows for the ids `ids_sql`
+    selects, in the caller's transaction. Returns how many orders changed.
+    """
+    await conn.execute(TRACK_ROLLUP_ORDERS.format(ids=ids_sql), *args)
+    locked = [row["order_id"] for row in await conn.fetch(LOCK_ROLLUP_ORDERS.format(ids=ids_sql), *args)]
+    if not locked:
+        return 0
+    return await conn.fetchval(
+        REFRESH_ROLLUPS.format(ordered_at=rollup_ordered_at), locked, ROLLUP_CANCELLED_STATUS
+    )
+
+def parse_order_event(message) -> int:
+    """Order id of an order_events message; the rollups read the order itself"""
+    event = json.loads(message.body.decode())
+    try:
+        order_id = int(event["order_id"])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed order event: {e!r}")
+    if not -2**31 <= order_id < 2**31:
+        raise ValueError(f"Order id out of range: {order_id}")
+    return order_id
+
+async def apply_rollups(order_ids: List[int]) -> int:
+    """
+    Refresh the rollups for the orders a batch of events is about, in one
+    transaction. Redelivered or out-of-order events find nothing to change.
+    Returns how many orders changed.
+    """
+    async with db.get_connection() as conn:
+        async with conn.transaction():
+            return await refresh_rollups(conn, EVENT_IDS, [sorted(set(order_ids))])
+
+class SalesRollupBatcher(MessageBatcher):
+    """
+    Buffers order events for ROLLUP_FLUSH_INTERVAL_MS or ROLLUP_MAX_BATCH events
+    and refreshes the rollups for their orders with one set of statements per
+    batch. Settling works as in shared.batching.
+    """
+
+    parse_errors = (ValueError, UnicodeDecodeError)
+
+    def __init__(self, window_ms: int, max_batch: int):
+        super().__init__(window_ms, max_batch)
+        self.counted = 0
+
+    def parse(self, message) -> int:
+        return parse_order_event(message)
+
+    async def process(self, order_ids: List[int]):
+        self.counted += await apply_rollups(order_ids)
+
+    def stats(self):
+        return {**super().stats(), "counted": self.counted}
+
+rollup_batcher = SalesRollupBatcher(ROLLUP_FLUSH_INTERVAL_MS, ROLLUP_MAX_BATCH)
+
+async def backfill_rollups(rebuild: bool = False, workers: int = 4, chunks: int = 64) -> dict:
+    """
+    Bring the rollups up to date with every order still in `orders`, split into
+    `chunks` id ranges run `workers` at a time, each in its own transaction.
+    Orders already counted in their current state are left alone, so this can run
+    next to the live consumer and be re-run after a failure. rebuild=True empties
+    the rollups first.
+    """
+    await ensure_rollup_schema()
+    if rebuild:
+        await db.execute_query("TRUNCATE sales_product_hourly, sales_user_daily, sales_rollup_orders")
+    bounds = (await db.execute_query("SELECT min(id) AS lo, max(id) AS hi FROM orders", fetch=True))[0]
+    if bounds["lo"] is None:
+        return {"chunks": 0, "orders": 0, "seconds": 0.0}
+
+    lo, hi = bounds["lo"], bounds["hi"] + 1
+    step = max(1, -(-(hi - lo) // chunks))
+    ranges = [(start, min(start + step, hi)) for start in range(lo, hi, step)]
+    limit = asyncio.Semaphore(max(1, min(workers, db.max_size)))
+
+    async def run_chunk(start: int, end: int) -> int:
+        async with limit:
+            async with db.get_connection() as conn:
+                async with conn.transaction():
+                    return await refresh_rollups(conn, RANGE_IDS, [start, end])
+
+    started = time.perf_counter()
+    counted = await asyncio.gather(*(run_chunk(start, end) for start, end in ranges))
+    result = {"chunks": len(ranges), "orders": sum(counted), "seconds": round(time.perf_counter() - started, 3)}
+    logger.info("Sales rollup backfill finished", extra={"backfill": result})
+    return result
+
+async def _rollup_prune_loop():
+    """
+    Forget the state of orders older than ORDER_RETAIN_MONTHS: their partitions
+    have been archived out of `orders`, so nothing refreshes them any more
+    """
+    while True:
+        try:
+            await db.execute_query(
+                """
+                DELETE FROM sales_rollup_orders
+                WHERE ordered_at < NOW() - make_interval(months => $1)
+                   OR (product_id IS NULL AND rolled_up_at < NOW() - INTERVAL '1 day')
+                """,
+                [ORDER_RETAIN_MONTHS]
+            )
+        except Exception as e:
+            logger.error("Pruning sales_rollup_orders failed: %s", e, exc_info=True)
+        await asyncio.sleep(3600)
+
+async def _start_rollup_prune():
+    global rollup_prune_task
+    if not orders_partitioned:
+        # Unpartitioned orders are never archived, so every order may still change
+        return
+    rollup_prune_task = asyncio.create_task(_rollup_prune_loop())
+
+async def cache_order(order: dict):
+    """Write-through of the latest order state. Postgres stays the source of truth,
+    so a Redis failure is logged rather than failing the order."""
+    try:
+        await asyncio.to_thread(
+            redis_util.set_key, _order_cache_key(order["id"]), json.dumps(order), ORDER_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning("Failed to cache order %s: %s", order["id"], e)
+
+async def fill_order_cache(order: dict):
+    """
+    Cache an order read on a miss. The read may come from a lagging replica, so the
+    entry is only added when the key is absent: a write-through of a newer state,
+    before or after this read, is never overwritten with the older row.
+    """
+    try:
+        await asyncio.to_thread(
+            redis_util.add_key, _order_cache_key(order["id"]), json.dumps(order), ORDER_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning("Failed to cache order %s: %s", order["id"], e)
+
+async def ensure_partitioning():
+    """
+    Create the partitioned orders table (or detect a legacy unpartitioned one).
+    ORDER_PARTITIONING=false only stops a missing table from being created
+    partitioned: the statements must match the table that exists, and an already
+    partitioned table still needs its upcoming partitions.
+    """
+    global orders_partitioned
+    if not ORDER_PARTITIONING:
+        if not await partitions.is_partitioned():
+            return
+        logger.warning("ORDER_PARTITIONING is false but orders is already partitioned; managing its partitions")
+    orders_partitioned = await partitions.setup(ORDERS_PARTITIONED_DDL)
+    if not orders_partitioned:
+        logger.warning("orders is not partitioned; run `python -m app.main migrate-partitions` to convert it")
+
+async def _partition_maintenance_loop():
+    while True:
+        try:
+            result = await partitions.run_maintenance()
+            logger.info("Order partition maintenance finished", extra={"maintenance": result})
+        except Exception as e:
+            logger.error("Order partition maintenance failed: %s", e, exc_info=True)
+        await asyncio.sleep(ORDER_MAINTENANCE_INTERVAL)
+
+async def _start_partition_maintenance():
+    global maintenance_task
+    if orders_partitioned:
+        maintenance_task = asyncio.create_task(_partition_maintenance_loop())
+
+def _index_ddl(statement: str) -> str:
+    # Indexes on a partitioned table cannot be built CONCURRENTLY; new partitions
+    # are small and inherit the index when they are created
+    return statement.replace(" CONCURRENTLY", "") if orders_partitioned else statement
+
+async def ensure_indexes():
+    """Create the order lookup indexes and verify they are valid.
+    A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which
+    IF NOT EXISTS would skip, so invalid indexes are dropped and rebuilt."""
+    query = """
+    SELECT c.relname AS name, i.indisvalid AS valid
+    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = ANY($1::text[])
+    """
+    names = list(ORDER_INDEXES)
+    for attempt in range(2):
+        rows = await db.execute_query(query, [names], fetch=True)
+        state = {row["name"]: row["valid"] for row in rows}
+        pending = [name for name in names if not state.get(name)]
+        if not pending:
+            logger.info("Order indexes verified: %s", ", ".join(names))
+            return
+        for name in pending:
+            if name in state:
+                logger.warning("Index %s is invalid; rebuilding", name)
+                await db.execute_query(_index_ddl(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            logger.info("Creating index %s...", name)
+            await db.execute_query(_index_ddl(ORDER_INDEXES[name]))
+    raise RuntimeError(f"Order indexes could not be created: {', '.join(pending)}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup: DB and all broker connections come up in parallel in the background
     logger.info("Initializing order service...")
+    diagnostics.start()
+    await startup.start()
     
     try:
-        # Initialize all RabbitMQ connections
-        logger.info("Connecting to RabbitMQ...")
-        await asyncio.gather(
-            order_rabbitmq._ensure_connection(),
-            inventory_rabbitmq._ensure_connection(),
-            notification_rabbitmq._ensure_connection()
-        )
-        
-        # Start consuming messages
-        logger.info("Starting order queue consumer...")
-        await order_rabbitmq.start_consuming(process_order_message)
-        
-        logger.info("Order service ready")
         yield
-        
-    except Exception as e:
-        logger.error(f"Startup failed: {e}", exc_info=True)
-        raise
     finally:
         # Shutdown
         logger.info("Shutting down...")
+        await startup.stop()
+        diagnostics.stop()
+        for task in (maintenance_task, rollup_prune_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        # Handlers publish to the other queues, so drain the consumers before closing them
+        await asyncio.gather(
+            order_rabbitmq.drain(flush=order_batcher.close),
+            rollup_rabbitmq.drain(flush=rollup_batcher.close)
+        )
         await asyncio.gather(
             order_rabbitmq.close(),
             inventory_rabbitmq.close(),
-            notification_rabbitmq.close()
+            notification_rabbitmq.close(),
+            order_events.close(),
+            rollup_rabbitmq.close()
         )
+        await db.close()
         logger.info("Shutdown complete")
 
-app = FastAPI(lifespan=lifespan)
+async def _start_consumer():
+    handler = order_batcher.add if ORDER_BATCHING else process_order_message
+    await order_rabbitmq.start_consuming(handler)
+
+async def _start_rollup_consumer():
+    await rollup_rabbitmq.start_consuming(rollup_batcher.add)
+
+diagnostics = LoopDiagnostics("order")
+startup = StartupOrchestrator("order")
+startup.add("database", db._ensure_connection)
+startup.add("partitions", ensure_partitioning, after=["database"])
+# Building indexes on a large table can take a while; it must not hold back readiness.
+# Only one worker per instance runs the DDL so concurrent builds do not collide.
+if is_primary_worker():
+    startup.add("indexes", ensure_indexes, after=["partitions"], required=False)
+    startup.add("partition_maintenance", _start_partition_maintenance, after=["partitions"], required=False)
+startup.add("order_queue", order_rabbitmq._ensure_connection)
+startup.add("inventory_queue", inventory_rabbitmq._ensure_connection)
+startup.add("notification_queue", notification_rabbitmq._ensure_connection)
+startup.add("order_events", order_events._ensure_connection)
+if runs_consumers():
+    startup.add(
+        "consumer",
+        _start_consumer,
+        after=["partitions", "order_queue", "inventory_queue", "notification_queue", "order_events"]
+    )
+if SALES_ROLLUPS:
+    startup.add("rollup_schema", ensure_rollup_schema, after=["partitions"])
+    if is_primary_worker():
+        startup.add("rollup_prune", _start_rollup_prune, after=["rollup_schema"], required=False)
+    if runs_consumers():
+        startup.add("rollup_queue", rollup_rabbitmq._ensure_connection)
+        startup.add("rollup_consumer", _start_rollup_consumer, after=["rollup_schema", "rollup_queue"])
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+startup.install_routes(app)
+diagnostics.install_routes(app)
 
 @app.post("/orders")
 async def create_order(order: Order, dep=Depends(verify_token)):
@@ -154,16 +754,152 @@ async def create_order(order: Order, dep=Depends(verify_token)):
         await order_rabbitmq.publish_message(order.model_dump_json())
         return {"message": "Order received for processing", "order_id": order.id}
     except Exception as e:
-        logger.error(f"Failed to queue order: {e}")
+        logger.error("Failed to queue order: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-# ... (other endpoints remain the same, add dep=Depends(verify_token) as needed) ...
+@app.get("/orders/{order_id}", response_model=OrderRecord)
+async def get_order(order_id: int, dep=Depends(verify_token)):
+    """Order status, served from the Redis write-through entry when present"""
+    try:
+        cached = await asyncio.to_thread(redis_util.get_key, _order_cache_key(order_id))
+    except Exception as e:
+        logger.warning("Order cache read failed: %s", e)
+        cached = None
+    if cached:
+        # The cache entry is the response body already
+        return FastJSONResponse(cached.encode())
+
+    query = "SELECT id, product_id, user_id, quantity, status, updated_at FROM orders WHERE id = $1"
+    rows = await db.execute_query(query, [order_id], fetch=True, readonly=True, coalesce=True)
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    order = _row_to_order(rows[0])
+    await fill_order_cache(order)
+    return FastJSONResponse(order)
+
+@app.get("/users/{user_id}/orders", response_model=OrderHistoryPage)
+async def get_user_orders(
+    user_id: int,
+    before_id: Optional[int] = Query(None, description="Cursor: return orders with id lower than this"),
+    limit: int = Query(20, ge=1, le=MAX_HISTORY_PAGE),
+    dep=Depends(verify_token)
+):
+    """A user's orders, newest first, with keyset pagination on (user_id, id)"""
+    if before_id is None:
+        query = """
+        SELECT id, product_id, user_id, quantity, status, updated_at FROM orders
+        WHERE user_id = $1
+        ORDER BY id DESC LIMIT $2
+        """
+        params = [user_id, limit]
+    else:
+        query = """
+        SELECT id, product_id, user_id, quantity, status, updated_at FROM orders
+        WHERE user_id = $1 AND id < $2
+        ORDER BY id DESC LIMIT $3
+        """
+        params = [user_id, before_id, limit]
+    rows = await db.execute_query(query, params, fetch=True, readonly=True)
+    orders = [_row_to_order(row) for row in rows]
+    next_before_id = orders[-1]["id"] if len(orders) == limit else None
+    return FastJSONResponse({"orders": orders, "next_before_id": next_before_id})
+
+@app.get("/batching/stats")
+async def batching_stats(dep=Depends(verify_token)):
+    return {"enabled": ORDER_BATCHING, **order_batcher.stats()}
+
+@app.get("/db/stats")
+async def db_stats(dep=Depends(verify_token)):
+    return db.stats()
+
+def _naive(value: datetime) -> datetime:
+    # Rollup timestamps are stored without a time zone, like orders.updated_at
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+@app.get("/analytics/products/{product_id}/hourly")
+async def product_sales_hourly(
+    product_id: int,
+    start: Optional[datetime] = Query(None, description="Inclusive; default 24 hours before end"),
+    end: Optional[datetime] = Query(None, description="Exclusive; default now"),
+    dep=Depends(verify_token)
+):
+    """Orders and units sold per hour for one product, read from the rollup"""
+    end = _naive(end) if end else datetime.now()
+    start = _naive(start) if start else end - timedelta(hours=24)
+    if not timedelta(0) < end - start <= timedelta(days=MAX_ANALYTICS_DAYS):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid time range")
+    query = """
+    SELECT hour, orders, units FROM sales_product_hourly
+    WHERE product_id = $1 AND hour >= $2 AND hour < $3
+    ORDER BY hour
+    """
+    rows = await db.execute_query(query, [product_id, start, end], fetch=True, readonly=True)
+    return FastJSONResponse({
+        "product_id": product_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "orders": sum(row["orders"] for row in rows),
+        "units": sum(row["units"] for row in rows),
+        "hours": [{"hour": row["hour"].isoformat(), "orders": row["orders"], "units": row["units"]} for row in rows],
+    })
+
+@app.get("/analytics/users/{user_id}/daily")
+async def user_orders_daily(
+    user_id: int,
+    start: Optional[date] = Query(None, description="Inclusive; default 30 days before end"),
+    end: Optional[date] = Query(None, description="Inclusive; default today"),
+    dep=Depends(verify_token)
+):
+    """Orders and units per day for one user, read from the rollup"""
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if not timedelta(0) <= end - start < timedelta(days=MAX_ANALYTICS_DAYS):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date range")
+    query = """
+    SELECT day, orders, units FROM sales_user_daily
+    WHERE user_id = $1 AND day BETWEEN $2 AND $3
+    ORDER BY day
+    """
+    rows = await db.execute_query(query, [user_id, start, end], fetch=True, readonly=True)
+    return FastJSONResponse({
+        "user_id": user_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "orders": sum(row["orders"] for row in rows),
+        "units": sum(row["units"] for row in rows),
+        "days": [{"day": row["day"].isoformat(), "orders": row["orders"], "units": row["units"]} for row in rows],
+    })
+
+@app.get("/analytics/rollups/stats")
+async def rollup_stats(dep=Depends(verify_token)):
+    return {"enabled": SALES_ROLLUPS, **rollup_batcher.stats()}
+
+async def migrate_partitions():
+    """One-off conversion of an existing unpartitioned orders table"""
+    try:
+        if await partitions.is_partitioned():
+            logger.info("orders is already partitioned")
+            return
+        await partitions.migrate_legacy(ORDERS_PARTITIONED_DDL, ["orders_pkey", *ORDER_INDEXES])
+    finally:
+        await db.close()
+
+async def run_backfill(argv: List[str]):
+    """python -m app.main backfill-rollups [--rebuild] [--workers N] [--chunks N]"""
+    parser = argparse.ArgumentParser(prog="backfill-rollups", description=backfill_rollups.__doc__)
+    parser.add_argument("--rebuild", action="store_true", help="Empty the rollups and recount every order")
+    parser.add_argument("--workers", type=int, default=4, help="Chunks rolled up concurrently")
+    parser.add_argument("--chunks", type=int, default=64, help="Id ranges the orders are split into")
+    args = parser.parse_args(argv)
+    try:
+        await backfill_rollups(args.rebuild, args.workers, args.chunks)
+    finally:
+        await db.close()
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(
-        "app:app",
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", 5001)),
-        reload=False  # Disable reload in production
-    )
\ No newline at end of file
+    if sys.argv[1:] == ["migrate-partitions"]:
+        asyncio.run(migrate_partitions())
+    elif sys.argv[1:2] == ["backfill-rollups"]:
+        asyncio.run(run_backfill(sys.argv[2:]))
+    else:
+        run_workers("app.main:app", port=int(os.getenv("PORT", 5001)))
\ No newline at end of file
@@ -1,8 +1,16 @@
 # Main application file for product service
 import sys
 import os
-from fastapi import FastAPI
+import asyncio
+import logging
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 
 # Load environment variables
 load_dotenv(override=True)
@@ -12,13 +20,352 @@ shared_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../sha
 sys.path.append(shared_path)
 
 from shared.rabbitmq import RabbitMQ
+from shared.database import Database
+from shared.redis import redis_util
+from shared.cache import LRUCache, TieredCache
+from shared.log_config import configure_logging
+from shared.startup import StartupOrchestrator
+from shared.diagnostics import LoopDiagnostics
+from shared.responses import FastJSONResponse
+from shared.workers import run_workers, is_primary_worker
 
-app = FastAPI()
+# Configure logging
+configure_logging("product")
+logger = logging.getLogger(__name__)
+
+# Initialize services
+db = Database()
+# Stock changes are broadcast so every replica can invalidate its local cache
+stock_events = RabbitMQ(queue_name="", exchange_name="stock_events")
+
+product_cache = TieredCache(
+    redis_util,
+    prefix="product",
+    local=LRUCache(
+        maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", 50000)),
+        ttl=float(os.getenv("PRODUCT_CACHE_TTL", 30)),
+    ),
+    redis_ttl=int(os.getenv("PRODUCT_REDIS_TTL", 300)),
+)
+# Pages hold only product ids, so stock changes never invalidate them
+page_cache = TieredCache(
+    redis_util,
+    prefix="product_page",
+    local=LRUCache(maxsize=1000, ttl=5),
+    redis_ttl=30,
+)
+
+MAX_PAGE_SIZE = 100
+MAX_MULTI_GET = 200
+STOCK_VIEW_PRELOAD = os.getenv("STOCK_VIEW_PRELOAD", "true").lower() == "true"
+STOCK_PRELOAD_BATCH = 10000
+SSE_QUEUE_SIZE = 1000
+SSE_KEEPALIVE_SECONDS = 15
+
+class Product(BaseModel):
+    id: int
+    name: str
+    stock: int
+    updated_at: Optional[datetime] = None
+
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_after_id: Optional[int] = None
+
+def _row_to_product(row) -> dict:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "stock": row["stock"],
+        "updated_at": row["updated_at"].isoformat() if row["updated_at"] else None,
+    }
+
+async def get_products(product_ids: List[int]) -> List[dict]:
+    """Resolve products through LRU -> Redis -> one batched Postgres query"""
+    product_ids = list(dict.fromkeys(product_ids))
+    found = await product_cache.get_many(product_ids)
+
+    missing = [pid for pid in product_ids if pid not in found]
+    if missing:
+        query = """
+        SELECT id, name, stock, stock_version, updated_at FROM product_stock WHERE id = ANY($1::int[])
+        """
+        rows = await db.execute_query(query, [missing], fetch=True, readonly=True, coalesce=True)
+        loaded = {row["id"]: _row_to_product(row) for row in rows}
+        # The read may come from a lagging replica. A stock event is applied to the
+        # stock view before its cache entry is deleted, so a row older than the view
+        # was read before that change and is served but not cached.
+        current = {}
+        for row in rows:
+            known = stock_view.get(row["id"])
+            if known is None or known[1] <= row["stock_version"]:
+                current[row["id"]] = loaded[row["id"]]
+        await product_cache.set_many(current)
+        found.update(loaded)
+
+    return [found[pid] for pid in product_ids if pid in found]
+
+class StockView:
+    """
+    In-memory materialized view of product stock, fed by versioned stock change events.
+    Updates older than the version already held are ignored, so out-of-order or
+    redelivered events and the startup preload can interleave safely.
+    """
+
+    def __init__(self):
+        self._stock: Dict[int, Tuple[int, int]] = {}  # product_id -> (stock, version)
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def get(self, product_id: int) -> Optional[Tuple[int, int]]:
+        return self._stock.get(product_id)
+
+    def apply(self, product_id: int, stock: int, version: int) -> bool:
+        """Apply an update; returns True if it was newer than the current state"""
+        current = self._stock.get(product_id)
+        if current is not None and current[1] >= version:
+            return False
+        self._stock[product_id] = (stock, version)
+        return True
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: dict):
+        for queue in self._subscribers:
+            if queue.full():
+                # Slow subscriber: drop its oldest event rather than block the consumer
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def __len__(self):
+        return len(self._stock)
+
+stock_view = StockView()
+
+async def load_stock(product_ids: List[int]):
+    """Seed the stock view for products it has not seen yet"""
+    query = "SELECT id, stock, stock_version FROM product_stock WHERE id = ANY($1::int[])"
+    rows = await db.execute_query(query, [product_ids], fetch=True)
+    for row in rows:
+        stock_view.apply(row["id"], row["stock"], row["stock_version"])
+
+async def preload_stock_view():
+    """Load every product's stock in keyset-paginated batches"""
+    after_id = 0
+    query = "SELECT id, stock, stock_version FROM product_stock WHERE id > $1 ORDER BY id LIMIT $2"
+    while True:
+        rows = await db.execute_query(query, [after_id, STOCK_PRELOAD_BATCH], fetch=True)
+        for row in rows:
+            stock_view.apply(row["id"], row["stock"], row["stock_version"])
+        if len(rows) < STOCK_PRELOAD_BATCH:
+            break
+        after_id = rows[-1]["id"]
+    logger.info("Stock view preloaded with %d products", len(stock_view))
+
+# The gateway's product id set refreshes with a keyset scan on (updated_at, id)
+PRODUCT_INDEXES = {
+    "products_updated_at_id_idx": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS products_updated_at_id_idx
+        ON products (updated_at, id)
+    """,
+}
+
+async def ensure_indexes():
+    """Create the product indexes and verify they are valid.
+    A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which
+    IF NOT EXISTS would skip, so invalid indexes are dropped and rebuilt."""
+    query = """
+    SELECT c.relname AS name, i.indisvalid AS valid
+    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = ANY($1::text[])
+    """
+    names = list(PRODUCT_INDEXES)
+    for attempt in range(2):
+        rows = await db.execute_query(query, [names], fetch=True)
+        state = {row["name"]: row["valid"] for row in rows}
+        pending = [name for name in names if not state.get(name)]
+        if not pending:
+            logger.info("Product indexes verified: %s", ", ".join(names))
+            return
+        for name in pending:
+            if name in state:
+                logger.warning("Index %s is invalid; rebuilding", name)
+                await db.execute_query(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            logger.info("Creating index %s...", name)
+            await db.execute_query(PRODUCT_INDEXES[name])
+    raise RuntimeError(f"Product indexes could not be created: {', '.join(pending)}")
+
+async def process_stock_event(message):
+    """Apply stock changes to the view, notify subscribers and invalidate cached products"""
+    async with message.process():
+        try:
+            event = json.loads(message.body.decode())
+            product_id = event["product_id"]
+            if stock_view.apply(product_id, event["stock"], event["version"]):
+                stock_view.publish(event)
+            await product_cache.delete(product_id)
+        except (json.JSONDecodeError, KeyError) as e:
+            # Malformed events are dropped; requeueing them would loop forever
+            logger.error("Invalid stock event: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Async context manager for FastAPI lifespan events"""
+    # Startup: DB and broker connect in parallel in the background
+    logger.info("Starting product service initialization...")
+    diagnostics.start()
+    await startup.start()
+
+    try:
+        yield
+    finally:
+        # Shutdown
+        logger.info("Shutting down product service...")
+        await startup.stop()
+        diagnostics.stop()
+
+        await stock_events.drain()
+        await stock_events.close()
+        await db.close()
+        logger.info("Product service shutdown complete")
+
+async def _start_stock_consumer():
+    """Subscribe to stock change events for cache invalidation and the stock view"""
+    await stock_events.start_consuming(process_stock_event)
+
+diagnostics = LoopDiagnostics("product")
+startup = StartupOrchestrator("product")
+startup.add("database", db._ensure_connection)
+startup.add("stock_events", _start_stock_consumer)
+# Only one worker per instance runs the DDL; a slow build must not hold back readiness
+if is_primary_worker():
+    startup.add("indexes", ensure_indexes, after=["database"], required=False)
+if STOCK_VIEW_PRELOAD:
+    # Consume first so no change made during the preload is missed
+    startup.add("stock_view", preload_stock_view, after=["database", "stock_events"])
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+startup.install_routes(app)
+diagnostics.install_routes(app)
 
 @app.get("/status")
-def status():
+def status_check():
     return {"status": "Product service is running"}
 
+@app.get("/products", response_model=ProductPage)
+async def list_products(
+    ids: Optional[str] = Query(None, description="Comma-separated product ids for a multi-get"),
+    after_id: int = Query(0, ge=0, description="Return products with id greater than this"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Multi-get by ids, or a keyset-paginated list ordered by id"""
+    if ids is not None:
+        try:
+            product_ids = [int(value) for value in ids.split(",") if value.strip()]
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be integers")
+        if len(product_ids) > MAX_MULTI_GET:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {MAX_MULTI_GET} ids per request"
+            )
+        return FastJSONResponse({"items": await get_products(product_ids), "next_after_id": None})
+
+    page_key = f"{after_id}:{limit}"
+    page_ids = await page_cache.get(page_key)
+    if page_ids is None:
+        query = "SELECT id FROM products WHERE id > $1 ORDER BY id LIMIT $2"
+        rows = await db.execute_query(query, [after_id, limit], fetch=True, readonly=True, coalesce=True)
+        page_ids = [row["id"] for row in rows]
+        await page_cache.set(page_key, page_ids)
+
+    items = await get_products(page_ids)
+    next_after_id = page_ids[-1] if len(page_ids) == limit else None
+    return FastJSONResponse({"items": items, "next_after_id": next_after_id})
+
+@app.get("/products/{product_id}", response_model=Product)
+async def get_product(product_id: int):
+    products = await get_products([product_id])
+    if not products:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    return FastJSONResponse(products[0])
+
+@app.get("/products/{product_id}/stock")
+async def get_product_stock(product_id: int):
+    """Current stock from the in-memory view; Postgres is only read on a cold miss"""
+    entry = stock_view.get(product_id)
+    if entry is None:
+        await load_stock([product_id])
+        entry = stock_view.get(product_id)
+        if entry is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    stock, version = entry
+    return {"product_id": product_id, "stock": stock, "version": version}
+
+@app.get("/stock/stream")
+async def stream_stock(
+    request: Request,
+    ids: Optional[str] = Query(None, description="Comma-separated product ids to follow (default all)"),
+):
+    """Server-sent events stream of stock changes"""
+    try:
+        wanted = {int(value) for value in ids.split(",") if value.strip()} if ids else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids must be integers")
+
+    queue = stock_view.subscribe()
+
+    async def event_source():
+        try:
+            # Send the current state first so clients do not need a separate read
+            if wanted:
+                await load_stock([pid for pid in wanted if stock_view.get(pid) is None])
+                for pid in wanted:
+                    entry = stock_view.get(pid)
+                    if entry is not None:
+                        snapshot = {"product_id": pid, "stock": entry[0], "version": entry[1]}
+                        yield f"event: stock\ndata: {json.dumps(snapshot)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if wanted is None or event["product_id"] in wanted:
+                    yield f"event: stock\ndata: {json.dumps(event)}\n\n"
+        finally:
+            stock_view.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "products": product_cache.stats(),
+        "pages": page_cache.stats(),
+        "stock_view": {"size": len(stock_view)},
+    }
+
+@app.get("/db/stats")
+async def db_stats():
+    return db.stats()
+
+@app.get("/health")
+async def health_check():
+    if not db._is_connected.is_set():
+        raise HTTPException(status_code=503, detail="Database not connected")
+    if not stock_events._is_connected.is_set():
+        raise HTTPException(status_code=503, detail="RabbitMQ not connected")
+    return {"status": "healthy"}
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5004)
+    run_workers("app.main:app", port=int(os.getenv("PORT", 5004)))
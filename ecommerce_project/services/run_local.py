@@ -0,0 +1,86 @@
+"""
+Run the order pipeline in a single process on the in-memory broker.
+
+Every selected service is imported from its app/main.py and served by its own
+uvicorn server on one event loop, with BROKER_TRANSPORT=memory so messages
+flow through shared.memory_broker instead of RabbitMQ. Postgres (and Redis
+for the product service) are still used, which keeps the Python hot path
+(parsing, validation, DB access) measurable without broker latency.
+
+    python services/run_local.py
+    python services/run_local.py --services gateway order inventory
+    python services/run_local.py --replay orders.cap --speed 10   # replay a capture into them
+"""
+import os
+import sys
+import json
+import asyncio
+import argparse
+import importlib.util
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Service name -> default port, matching docker-compose.yml
+SERVICES = {
+    "gateway": 5050,
+    "order": 5001,
+    "inventory": 5002,
+    "notification": 5003,
+    "product": 5004,
+}
+
+def load_service(name: str):
+    """Import services/<name>/app/main.py under a unique module name"""
+    path = os.path.join(SERVICES_DIR, name, "app", "main.py")
+    spec = importlib.util.spec_from_file_location(f"{name}_service", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+async def replay_when_started(servers, path, speed, exit_after):
+    """Replay a capture (shared/capture.py) once every service has finished its startup"""
+    from shared.capture import replay
+
+    while not all(server.started for server in servers):
+        await asyncio.sleep(0.1)
+    print(json.dumps(await replay(path, speed), indent=2), flush=True)
+    if exit_after:
+        for server in servers:
+            server.should_exit = True
+
+async def serve(names, host, log_level, replay_path=None, speed=1.0, exit_after_replay=False):
+    import uvicorn
+
+    servers = []
+    for name in names:
+        config = uvicorn.Config(load_service(name), host=host, port=SERVICES[name], log_level=log_level)
+        servers.append(uvicorn.Server(config))
+    tasks = [server.serve() for server in servers]
+    if replay_path:
+        tasks.append(replay_when_started(servers, replay_path, speed, exit_after_replay))
+    await asyncio.gather(*tasks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run services in one process on the in-memory broker")
+    parser.add_argument("--services", nargs="+", choices=list(SERVICES), default=list(SERVICES))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--replay", metavar="CAPTURE", help="Capture file to publish once the services are up")
+    parser.add_argument("--speed", default="1", help="Replay speed: 1, N or max (default 1)")
+    parser.add_argument("--exit-after-replay", action="store_true")
+    args = parser.parse_args()
+    speed = None if args.speed.lower() == "max" else float(args.speed.lower().rstrip("x"))
+
+    # Must be set before any service imports shared.rabbitmq
+    os.environ["BROKER_TRANSPORT"] = "memory"
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    os.environ.setdefault("REDIS_PORT", "6379")
+    os.environ.setdefault("DB_HOST", "localhost")
+    os.environ.setdefault("DB_PORT", "5432")
+    sys.path.insert(0, SERVICES_DIR)
+
+    asyncio.run(serve(args.services, args.host, args.log_level, args.replay, speed, args.exit_after_replay))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from typing import Any, List
+from asyncpg import InterfaceError
+from asyncpg.exceptions import (
+    PostgresConnectionError,
+    CannotConnectNowError,
+    InsufficientResourcesError,
+    TransactionRollbackError,
+)
+from aiormq.exceptions import ChannelInvalidStateError
+
+logger = logging.getLogger(__name__)
+
+# Failures that say nothing about the messages themselves (database or broker
+# unreachable, pool exhausted, deadlock or serialization failure): the batch is
+# requeued as a whole and tried again later
+TRANSIENT_ERRORS = (
+    PostgresConnectionError,
+    CannotConnectNowError,
+    InsufficientResourcesError,
+    TransactionRollbackError,
+    InterfaceError,
+    ChannelInvalidStateError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+class MessageBatcher:
+    """
+    Coalesces deliveries over a short window and processes them in batches.
+    Subclasses implement parse(message), which turns a delivery into an item or
+    raises one of `parse_errors`, and process(items), which handles a whole batch.
+
+    A message that fails parse() is rejected without requeue on arrival. A
+    processed batch is settled with a single ack using multiple=True: deliveries
+    on a channel arrive in tag order, so acking the newest message of a batch
+    covers exactly the messages taken into it. When a batch fails with one of
+    `transient_errors` it is nacked back to the queue as a whole. Any other
+    failure is blamed on its content: each message is then processed on its own,
+    acked if it succeeds and rejected without requeue if it fails again, so one
+    bad message cannot send its batch around the queue forever.
+    """
+
+    parse_errors = (ValueError,)
+    transient_errors = TRANSIENT_ERRORS
+
+    def __init__(self, window_ms: int, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []  # (message, item)
+        self._timer = None
+        self._flush_lock = asyncio.Lock()
+        self.batches = 0
+        self.messages = 0
+        self.rejected = 0
+
+    def parse(self, message) -> Any:
+        raise NotImplementedError
+
+    async def process(self, items: List[Any]):
+        raise NotImplementedError
+
+    async def add(self, message):
+        """Consumer callback: buffer the message; it is settled when its batch is flushed"""
+        try:
+            item = self.parse(message)
+        except self.parse_errors as e:
+            logger.error("Invalid message in %s: %s", type(self).__name__, e)
+            await message.reject(requeue=False)
+            self.rejected += 1
+            return
+
+        self._pending.append((message, item))
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_after_window())
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        async with self._flush_lock:
+            if self._timer is not None and len(self._pending) >= self.max_batch:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if not batch:
+                return
+
+            last_message = batch[-1][0]
+            try:
+                await self.process([item for _, item in batch])
+            except self.transient_errors as e:
+                logger.error("%s batch of %d failed, requeueing: %s", type(self).__name__, len(batch), e)
+                await last_message.nack(multiple=True, requeue=True)
+                return
+            except Exception as e:
+                logger.error(
+                    "%s batch of %d failed, retrying its messages one at a time: %s",
+                    type(self).__name__, len(batch), e, exc_info=True
+                )
+                await self._settle_one_by_one(batch)
+            else:
+                await last_message.ack(multiple=True)
+                self.batches += 1
+                self.messages += len(batch)
+
+        # Messages that arrived while flushing may already form a full batch
+        if len(self._pending) >= self.max_batch:
+            await self.flush()
+        elif self._pending and self._timer is None:
+            self._timer = asyncio.create_task(self._flush_after_window())
+
+    async def _settle_one_by_one(self, batch):
+        for position, (message, item) in enumerate(batch):
+            try:
+                await self.process([item])
+            except self.transient_errors as e:
+                logger.error("%s retry failed, requeueing the rest of the batch: %s", type(self).__name__, e)
+                for remaining, _ in batch[position:]:
+                    await remaining.nack(requeue=True)
+                return
+            except Exception as e:
+                logger.error("Rejecting message in %s that fails on its own: %s", type(self).__name__, e)
+                await message.reject(requeue=False)
+                self.rejected += 1
+                continue
+            await message.ack()
+            self.messages += 1
+
+    async def close(self):
+        """Flush whatever is buffered before shutdown"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            await self.flush()
+        # A window flush may still be settling a batch it already took
+        async with self._flush_lock:
+            pass
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "rejected": self.rejected,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,131 @@
+import time
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class LRUCache:
+    """In-process LRU cache with a per-entry TTL. Not thread-safe; use from the event loop."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING or entry[0] < time.monotonic():
+            if entry is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+class TieredCache:
+    """
+    Two-level cache: an in-process LRU in front of Redis.
+    Values are JSON-serialised in Redis. Redis errors are logged and treated as
+    misses so the cache never takes down the read path. The synchronous
+    RedisUtil calls run in a worker thread to keep the event loop free.
+    """
+
+    def __init__(self, redis_util, prefix: str, local: Optional[LRUCache] = None, redis_ttl: int = 300):
+        self.redis = redis_util
+        self.prefix = prefix
+        self.local = local or LRUCache()
+        self.redis_ttl = redis_ttl
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    def _key(self, key) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get_many(self, keys: Iterable) -> Dict[Any, Any]:
+        """Return {key: value} for every key found in either tier"""
+        found = {}
+        remote = []
+        for key in keys:
+            value = self.local.get(key, _MISSING)
+            if value is _MISSING:
+                remote.append(key)
+            else:
+                found[key] = value
+        if not remote:
+            return found
+
+        try:
+            raw_values = await asyncio.to_thread(self.redis.get_many, [self._key(k) for k in remote])
+        except Exception as e:
+            logger.warning("Redis read failed for %s: %s", self.prefix, e)
+            return found
+
+        for key, raw in zip(remote, raw_values):
+            if raw is None:
+                self.redis_misses += 1
+                continue
+            self.redis_hits += 1
+            value = json.loads(raw)
+            self.local.set(key, value)
+            found[key] = value
+        return found
+
+    async def get(self, key, default=None):
+        return (await self.get_many([key])).get(key, default)
+
+    async def set_many(self, mapping: Dict[Any, Any]):
+        if not mapping:
+            return
+        for key, value in mapping.items():
+            self.local.set(key, value)
+        try:
+            await asyncio.to_thread(
+                self.redis.set_many,
+                {self._key(k): json.dumps(v, default=str) for k, v in mapping.items()},
+                self.redis_ttl,
+            )
+        except Exception as e:
+            logger.warning("Redis write failed for %s: %s", self.prefix, e)
+
+    async def set(self, key, value):
+        await self.set_many({key: value})
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.local.delete(key)
+        try:
+            await asyncio.to_thread(self.redis.delete_keys, *[self._key(k) for k in keys])
+        except Exception as e:
+            logger.warning("Redis delete failed for %s: %s", self.prefix, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "local": self.local.stats(),
+            "redis": {"hits": self.redis_hits, "misses": self.redis_misses},
+        }
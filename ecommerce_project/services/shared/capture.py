@@ -0,0 +1,282 @@
+import io
+import json
+import mmap
+import time
+import array
+import asyncio
+import struct
+import logging
+from collections import Counter
+from typing import Dict, Iterator, List, NamedTuple, Optional
+from shared.rabbitmq import RabbitMQ
+
+logger = logging.getLogger(__name__)
+
+QUEUES = ("order_queue", "inventory_queue", "notification_queue")
+
+# File layout: header, JSON metadata, then records back to back. A record is its
+# fixed-size header (nanoseconds since the capture started, body length, queue
+# index) followed by the raw body, so a reader can mmap the file and walk it
+# without parsing or copying bodies. A capture that was killed mid-write simply
+# ends at its last complete record.
+MAGIC = b"AMQPCAP1"
+HEADER = struct.Struct("<8sQI")  # magic, capture start (ns since epoch), metadata length
+RECORD = struct.Struct("<QIH")  # offset_ns, body length, queue index
+
+class CaptureError(Exception):
+    pass
+
+class CapturedMessage(NamedTuple):
+    offset_ns: int
+    queue: str
+    body: memoryview
+
+class CaptureWriter:
+    """Append-only writer; records are buffered and hit the disk in large writes"""
+
+    def __init__(self, path: str, queues: List[str], buffer_size: int = 1 << 20):
+        self.queues = list(queues)
+        self._index = {queue: i for i, queue in enumerate(self.queues)}
+        self.started_ns = time.time_ns()
+        self._file = io.open(path, "wb", buffering=buffer_size)
+        metadata = json.dumps({"queues": self.queues}).encode()
+        self._file.write(HEADER.pack(MAGIC, self.started_ns, len(metadata)) + metadata)
+        self.messages = 0
+        self.bytes = 0
+
+    def write(self, queue: str, body: bytes, timestamp_ns: Optional[int] = None):
+        offset = max(0, (timestamp_ns or time.time_ns()) - self.started_ns)
+        self._file.write(RECORD.pack(offset, len(body), self._index[queue]))
+        self._file.write(body)
+        self.messages += 1
+        self.bytes += RECORD.size + len(body)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+class CaptureReader:
+    """Memory-mapped capture; iterating yields CapturedMessage with bodies as views into the map"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise CaptureError(f"{path} is empty")
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise CaptureError(f"{path} is not a capture file")
+        magic, self.started_ns, metadata_length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise CaptureError(f"{path} is not a capture file")
+        self._data_start = HEADER.size + metadata_length
+        self.queues: List[str] = json.loads(self._map[HEADER.size:self._data_start])["queues"]
+
+    def __iter__(self) -> Iterator[CapturedMessage]:
+        view = memoryview(self._map)
+        position, end = self._data_start, len(self._map)
+        try:
+            while position + RECORD.size <= end:
+                offset_ns, length, queue = RECORD.unpack_from(self._map, position)
+                position += RECORD.size
+                if position + length > end:
+                    return
+                yield CapturedMessage(offset_ns, self.queues[queue], view[position:position + length])
+                position += length
+        finally:
+            view.release()
+
+    def summary(self) -> dict:
+        per_queue = Counter()
+        body_bytes = 0
+        last_ns = 0
+        for message in self:
+            per_queue[message.queue] += 1
+            body_bytes += len(message.body)
+            last_ns = message.offset_ns
+        return {
+            "started_at": self.started_ns / 1e9,
+            "messages": sum(per_queue.values()),
+            "per_queue": dict(per_queue),
+            "body_bytes": body_bytes,
+            "duration_s": round(last_ns / 1e9, 3),
+        }
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # A message body still references the map; it is unmapped once that is dropped
+            pass
+        self._file.close()
+
+async def capture(path: str, queues=QUEUES, duration: Optional[float] = None,
+                  max_messages: Optional[int] = None) -> dict:
+    """
+    Record every message published to `queues` into a capture file until `duration`
+    seconds pass, `max_messages` are recorded or the task is cancelled. Taps never
+    consume, so it can run against a live stack (see RabbitMQ.tap).
+    """
+    writer = CaptureWriter(path, queues)
+    done = asyncio.Event()
+    taps = [RabbitMQ(queue_name=queue) for queue in queues]
+
+    def recorder(queue):
+        def record(body):
+            if done.is_set():
+                return
+            writer.write(queue, body)
+            if max_messages and writer.messages >= max_messages:
+                done.set()
+        return record
+
+    started = time.perf_counter()
+    try:
+        for tap in taps:
+            await tap.tap(recorder(tap.queue_name))
+        logger.info("Capturing %s to %s", ", ".join(queues), path)
+        try:
+            await asyncio.wait_for(done.wait(), timeout=duration)
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        done.set()
+        for tap in taps:
+            await tap.close()
+        writer.close()
+    return {
+        "path": path,
+        "messages": writer.messages,
+        "bytes": writer.bytes,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def _percentiles(values: array.array) -> Dict[str, Optional[float]]:
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)  # noqa: E731
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1], 3)}
+
+async def _watch_backlog(publishers: Dict[str, RabbitMQ], interval: float, stop: asyncio.Event, peaks: Dict[str, int]):
+    while True:
+        for queue, publisher in publishers.items():
+            try:
+                peaks[queue] = max(peaks[queue], await publisher.message_count())
+            except Exception as e:
+                logger.warning("Reading the depth of %s failed: %s", queue, e)
+        if stop.is_set():
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+async def _wait_drained(publishers: Dict[str, RabbitMQ], interval: float, timeout: float) -> Optional[float]:
+    """Seconds until every queue is empty, or None if they are not within `timeout`"""
+    started = time.perf_counter()
+    while True:
+        depths = [await publisher.message_count() for publisher in publishers.values()]
+        if not any(depths):
+            return round(time.perf_counter() - started, 3)
+        if time.perf_counter() - started >= timeout:
+            return None
+        await asyncio.sleep(interval)
+
+async def replay(path: str, speed: Optional[float] = 1.0, queues=None, concurrency: int = 64,
+                 sample_interval: float = 0.5, drain_timeout: float = 60.0) -> dict:
+    """
+    Publish a capture back into the broker with its original timing scaled by
+    `speed` (2.0 replays twice as fast), or as fast as possible with speed=None.
+    Up to `concurrency` publishes are awaited at once so broker confirms do not
+    cap the rate; they are issued in capture order.
+
+    Returned statistics:
+      - throughput: messages published per second, and the speed-up achieved over
+        the recorded timeline
+      - schedule_lag_ms: how late each publish started relative to its scaled
+        capture time; growing lag means the publisher, not the stack, is the limit
+      - backlog: peak ready messages per queue while replaying, and how long the
+        consumers took to empty the queues after the last publish
+    """
+    reader = CaptureReader(path)
+    wanted = set(queues or reader.queues)
+    publishers = {queue: RabbitMQ(queue_name=queue) for queue in reader.queues if queue in wanted}
+    peaks = Counter({queue: 0 for queue in publishers})
+    sent = Counter()
+    lag_ms = array.array("d")
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+    failures = 0
+    stop_watching = asyncio.Event()
+
+    async def publish(publisher, body):
+        nonlocal failures
+        try:
+            await publisher.publish_message(body)
+        except Exception as e:
+            failures += 1
+            logger.error("Replay publish to %s failed: %s", publisher.queue_name, e)
+        finally:
+            slots.release()
+
+    try:
+        for publisher in publishers.values():
+            await publisher._ensure_connection()
+        watcher = asyncio.create_task(_watch_backlog(publishers, sample_interval, stop_watching, peaks))
+        first_ns = None
+        last_ns = 0
+        started = time.perf_counter()
+        for message in reader:
+            publisher = publishers.get(message.queue)
+            if publisher is None:
+                continue
+            if first_ns is None:
+                first_ns = message.offset_ns
+            last_ns = message.offset_ns
+            if speed:
+                due = started + (message.offset_ns - first_ns) / 1e9 / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lag_ms.append(max(0.0, time.perf_counter() - due) * 1000)
+            await slots.acquire()
+            task = asyncio.create_task(publish(publisher, bytes(message.body)))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            sent[message.queue] += 1
+        if pending:
+            await asyncio.gather(*pending)
+        elapsed = time.perf_counter() - started
+
+        stop_watching.set()
+        await watcher
+        drained_after = await _wait_drained(publishers, sample_interval, drain_timeout) if drain_timeout else None
+    finally:
+        stop_watching.set()
+        for publisher in publishers.values():
+            await publisher.close()
+        reader.close()
+
+    total = sum(sent.values())
+    recorded = (last_ns - (first_ns or 0)) / 1e9
+    return {
+        "path": path,
+        "speed": speed or "max",
+        "sent": dict(sent),
+        "failed": failures,
+        "seconds": round(elapsed, 3),
+        "throughput": {
+            "messages_per_s": round(total / elapsed, 1) if elapsed else None,
+            "recorded_seconds": round(recorded, 3),
+            "achieved_speedup": round(recorded / elapsed, 2) if elapsed and recorded else None,
+        },
+        "schedule_lag_ms": _percentiles(lag_ms),
+        "backlog": {
+            "peak_ready": dict(peaks),
+            "drained_after_s": drained_after,
+        },
+    }
@@ -1,54 +1,222 @@
 import os
+import time
+import random
 import asyncio
 import logging
 from contextlib import asynccontextmanager
-from typing import Optional, List, Dict, Any
-from asyncpg import create_pool, Pool
-from asyncpg.exceptions import PostgresError
+from typing import Optional, List, Dict, Any, Set
+from asyncpg import create_pool, Pool, InterfaceError
+from asyncpg.exceptions import (
+    PostgresError,
+    PostgresConnectionError,
+    CannotConnectNowError,
+    SerializationError,
+)
+from shared.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
-class Database:
+# Replication lag in seconds. A replica that has replayed everything it received is
+# only current while its WAL receiver is connected to the upstream: one that lost it
+# stops receiving, so equal LSNs prove nothing and the lag is the time since the last
+# replayed transaction (NULL, never current, if there is none). Without pg_read_all_stats the
+# receiver's status reads as NULL, so any receiver row then counts as connected.
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+         AND EXISTS (
+             SELECT 1 FROM pg_stat_wal_receiver WHERE status IS NULL OR status = 'streaming'
+         ) THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# A read that fails on a replica with one of these is retried on the primary.
+# SerializationError covers "canceling statement due to conflict with recovery".
+REPLICA_FALLBACK_ERRORS = (
+    PostgresConnectionError,
+    CannotConnectNowError,
+    SerializationError,
+    InterfaceError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+def _coalesce_key(query: str, params: Optional[list]) -> Optional[tuple]:
+    """Hashable (statement, params) key; None when a parameter cannot be hashed"""
+    key = (query, tuple(tuple(p) if isinstance(p, list) else p for p in params or ()))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+class _PoolStats:
     def __init__(self):
+        self.queries = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def record(self, seconds: float, failed: bool = False):
+        self.queries += 1
+        self.seconds += seconds
+        if failed:
+            self.errors += 1
+
+    def as_dict(self, pool: Optional[Pool]) -> Dict[str, Any]:
+        stats = {
+            "queries": self.queries,
+            "errors": self.errors,
+            "avg_ms": round(self.seconds / self.queries * 1000, 3) if self.queries else None,
+        }
+        if pool is not None and not pool._closed:
+            stats.update(size=pool.get_size(), idle=pool.get_idle_size(), max_size=pool.get_max_size())
+        return stats
+
+class _Replica:
+    def __init__(self, address: str):
+        host, _, port = address.strip().partition(":")
+        self.host = host
+        self.port = port or os.getenv("DB_PORT", "5432")
+        self.name = f"{self.host}:{self.port}"
         self.pool: Optional[Pool] = None
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.stats = _PoolStats()
+
+class Database:
+    def __init__(
+        self,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        replica_hosts: Optional[List[str]] = None
+    ):
+        """
+        :param replica_hosts: Read replicas as host[:port] (default DB_REPLICA_HOSTS, comma separated).
+            Reads marked readonly go to a healthy replica whose lag is within
+            DB_REPLICA_MAX_LAG seconds, and fall back to the primary otherwise.
+        """
+        self.pool: Optional[Pool] = None
+        self.min_size = min_size or int(os.getenv("DB_POOL_MIN_SIZE", 1))
+        self.max_size = max_size or int(os.getenv("DB_POOL_MAX_SIZE", 10))
         self._is_connected = asyncio.Event()
+        self._connect_lock = asyncio.Lock()
+
+        if replica_hosts is None:
+            replica_hosts = [h for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+        self.replicas = [_Replica(address) for address in replica_hosts]
+        self.replica_max_size = int(os.getenv("DB_REPLICA_POOL_MAX_SIZE", self.max_size))
+        self.max_replica_lag = float(os.getenv("DB_REPLICA_MAX_LAG", 1.0))
+        self.lag_check_interval = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 1.0))
+        self.replica_fallbacks = 0
+        self._readonly_statements: Set[str] = set()
+        self._next_replica = 0
+        self._monitor: Optional[asyncio.Task] = None
+        self._primary_stats = _PoolStats()
+
+        # Single-flight reads (execute_query(..., coalesce=True))
+        self._in_flight: Dict[tuple, asyncio.Task] = {}
+        self.coalesce_ttl = float(os.getenv("DB_COALESCE_CACHE_TTL", 0))
+        self._recent = LRUCache(maxsize=int(os.getenv("DB_COALESCE_CACHE_SIZE", 10000)), ttl=self.coalesce_ttl)
+        self.coalesce_leaders = 0
+        self.coalesced = 0
+        self.coalesce_cache_hits = 0
 
-    async def _ensure_connection(self, retries: int = 5, delay: float = 3.0):
-        """Establish connection with exponential backoff"""
+    async def _ensure_connection(self, retries: int = 10, delay: float = 0.5):
+        """Establish connection with jittered exponential backoff.
+        create_pool opens min_size connections up front, so the pool is warm once this returns."""
         if self._is_connected.is_set() and self.pool:
             return
 
+        async with self._connect_lock:
+            if self._is_connected.is_set() and self.pool:
+                return
+            await self._connect(retries, delay)
+
+    async def _connect(self, retries: int, delay: float):
+        max_delay = float(os.getenv("DB_RETRY_MAX_DELAY", 5))
         for attempt in range(retries):
             try:
-                self.pool = await create_pool(
-                    min_size=1,
-                    max_size=10,
-                    user=os.getenv("DB_USER"),
-                    password=os.getenv("DB_PASSWORD"),
-                    host=os.getenv("DB_HOST"),
-                    port=os.getenv("DB_PORT"),
-                    database=os.getenv("DB_NAME"),
-                    timeout=10
+                self.pool = await self._create_pool(
+                    os.getenv("DB_HOST"), os.getenv("DB_PORT"), self.min_size, self.max_size
                 )
                 # Test the connection
                 async with self.pool.acquire() as conn:
                     await conn.execute("SELECT 1")
                 self._is_connected.set()
                 logger.info("Successfully connected to database")
+                if self.replicas and self._monitor is None:
+                    # Replicas come up in the background; until then reads use the primary
+                    self._monitor = asyncio.create_task(self._monitor_replicas())
                 return
-            except (PostgresError, ConnectionError) as e:
-                wait_time = min(delay * (2 ** attempt), 30)  # Cap at 30 seconds
+            except (PostgresError, OSError, asyncio.TimeoutError) as e:
+                # Full jitter keeps replicas from retrying in lockstep during a rollout
+                wait_time = random.uniform(0, min(delay * (2 ** attempt), max_delay))
                 logger.warning(
-                    f"Database connection failed (attempt {attempt + 1}/{retries}). "
-                    f"Retrying in {wait_time} seconds. Error: {str(e)}"
+                    "Database connection failed (attempt %d/%d). Retrying in %.2f seconds. Error: %s",
+                    attempt + 1, retries, wait_time, e
                 )
                 await asyncio.sleep(wait_time)
         
         raise ConnectionError("Could not connect to database after multiple retries")
 
+    async def _create_pool(self, host, port, min_size: int, max_size: int) -> Pool:
+        return await create_pool(
+            min_size=min_size,
+            max_size=max_size,
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=host,
+            port=port,
+            database=os.getenv("DB_NAME"),
+            timeout=10
+        )
+
+    async def _monitor_replicas(self):
+        """Connect replicas and keep their health and lag current"""
+        while True:
+            for replica in self.replicas:
+                await self._check_replica(replica)
+            await asyncio.sleep(self.lag_check_interval)
+
+    async def _check_replica(self, replica: _Replica):
+        try:
+            if replica.pool is None:
+                replica.pool = await self._create_pool(replica.host, replica.port, 1, self.replica_max_size)
+            lag = await replica.pool.fetchval(REPLICA_LAG_QUERY, timeout=self.lag_check_interval * 2)
+            replica.lag = float(lag) if lag is not None else None
+            healthy = replica.lag is not None and replica.lag <= self.max_replica_lag
+        except (PostgresError, InterfaceError, OSError, asyncio.TimeoutError) as e:
+            healthy = False
+            replica.lag = None
+            if replica.healthy:
+                logger.warning("Replica %s check failed: %s", replica.name, e)
+        if healthy != replica.healthy:
+            logger.info("Replica %s %s rotation (lag=%s)", replica.name, "in" if healthy else "out of", replica.lag)
+        replica.healthy = healthy
+
+    def _pick_replica(self) -> Optional[_Replica]:
+        """Round-robin over replicas that are connected and within the lag limit"""
+        healthy = [r for r in self.replicas if r.healthy and r.pool is not None]
+        if not healthy:
+            return None
+        self._next_replica += 1
+        return healthy[self._next_replica % len(healthy)]
+
+    def register_readonly(self, *queries: str):
+        """Route these exact statements to replicas without passing readonly=True at each call"""
+        self._readonly_statements.update(queries)
+
     @asynccontextmanager
-    async def get_connection(self):
-        """Async context manager for database connections"""
+    async def get_connection(self, readonly: bool = False):
+        """Async context manager for database connections; readonly may use a replica"""
+        replica = self._pick_replica() if readonly else None
+        if replica is not None:
+            async with replica.pool.acquire() as conn:
+                yield conn
+            return
+
         if not self.pool or self.pool._closed:
             await self._ensure_connection()
         
@@ -58,31 +226,139 @@ class Database:
         finally:
             await self.pool.release(conn)
 
+    @staticmethod
+    async def _run(conn, query: str, params: Optional[list], fetch: bool):
+        if fetch:
+            return await conn.fetch(query, *(params or []))
+        await conn.execute(query, *(params or []))
+
     async def execute_query(
         self,
         query: str,
         params: Optional[list] = None,
-        fetch: bool = False
+        fetch: bool = False,
+        readonly: bool = False,
+        coalesce: bool = False,
+        cache_ttl: Optional[float] = None
     ) -> Optional[List[Dict[str, Any]]]:
         """
         Execute a query with optional parameters
         :param query: SQL query string
         :param params: List of parameters for the query
         :param fetch: Whether to fetch results
+        :param readonly: Allow a read replica to serve the query (also implied by register_readonly)
+        :param coalesce: For reads: concurrent calls with the same statement and params share one
+            query and its result instead of each taking a pool connection
+        :param cache_ttl: With coalesce, also reuse the result for this many seconds
+            (default DB_COALESCE_CACHE_TTL, 0 = only share in-flight queries)
         :return: List of dictionaries (rows) if fetch=True, else None
         """
+        if coalesce and fetch:
+            key = _coalesce_key(query, params)
+            if key is not None:
+                return await self._single_flight(key, cache_ttl, query, params, readonly)
+        return await self._execute(query, params, fetch, readonly)
+
+    async def _single_flight(self, key: tuple, cache_ttl: Optional[float], query: str,
+                             params: Optional[list], readonly: bool) -> List[Dict[str, Any]]:
+        ttl = self.coalesce_ttl if cache_ttl is None else cache_ttl
+        if ttl > 0:
+            rows = self._recent.get(key)
+            if rows is not None:
+                self.coalesce_cache_hits += 1
+                return list(rows)
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self.coalesce_leaders += 1
+            # The query runs in its own task so a cancelled caller does not fail the others
+            task = asyncio.create_task(self._execute(query, params, True, readonly))
+            self._in_flight[key] = task
+
+            def finished(done: asyncio.Task):
+                self._in_flight.pop(key, None)
+                if not done.cancelled() and done.exception() is None and ttl > 0:
+                    self._recent.set(key, done.result(), ttl=ttl)
+
+            task.add_done_callback(finished)
+        else:
+            self.coalesced += 1
+        # Callers get their own list; the rows themselves are immutable records
+        return list(await asyncio.shield(task))
+
+    async def _execute(
+        self,
+        query: str,
+        params: Optional[list],
+        fetch: bool,
+        readonly: bool
+    ) -> Optional[List[Dict[str, Any]]]:
+        replica = None
+        if readonly or query in self._readonly_statements:
+            replica = self._pick_replica()
+
+        if replica is not None:
+            started = time.perf_counter()
+            try:
+                async with replica.pool.acquire() as conn:
+                    result = await self._run(conn, query, params, fetch)
+                replica.stats.record(time.perf_counter() - started)
+                return result
+            except REPLICA_FALLBACK_ERRORS as e:
+                replica.stats.record(time.perf_counter() - started, failed=True)
+                if not isinstance(e, SerializationError):
+                    # Broken connection: keep reads off it until the next lag check passes
+                    replica.healthy = False
+                self.replica_fallbacks += 1
+                logger.warning("Replica %s read failed, retrying on primary: %s", replica.name, e)
+            except PostgresError as e:
+                replica.stats.record(time.perf_counter() - started, failed=True)
+                logger.error("Database error executing query: %s. Error: %s", query, e)
+                raise
+
+        started = time.perf_counter()
         try:
             async with self.get_connection() as conn:
-                if fetch:
-                    return await conn.fetch(query, *(params or []))
-                else:
-                    await conn.execute(query, *(params or []))
+                result = await self._run(conn, query, params, fetch)
         except PostgresError as e:
-            logger.error(f"Database error executing query: {query}. Error: {str(e)}")
+            self._primary_stats.record(time.perf_counter() - started, failed=True)
+            logger.error("Database error executing query: %s. Error: %s", query, e)
             raise
+        self._primary_stats.record(time.perf_counter() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-pool query counts, errors, latency and pool occupancy"""
+        return {
+            "primary": self._primary_stats.as_dict(self.pool),
+            "replicas": {
+                replica.name: {
+                    "healthy": replica.healthy,
+                    "lag_seconds": replica.lag,
+                    **replica.stats.as_dict(replica.pool),
+                }
+                for replica in self.replicas
+            },
+            "replica_fallbacks": self.replica_fallbacks,
+            "coalescing": {
+                "queries": self.coalesce_leaders,
+                "coalesced": self.coalesced,
+                "cache_hits": self.coalesce_cache_hits,
+                "in_flight": len(self._in_flight),
+            },
+        }
 
     async def close(self):
         """Close all connections in the pool"""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        for replica in self.replicas:
+            if replica.pool and not replica.pool._closed:
+                await replica.pool.close()
+            replica.pool = None
+            replica.healthy = False
         if self.pool and not self.pool._closed:
             await self.pool.close()
             self._is_connected.clear()
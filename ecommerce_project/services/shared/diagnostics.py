@@ -0,0 +1,168 @@
+import os
+import sys
+import hmac
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import Counter
+from typing import Iterable, Optional
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
+from fastapi.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the loop lag histogram buckets; the last bucket is open-ended
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+PROFILE_MAX_SECONDS = 60
+
+def sample_stacks(seconds: float, interval: float, thread_ids: Optional[Iterable[int]] = None) -> Counter:
+    """
+    Sample the Python stacks of other threads every `interval` seconds for `seconds`.
+    Returns collapsed stack ("outer;...;inner") -> number of samples.
+    """
+    wanted = set(thread_ids) if thread_ids else None
+    me = threading.get_ident()
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me or (wanted is not None and thread_id not in wanted):
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+def collapse(counts: Counter) -> str:
+    """Brendan Gregg's collapsed format, readable by flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+def verify_debug_token(request: Request):
+    """Debug endpoints need DEBUG_TOKEN (or API_TOKEN); with neither set they are closed"""
+    token = os.getenv("DEBUG_TOKEN") or os.getenv("API_TOKEN")
+    auth = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(auth.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or missing debug token")
+
+class LoopDiagnostics:
+    """
+    Event loop health for one service:
+      - a task that sleeps LOOP_MONITOR_INTERVAL_MS (default 100) and records how late
+        it wakes up into a lag histogram,
+      - a watchdog thread that logs the loop thread's current stack whenever the loop
+        has not run for LOOP_SLOW_THRESHOLD_MS (default 100), i.e. while a callback blocks,
+      - GET /debug/loop (histogram) and GET /debug/profile?seconds=N (sampling profile
+        as collapsed stacks), both behind verify_debug_token.
+
+    In the lifespan: `diagnostics.start()` on startup, `diagnostics.stop()` on shutdown.
+    """
+
+    def __init__(self, service: str):
+        self.service = service
+        self.interval = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 100)) / 1000
+        self.slow_threshold = float(os.getenv("LOOP_SLOW_THRESHOLD_MS", 100)) / 1000
+        self.buckets = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._profile_lock = asyncio.Lock()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name=f"{self.service}-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self._record(max(0.0, now - expected))
+
+    def _record(self, lag: float):
+        lag_ms = lag * 1000
+        for index, bound in enumerate(LAG_BUCKETS_MS):
+            if lag_ms <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.slow_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.slow_threshold or reported == heartbeat:
+                continue
+            # One report per stall, taken while the blocking code is still on the stack
+            reported = heartbeat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable\n"
+            logger.warning(
+                "Event loop blocked for at least %.0f ms; loop thread stack:\n%s", blocked * 1000, stack.rstrip()
+            )
+
+    def stats(self) -> dict:
+        labels = [f"<={bound}" for bound in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}"]
+        return {
+            "service": self.service,
+            "samples": self.samples,
+            "mean_lag_ms": round(self.total_lag / self.samples * 1000, 3) if self.samples else None,
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "stalls": self.stalls,
+            "histogram_ms": dict(zip(labels, self.buckets)),
+        }
+
+    def install_routes(self, app: FastAPI):
+
+        @app.get("/debug/loop", include_in_schema=False)
+        async def loop_stats(dep=Depends(verify_debug_token)):
+            return self.stats()
+
+        @app.get("/debug/profile", include_in_schema=False, response_class=PlainTextResponse)
+        async def profile(
+            seconds: float = Query(5, gt=0, le=PROFILE_MAX_SECONDS),
+            interval_ms: float = Query(5, ge=1, le=100),
+            threads: str = Query("loop", pattern="^(loop|all)$"),
+            dep=Depends(verify_debug_token)
+        ):
+            """Sample stacks for `seconds` and return them as a .collapsed flamegraph input"""
+            if self._profile_lock.locked():
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running")
+            async with self._profile_lock:
+                thread_ids = None if threads == "all" else [self._loop_thread_id or threading.get_ident()]
+                counts = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000, thread_ids)
+            filename = f"{self.service}-{int(time.time())}.collapsed"
+            return PlainTextResponse(
+                collapse(counts),
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
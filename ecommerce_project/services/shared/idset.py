@@ -0,0 +1,190 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from shared.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+class IdBitmap:
+    """
+    Set of non-negative integer ids stored as one bit per id up to the largest id.
+    SERIAL ids are dense, so this is exact (no false positives, unlike a bloom
+    filter), supports removal, and needs 12.5 MB for 100M ids.
+    """
+
+    def __init__(self):
+        self._bits = bytearray()
+        self._count = 0
+
+    def _ensure(self, id_: int):
+        needed = (id_ >> 3) + 1
+        if needed > len(self._bits):
+            # Grow with some headroom; ids arrive mostly in increasing order
+            self._bits.extend(bytes(needed - len(self._bits) + needed // 8))
+
+    def add(self, id_: int):
+        if id_ < 0:
+            raise ValueError(f"Negative id {id_}")
+        self._ensure(id_)
+        mask = 1 << (id_ & 7)
+        if not self._bits[id_ >> 3] & mask:
+            self._bits[id_ >> 3] |= mask
+            self._count += 1
+
+    def discard(self, id_: int):
+        if id_ in self:
+            self._bits[id_ >> 3] &= ~(1 << (id_ & 7)) & 0xFF
+            self._count -= 1
+
+    def __contains__(self, id_: int) -> bool:
+        return 0 <= id_ and (id_ >> 3) < len(self._bits) and bool(self._bits[id_ >> 3] & (1 << (id_ & 7)))
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+class IdSet:
+    """
+    Valid ids of one table, held in memory for edge validation.
+
+    A full keyset-paginated load fills a fresh bitmap that is swapped in when done.
+    Every `refresh_interval` seconds a delta query on updated_at adds new ids and drops
+    ids whose `active_column` turned false; every `full_reload_interval` seconds a full
+    load also catches hard deletes. An id the bitmap does not know is checked with one
+    point query (it may be newer than the last delta) and, if absent, remembered in a
+    short negative cache so repeated bad ids never reach the database twice in a row.
+
+    contains() returns None until the first load completes so callers can fail open.
+    """
+
+    def __init__(self, db, table: str, active_column: Optional[str] = None, page_size: int = 50_000,
+                 refresh_interval: float = 5.0, full_reload_interval: float = 3600.0,
+                 negative_ttl: float = 5.0, max_point_queries: int = 8):
+        self.db = db
+        self.table = table
+        self.active = active_column or "TRUE"
+        self.page_size = page_size
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self._bitmap: Optional[IdBitmap] = None
+        self._watermark: Optional[datetime] = None
+        self._negative = LRUCache(maxsize=100_000, ttl=negative_ttl)
+        self._point_queries = asyncio.Semaphore(max_point_queries)
+        self._task: Optional[asyncio.Task] = None
+        self.loaded_at: Optional[float] = None
+        self.point_lookups = 0
+        self.rejected = 0
+
+    async def load(self):
+        """Full load into a new bitmap; the current one keeps serving until the swap"""
+        started = time.perf_counter()
+        # Rows changed while the scan runs are newer than this and come in with the next delta
+        watermark = (await self.db.execute_query(
+            f"SELECT max(updated_at) AS ts FROM {self.table}", fetch=True, readonly=True
+        ))[0]["ts"]
+        bitmap = IdBitmap()
+        after_id = 0
+        query = f"SELECT id FROM {self.table} WHERE id > $1 AND {self.active} ORDER BY id LIMIT $2"
+        while True:
+            rows = await self.db.execute_query(query, [after_id, self.page_size], fetch=True, readonly=True)
+            for row in rows:
+                bitmap.add(row["id"])
+            if len(rows) < self.page_size:
+                break
+            after_id = rows[-1]["id"]
+        self._bitmap = bitmap
+        self._watermark = watermark
+        self._negative.clear()
+        self.loaded_at = time.time()
+        logger.info(
+            "Loaded %d %s ids (%d KiB) in %.2fs",
+            len(bitmap), self.table, bitmap.nbytes // 1024, time.perf_counter() - started
+        )
+
+    async def refresh(self):
+        """Apply rows changed since the last load or refresh"""
+        if self._bitmap is None:
+            return
+        # A small overlap covers transactions that committed out of updated_at order
+        since = (self._watermark or datetime.min + timedelta(seconds=5)) - timedelta(seconds=5)
+        last_id = 0
+        query = f"""
+        SELECT id, {self.active} AS active, updated_at FROM {self.table}
+        WHERE (updated_at, id) > ($1, $2)
+        ORDER BY updated_at, id LIMIT $3
+        """
+        while True:
+            rows = await self.db.execute_query(query, [since, last_id, self.page_size], fetch=True, readonly=True)
+            for row in rows:
+                if row["active"]:
+                    self._bitmap.add(row["id"])
+                    self._negative.delete(row["id"])
+                else:
+                    self._bitmap.discard(row["id"])
+            if rows:
+                since, last_id = rows[-1]["updated_at"], rows[-1]["id"]
+                self._watermark = max(self._watermark or since, since)
+            if len(rows) < self.page_size:
+                return
+
+    async def contains(self, id_: int) -> Optional[bool]:
+        if self._bitmap is None:
+            return None
+        if id_ in self._bitmap:
+            return True
+        if self._negative.get(id_):
+            self.rejected += 1
+            return False
+        async with self._point_queries:
+            self.point_lookups += 1
+            rows = await self.db.execute_query(
+                f"SELECT EXISTS (SELECT 1 FROM {self.table} WHERE id = $1 AND {self.active}) AS found",
+                [id_], fetch=True, readonly=True
+            )
+        if rows[0]["found"]:
+            self._bitmap.add(id_)
+            return True
+        self._negative.set(id_, True)
+        self.rejected += 1
+        return False
+
+    async def _run(self):
+        last_full = 0.0
+        while True:
+            try:
+                if self._bitmap is None or time.monotonic() - last_full >= self.full_reload_interval:
+                    await self.load()
+                    last_full = time.monotonic()
+                else:
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Refreshing %s ids failed: %s", self.table, e)
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Load and keep refreshing in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._bitmap is not None,
+            "ids": len(self._bitmap) if self._bitmap is not None else 0,
+            "bytes": self._bitmap.nbytes if self._bitmap is not None else 0,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "point_lookups": self.point_lookups,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Correlation id of the request or message being handled, attached to every record
+correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with correlation id and any `extra` fields"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        cid = getattr(record, "correlation_id", None)
+        if cid:
+            entry["correlation_id"] = cid
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key != "correlation_id":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class CorrelationFilter(logging.Filter):
+    """Stamp the current correlation id on the record in the logging thread"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+class RateSamplingFilter(logging.Filter):
+    """
+    Per-logger token bucket for records below WARNING: each logger may emit at most
+    `rate` such lines per second (with a burst of the same size). Dropped lines are
+    counted and reported as `suppressed` on the next line that gets through.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._buckets = {}  # logger name -> [tokens, last refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(record.name)
+            if bucket is None:
+                bucket = self._buckets[record.name] = [self.rate, now, 0]
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Enqueue the record as-is. The stock QueueHandler formats the message on the
+    calling thread; here formatting (and JSON encoding) happens in the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def configure_logging(service: str, level: Optional[str] = None):
+    """
+    Route all logging through a queue to a background listener thread so the event
+    loop never blocks on stderr. Configured through the environment:
+      LOG_LEVEL (default INFO), LOG_FORMAT json|text (default json),
+      LOG_SAMPLE_RATE: max INFO lines per second per logger (default 50, 0 disables).
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    sample_rate = float(os.getenv("LOG_SAMPLE_RATE", 50))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        stream_handler.setFormatter(JsonFormatter(service))
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    # Sampling runs first so dropped lines cost nothing beyond the filter check
+    queue_handler.addFilter(RateSamplingFilter(sample_rate))
+    queue_handler.addFilter(CorrelationFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+@contextmanager
+def correlation_context(cid: Optional[str]):
+    """Set the correlation id for the duration of a message handler"""
+    token = correlation_id.set(str(cid) if cid is not None else None)
+    try:
+        yield
+    finally:
+        correlation_id.reset(token)
+
+async def correlation_id_middleware(request, call_next):
+    """FastAPI HTTP middleware: take X-Request-ID or generate one, echo it back"""
+    cid = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = correlation_id.set(cid)
+    try:
+        response = await call_next(request)
+    finally:
+        correlation_id.reset(token)
+    response.headers["X-Request-ID"] = cid
+    return response
@@ -0,0 +1,321 @@
+import os
+import time
+import asyncio
+import itertools
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class MessageProcessError(Exception):
+    pass
+
+class InMemoryMessage:
+    """Delivery handed to a consumer callback; mirrors aio_pika.IncomingMessage"""
+
+    def __init__(self, body: bytes, channel: "InMemoryRabbitMQ", queue: "_Queue",
+                 delivery_tag: int, redelivered: bool):
+        self.body = body
+        self.delivery_tag = delivery_tag
+        self.redelivered = redelivered
+        self.routing_key = queue.name
+        self._channel = channel
+        self._queue = queue
+        self.processed = False
+
+    def _check(self):
+        if self.processed:
+            raise MessageProcessError("Message already processed")
+
+    async def ack(self, multiple: bool = False):
+        self._check()
+        self.processed = True
+        self._channel._settle(self.delivery_tag, multiple, requeue=None)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self._check()
+        self.processed = True
+        self._channel._settle(self.delivery_tag, multiple, requeue=requeue)
+
+    async def reject(self, requeue: bool = False):
+        self._check()
+        self.processed = True
+        self._channel._settle(self.delivery_tag, False, requeue=requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, ignore_processed: bool = False):
+        """Ack on success, reject on exception (same contract as aio_pika)"""
+        try:
+            yield self
+            if not ignore_processed and not self.processed:
+                await self.ack()
+        except BaseException:
+            if not ignore_processed and not self.processed:
+                await self.reject(requeue=requeue)
+            raise
+
+class _Queue:
+    def __init__(self, name: str, durable: bool, exclusive: bool = False):
+        self.name = name
+        self.durable = durable
+        self.exclusive = exclusive
+        self.ready: Deque[tuple] = deque()  # (body, redelivered)
+        self.consumers: List["InMemoryRabbitMQ"] = []
+        self._next_consumer = 0
+
+    def pick_consumer(self) -> Optional["InMemoryRabbitMQ"]:
+        """Round-robin over consumers that still have prefetch capacity"""
+        for _ in range(len(self.consumers)):
+            consumer = self.consumers[self._next_consumer % len(self.consumers)]
+            self._next_consumer += 1
+            if consumer._has_capacity():
+                return consumer
+        return None
+
+class InMemoryBroker:
+    """
+    Process-local broker: named durable queues on a default exchange plus fanout
+    exchanges, with per-channel prefetch, ack/nack/requeue and redelivery flags.
+    """
+
+    def __init__(self):
+        self.queues: Dict[str, _Queue] = {}
+        self.exchanges: Dict[str, Set[str]] = {}
+        self._names = itertools.count(1)
+        # Called with (body, routing_key) for every publish to the default exchange
+        self.taps: List[Callable[[bytes, str], None]] = []
+        self.published = 0
+        self.delivered = 0
+
+    def declare_queue(self, name: str, durable: bool = True, exclusive: bool = False) -> _Queue:
+        if not name:
+            name = f"amq.gen-{next(self._names)}"
+        queue = self.queues.get(name)
+        if queue is None:
+            queue = self.queues[name] = _Queue(name, durable, exclusive)
+        return queue
+
+    def declare_exchange(self, name: str):
+        self.exchanges.setdefault(name, set())
+
+    def bind(self, queue: _Queue, exchange_name: str):
+        self.exchanges.setdefault(exchange_name, set()).add(queue.name)
+
+    def delete_queue(self, queue: _Queue):
+        self.queues.pop(queue.name, None)
+        for bound in self.exchanges.values():
+            bound.discard(queue.name)
+
+    def publish(self, body: bytes, exchange_name: Optional[str], routing_key: str):
+        if not exchange_name:
+            for tap in self.taps:
+                tap(body, routing_key)
+        if exchange_name:
+            targets = [self.queues[name] for name in self.exchanges.get(exchange_name, ()) if name in self.queues]
+        else:
+            queue = self.queues.get(routing_key)
+            # Like RabbitMQ, a message routed to a queue nobody declared is dropped
+            targets = [queue] if queue else []
+        for queue in targets:
+            queue.ready.append((body, False))
+            self.published += 1
+            self.dispatch(queue)
+
+    def dispatch(self, queue: _Queue):
+        while queue.ready and queue.consumers:
+            consumer = queue.pick_consumer()
+            if consumer is None:
+                return
+            body, redelivered = queue.ready.popleft()
+            self.delivered += 1
+            consumer._deliver(queue, body, redelivered)
+
+    def restart(self):
+        """
+        Simulate a broker restart: non-durable and exclusive queues disappear, and
+        unacknowledged deliveries on durable queues go back to the queue flagged as
+        redelivered. Consumers of durable queues stay attached, as after a robust reconnect.
+        """
+        for queue in list(self.queues.values()):
+            if not queue.durable or queue.exclusive:
+                self.delete_queue(queue)
+                for consumer in queue.consumers:
+                    consumer._forget(queue)
+                continue
+            for consumer in queue.consumers:
+                for body in consumer._take_unacked(queue):
+                    queue.ready.appendleft((body, True))
+            self.dispatch(queue)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"ready": len(queue.ready), "consumers": len(queue.consumers)}
+            for name, queue in self.queues.items()
+        }
+
+# Shared by every InMemoryRabbitMQ instance in the process
+broker = InMemoryBroker()
+
+class InMemoryRabbitMQ:
+    """
+    Drop-in replacement for shared.rabbitmq.RabbitMQ backed by the in-process broker.
+    Each instance behaves like one channel: it has its own delivery tags and prefetch window.
+    """
+
+    def __init__(self, queue_name, exchange_name=None, prefetch_count=10):
+        self.queue_name = queue_name
+        self.exchange_name = exchange_name
+        self.prefetch_count = prefetch_count
+        self.queue: Optional[_Queue] = None
+        self._is_connected = asyncio.Event()
+        self._callback: Optional[Callable] = None
+        self._delivery_tags = itertools.count(1)
+        self._unacked: Dict[int, tuple] = {}  # delivery_tag -> (queue, body)
+        self._tasks: Set[asyncio.Task] = set()
+        self._taps: List[Callable] = []
+        self._handled = 0
+
+    async def _ensure_connection(self):
+        if self._is_connected.is_set():
+            return
+        if self.exchange_name:
+            broker.declare_exchange(self.exchange_name)
+        else:
+            self.queue = broker.declare_queue(self.queue_name, durable=True)
+        self._is_connected.set()
+        logger.info("Connected to in-memory broker")
+
+    async def publish_message(self, message):
+        await self._ensure_connection()
+        broker.publish(message if isinstance(message, bytes) else message.encode(), self.exchange_name, self.queue_name or "")
+
+    async def start_consuming(self, callback):
+        await self._ensure_connection()
+        if self.exchange_name and self.queue is None:
+            if self.queue_name:
+                self.queue = broker.declare_queue(self.queue_name, durable=True)
+            else:
+                self.queue = broker.declare_queue("", durable=False, exclusive=True)
+            broker.bind(self.queue, self.exchange_name)
+        self._callback = callback
+        self.queue.consumers.append(self)
+        broker.dispatch(self.queue)
+        logger.info("Started consuming messages from %s", self.queue_name or self.exchange_name)
+
+    async def tap(self, callback):
+        """Same contract as RabbitMQ.tap: see every message published to the queue without consuming it"""
+        await self._ensure_connection()
+
+        def on_publish(body, routing_key):
+            if routing_key == self.queue_name:
+                callback(body)
+        self._taps.append(on_publish)
+        broker.taps.append(on_publish)
+
+    async def message_count(self):
+        await self._ensure_connection()
+        queue = broker.queues.get(self.queue_name)
+        return len(queue.ready) if queue else 0
+
+    async def drain(self, timeout=None, flush=None):
+        """Same contract as RabbitMQ.drain: detach, wait for running callbacks, flush"""
+        if timeout is None:
+            timeout = float(os.getenv("RABBITMQ_DRAIN_TIMEOUT", 20))
+        started = time.perf_counter()
+        handled_before = self._handled
+        in_flight_at_start = len(self._tasks)
+        # Detaching is synchronous here, so nothing arrives after the cancel
+        if self.queue is not None and self in self.queue.consumers:
+            self.queue.consumers.remove(self)
+
+        pending = set()
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+
+        flushed = True
+        if flush is not None:
+            try:
+                await flush()
+            except Exception as e:
+                flushed = False
+                logger.error("Drain flush failed: %s", e)
+
+        stats = {
+            "queue": self.queue_name or self.exchange_name,
+            "in_flight_at_start": in_flight_at_start,
+            "completed": self._handled - handled_before,
+            "abandoned": len(pending),
+            "requeued": 0,
+            "timed_out": bool(pending),
+            "flushed": flushed,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info("Drained consumer", extra={"drain": stats})
+        return stats
+
+    async def close(self):
+        if not self._is_connected.is_set():
+            return
+        for tap in self._taps:
+            broker.taps.remove(tap)
+        self._taps.clear()
+        if self.queue is not None:
+            if self in self.queue.consumers:
+                self.queue.consumers.remove(self)
+            # Closing a channel requeues everything it had not acknowledged
+            for body in self._take_unacked(self.queue):
+                self.queue.ready.appendleft((body, True))
+            if self.queue.exclusive:
+                broker.delete_queue(self.queue)
+            else:
+                broker.dispatch(self.queue)
+        self._is_connected.clear()
+        logger.info("Closed in-memory broker channel")
+
+    # Channel internals used by the broker and messages
+
+    def _has_capacity(self) -> bool:
+        return not self.prefetch_count or len(self._unacked) < self.prefetch_count
+
+    def _deliver(self, queue: _Queue, body: bytes, redelivered: bool):
+        tag = next(self._delivery_tags)
+        self._unacked[tag] = (queue, body)
+        message = InMemoryMessage(body, self, queue, tag, redelivered)
+        task = asyncio.get_running_loop().create_task(self._run_callback(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_callback(self, message: InMemoryMessage):
+        try:
+            await self._callback(message)
+        except Exception as e:
+            # aio_pika logs callback errors and leaves settling to the message
+            logger.error("Consumer callback failed: %s", e)
+        finally:
+            self._handled += 1
+
+    def _settle(self, delivery_tag: int, multiple: bool, requeue: Optional[bool]):
+        """requeue=None acks; True/False nacks with or without requeueing"""
+        tags = [t for t in self._unacked if t <= delivery_tag] if multiple else [delivery_tag]
+        touched = set()
+        for tag in sorted(tags, reverse=True):
+            entry = self._unacked.pop(tag, None)
+            if entry is None:
+                continue
+            queue, body = entry
+            touched.add(queue)
+            if requeue:
+                queue.ready.appendleft((body, True))
+        for queue in touched:
+            broker.dispatch(queue)
+
+    def _take_unacked(self, queue: _Queue) -> List[bytes]:
+        tags = sorted((t for t, (q, _) in self._unacked.items() if q is queue), reverse=True)
+        return [self._unacked.pop(tag)[1] for tag in tags]
+
+    def _forget(self, queue: _Queue):
+        self._take_unacked(queue)
+        if self.queue is queue:
+            self.queue = None
@@ -0,0 +1,270 @@
+import os
+import re
+import gzip
+import asyncio
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet archives are optional; gzipped CSV always works
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_ROWS = 50_000
+
+def month_start(day: date, offset: int = 0) -> date:
+    """First day of the month `offset` months away from `day`"""
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+class MonthlyPartitionManager:
+    """
+    Maintains a table declared `PARTITION BY RANGE (<column>)` as monthly partitions
+    named <table>_pYYYYMM. It creates partitions `months_ahead` months in advance,
+    detaches partitions whose whole range is older than `retain_months`, and archives
+    detached partitions to `archive_dir` (gzipped CSV, or Parquet when pyarrow is
+    installed) before dropping them.
+
+    Maintenance takes a session advisory lock, so several replicas can run the same
+    schedule and only one of them does the work at a time.
+    """
+
+    def __init__(self, db, table: str, column: str, months_ahead: int = 3, retain_months: int = 12,
+                 archive_dir: str = "archive", archive_format: str = "csv"):
+        self.db = db
+        self.table = table
+        self.column = column
+        self.months_ahead = months_ahead
+        self.retain_months = retain_months
+        self.archive_dir = archive_dir
+        self.archive_format = archive_format
+        self._lock_key = f"{table}_partition_maintenance"
+        if archive_format == "parquet" and pyarrow is None:
+            logger.warning("pyarrow is not installed; archiving %s as gzipped CSV", table)
+            self.archive_format = "csv"
+
+    def partition_name(self, month: date) -> str:
+        return f"{self.table}_p{month:%Y%m}"
+
+    async def is_partitioned(self) -> bool:
+        # relkind is a "char", which asyncpg returns as bytes; compare it in SQL
+        rows = await self.db.execute_query(
+            "SELECT relkind = 'p' AS partitioned FROM pg_class WHERE oid = to_regclass($1)", [self.table], fetch=True
+        )
+        return bool(rows) and rows[0]["partitioned"]
+
+    async def setup(self, create_sql: str) -> bool:
+        """
+        Create the partitioned table if it does not exist yet, plus its upcoming
+        partitions. Serialized by an advisory lock so concurrently starting workers
+        do not race on the DDL. Returns whether the table is partitioned; an existing
+        unpartitioned table is left alone (see migrate_legacy).
+        """
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", self._lock_key)
+                if await conn.fetchval("SELECT to_regclass($1)", self.table) is None:
+                    await conn.execute(create_sql)
+                    logger.info("Created partitioned table %s", self.table)
+                partitioned = await conn.fetchval(
+                    "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass($1)", self.table
+                )
+                if partitioned:
+                    await self.ensure_partitions(conn)
+        return bool(partitioned)
+
+    async def ensure_partitions(self, conn, today: Optional[date] = None):
+        """Create partitions for the current month and the next `months_ahead` months"""
+        today = today or date.today()
+        for offset in range(self.months_ahead + 1):
+            start = month_start(today, offset)
+            end = month_start(today, offset + 1)
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.partition_name(start)} PARTITION OF {self.table} "
+                f"FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+
+    async def attached_partitions(self, conn) -> Dict[str, Optional[datetime]]:
+        """Attached partition name -> exclusive upper bound (None for unbounded/default)"""
+        rows = await conn.fetch(
+            """
+            SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound, i.inhdetachpending AS pending
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass($1)
+            """,
+            self.table
+        )
+        partitions = {}
+        for row in rows:
+            if row["pending"]:
+                # A DETACH ... CONCURRENTLY was interrupted; complete it
+                await conn.execute(f"ALTER TABLE {self.table} DETACH PARTITION {row['name']} FINALIZE")
+                continue
+            upper = re.search(r"TO \('([^']+)'\)", row["bound"] or "")
+            partitions[row["name"]] = datetime.fromisoformat(upper.group(1)) if upper else None
+        return partitions
+
+    async def detached_partitions(self, conn) -> List[str]:
+        """Standalone tables left behind by detach, waiting to be archived"""
+        rows = await conn.fetch(
+            """
+            SELECT c.relname AS name FROM pg_class c
+            WHERE c.relkind = 'r' AND c.relname ~ $1 AND NOT c.relispartition
+              AND c.relnamespace = 'public'::regnamespace
+            ORDER BY c.relname
+            """,
+            f"^{self.table}_(p[0-9]{{6}}|legacy)$"
+        )
+        return [row["name"] for row in rows]
+
+    async def detach_expired(self, conn, today: Optional[date] = None) -> List[str]:
+        cutoff = datetime.combine(month_start(today or date.today(), -self.retain_months), datetime.min.time())
+        detached = []
+        for name, upper in sorted((await self.attached_partitions(conn)).items()):
+            if upper is None or upper > cutoff:
+                continue
+            # CONCURRENTLY only needs SHARE UPDATE EXCLUSIVE, so writes to other partitions continue
+            await conn.execute(f"ALTER TABLE {self.table} DETACH PARTITION {name} CONCURRENTLY")
+            logger.info("Detached partition %s (upper bound %s)", name, upper)
+            detached.append(name)
+        return detached
+
+    async def archive(self, conn, name: str) -> str:
+        """Export a detached partition, verify the row count, then drop it"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        extension = "parquet" if self.archive_format == "parquet" else "csv.gz"
+        path = os.path.join(self.archive_dir, f"{name}.{extension}")
+        tmp_path = path + ".tmp"
+
+        expected = await conn.fetchval(f"SELECT count(*) FROM {name}")
+        if self.archive_format == "parquet":
+            written = await self._export_parquet(conn, name, tmp_path)
+        else:
+            written = await self._export_csv(conn, name, tmp_path)
+        if written != expected:
+            os.remove(tmp_path)
+            raise RuntimeError(f"Archive of {name} wrote {written} rows, expected {expected}")
+        os.replace(tmp_path, path)
+        await conn.execute(f"DROP TABLE {name}")
+
+        logger.info("Archived %s (%d rows) to %s", name, written, path)
+        return path
+
+    async def _export_csv(self, conn, name: str, path: str) -> int:
+        # COPY runs server-side; compression happens off the event loop
+        with gzip.open(path, "wb") as out:
+            async def sink(chunk: bytes):
+                await asyncio.to_thread(out.write, chunk)
+            await conn.copy_from_table(name, output=sink, format="csv", header=True)
+        # No embedded newlines in these tables, so lines minus the header is the row count
+        def count_rows():
+            with gzip.open(path, "rb") as f:
+                return sum(1 for _ in f) - 1
+        return await asyncio.to_thread(count_rows)
+
+    async def _export_parquet(self, conn, name: str, path: str) -> int:
+        written = 0
+        writer = None
+        try:
+            async with conn.transaction():
+                cursor = await conn.cursor(f"SELECT * FROM {name}")
+                while True:
+                    rows = await cursor.fetch(ARCHIVE_BATCH_ROWS)
+                    if not rows:
+                        break
+                    batch = pyarrow.Table.from_pylist([dict(row) for row in rows])
+                    if writer is None:
+                        writer = pyarrow.parquet.ParquetWriter(path, batch.schema, compression="zstd")
+                    await asyncio.to_thread(writer.write_table, batch)
+                    written += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            pyarrow.parquet.write_table(pyarrow.table({}), path)
+        return written
+
+    async def run_maintenance(self, today: Optional[date] = None) -> dict:
+        """
+        Create upcoming partitions, detach expired ones and archive detached tables.
+        Everything runs on the connection holding the lock, so it needs one pool slot.
+        """
+        async with self.db.get_connection() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext($1))", self._lock_key):
+                return {"skipped": "another instance holds the maintenance lock"}
+            try:
+                await self.ensure_partitions(conn, today)
+                detached = await self.detach_expired(conn, today)
+                archived = []
+                for name in await self.detached_partitions(conn):
+                    try:
+                        archived.append(await self.archive(conn, name))
+                    except Exception as e:
+                        logger.error("Failed to archive partition %s: %s", name, e, exc_info=True)
+                return {"detached": detached, "archived": archived}
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock(hashtext($1))", self._lock_key)
+
+    async def migrate_legacy(self, create_sql: str, legacy_indexes: List[str]):
+        """
+        Turn an existing unpartitioned table into the first partition of a new
+        partitioned table, without rewriting its rows:
+          1. add the partition column with a constant '-infinity' default (metadata only),
+          2. build the (id, column) unique constraint the new primary key needs, with its
+             index built concurrently,
+          3. validate a CHECK constraint matching the legacy range so ATTACH skips its scan,
+          4. in one short transaction: rename to <table>_legacy, drop its old primary
+             key, create the partitioned table, hand the legacy id sequence over to it
+             and attach the legacy table FROM (MINVALUE) TO (this month).
+        Legacy rows keep created_at = '-infinity', so updates to them still land in the
+        legacy partition. Indexes named in `legacy_indexes` (including the old primary
+        key's) are renamed out of the way so the partitioned table can reuse the names.
+        """
+        legacy = f"{self.table}_legacy"
+        cutover = month_start(date.today())
+        await self.db.execute_query(
+            f"ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS {self.column} TIMESTAMP NOT NULL DEFAULT '-infinity'"
+        )
+        await self.db.execute_query(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {legacy}_id_{self.column}_key "
+            f"ON {self.table} (id, {self.column})"
+        )
+        # ATTACH only reuses an index for the parent's primary key if it backs a constraint
+        await self.db.execute_query(
+            f"ALTER TABLE {self.table} ADD CONSTRAINT {legacy}_id_{self.column}_key "
+            f"UNIQUE USING INDEX {legacy}_id_{self.column}_key"
+        )
+        await self.db.execute_query(
+            f"ALTER TABLE {self.table} ADD CONSTRAINT {legacy}_bound "
+            f"CHECK ({self.column} < '{cutover}') NOT VALID"
+        )
+        await self.db.execute_query(f"ALTER TABLE {self.table} VALIDATE CONSTRAINT {legacy}_bound")
+
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                await conn.execute(f"ALTER TABLE {self.table} RENAME TO {legacy}")
+                for index in legacy_indexes:
+                    await conn.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {legacy}_{index}")
+                # A partition cannot carry a primary key of its own; the (id, column)
+                # constraint built above becomes its part of the parent's key
+                primary_key = await conn.fetchval(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = $1::regclass AND contype = 'p'", legacy
+                )
+                if primary_key:
+                    await conn.execute(f"ALTER TABLE {legacy} DROP CONSTRAINT {primary_key}")
+                await conn.execute(create_sql)
+                # The new table keeps drawing ids from the legacy SERIAL sequence; owned by
+                # the legacy column, it would be dropped with the archived legacy partition
+                sequence = await conn.fetchval("SELECT pg_get_serial_sequence($1, 'id')", legacy)
+                if sequence:
+                    await conn.execute(f"ALTER SEQUENCE {sequence} OWNED BY {self.table}.id")
+                await conn.execute(
+                    f"ALTER TABLE {self.table} ATTACH PARTITION {legacy} "
+                    f"FOR VALUES FROM (MINVALUE) TO ('{cutover}')"
+                )
+                await self.ensure_partitions(conn)
+        logger.info("Migrated %s to monthly partitions; existing rows are in %s", self.table, legacy)
@@ -1,17 +1,40 @@
 import os
+import time
+import random
 import asyncio
-from aio_pika import connect_robust, Message, DeliveryMode
+from aio_pika import connect_robust, Message, DeliveryMode, ExchangeType
 import logging
 
 logger = logging.getLogger(__name__)
 
+TRACE_EXCHANGE = "amq.rabbitmq.trace"
+
 class RabbitMQ:
-    def __init__(self, queue_name):
+    def __init__(self, queue_name, exchange_name=None, prefetch_count=10):
+        """
+        :param queue_name: Queue to publish to / consume from via the default exchange
+        :param exchange_name: Optional fanout exchange. Publishers send to the exchange and
+            every consumer gets its own exclusive queue bound to it, so all replicas see
+            every message (used for broadcast events such as stock changes). With a
+            queue_name as well, consumers share that durable queue bound to the exchange
+            instead: events are kept while they are down and each is handled once.
+        :param prefetch_count: Unacknowledged deliveries the broker may push to this channel
+        """
         self.queue_name = queue_name
+        self.exchange_name = exchange_name
+        self.prefetch_count = prefetch_count
         self.connection = None
         self.channel = None
+        self.exchange = None
         self.queue = None
         self._is_connected = asyncio.Event()
+        self._consumer_tag = None
+        self._draining = False
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._handled = 0
+        self._returned = 0
 
     async def _ensure_connection(self):
         if self._is_connected.is_set() and not self.connection.is_closed:
@@ -19,7 +42,8 @@ class RabbitMQ:
 
         retries = 0
         max_retries = 10
-        base_delay = 2
+        base_delay = 0.5
+        max_delay = float(os.getenv("RABBITMQ_RETRY_MAX_DELAY", 5))
         
         while retries < max_retries:
             try:
@@ -28,20 +52,28 @@ class RabbitMQ:
                     timeout=10
                 )
                 self.channel = await self.connection.channel()
-                await self.channel.set_qos(prefetch_count=10)
-                self.queue = await self.channel.declare_queue(
-                    self.queue_name,
-                    durable=True
-                )
+                await self.channel.set_qos(prefetch_count=self.prefetch_count)
+                if self.exchange_name:
+                    self.exchange = await self.channel.declare_exchange(
+                        self.exchange_name,
+                        ExchangeType.FANOUT,
+                        durable=True
+                    )
+                else:
+                    self.exchange = self.channel.default_exchange
+                    self.queue = await self.channel.declare_queue(
+                        self.queue_name,
+                        durable=True
+                    )
                 self._is_connected.set()
                 logger.info("Successfully connected to RabbitMQ")
                 return
             except Exception as e:
                 retries += 1
-                delay = min(base_delay * (2 ** (retries - 1)), 30)
+                delay = random.uniform(0, min(base_delay * (2 ** (retries - 1)), max_delay))
                 logger.warning(
-                    f"Connection attempt {retries}/{max_retries} failed. "
-                    f"Retrying in {delay} seconds. Error: {str(e)}"
+                    "Connection attempt %d/%d failed. Retrying in %.2f seconds. Error: %s",
+                    retries, max_retries, delay, e
                 )
                 await asyncio.sleep(delay)
         
@@ -49,21 +81,135 @@ class RabbitMQ:
 
     async def publish_message(self, message):
         await self._ensure_connection()
-        await self.channel.default_exchange.publish(
+        await self.exchange.publish(
             Message(
-                body=message.encode(),
+                body=message if isinstance(message, bytes) else message.encode(),
                 delivery_mode=DeliveryMode.PERSISTENT
             ),
-            routing_key=self.queue_name,
+            routing_key=self.queue_name or "",
         )
 
     async def start_consuming(self, callback):
         await self._ensure_connection()
-        await self.queue.consume(callback)
-        logger.info(f"Started consuming messages from {self.queue_name}")
+        if self.exchange_name and self.queue is None:
+            if self.queue_name:
+                # Subscriber group: one durable queue shared by every consumer of the group
+                self.queue = await self.channel.declare_queue(self.queue_name, durable=True)
+            else:
+                # Broadcast consumer: private queue that lives as long as this connection
+                self.queue = await self.channel.declare_queue(
+                    "",
+                    exclusive=True,
+                    auto_delete=True
+                )
+            await self.queue.bind(self.exchange)
+        self._draining = False
+        self._consumer_tag = await self.queue.consume(self._track(callback))
+        logger.info("Started consuming messages from %s", self.queue_name or self.exchange_name)
+
+    async def tap(self, callback):
+        """
+        Call callback(body) for every message published to this queue without
+        consuming it, so live consumers are unaffected. Reads RabbitMQ's firehose
+        (amq.rabbitmq.trace), which has to be enabled with `rabbitmqctl trace_on`;
+        only publishes through the default exchange are seen.
+        """
+        await self._ensure_connection()
+        trace = await self.channel.declare_queue("", exclusive=True, auto_delete=True)
+        # Firehose routing keys are publish.<exchange>; the default exchange has an empty name
+        await trace.bind(TRACE_EXCHANGE, routing_key="publish.")
+
+        async def on_trace(message):
+            routing_keys = (message.headers or {}).get("routing_keys") or []
+            if any((key.decode() if isinstance(key, bytes) else key) == self.queue_name for key in routing_keys):
+                callback(message.body)
+        await trace.consume(on_trace, no_ack=True)
+        logger.info("Tapping messages published to %s", self.queue_name)
+
+    async def message_count(self):
+        """Messages ready in the queue (not counting unacknowledged deliveries)"""
+        await self._ensure_connection()
+        queue = await self.channel.declare_queue(self.queue_name, passive=True)
+        return queue.declaration_result.message_count
+
+    def _track(self, callback):
+        """Count in-flight handlers so drain() knows when the consumer is idle"""
+        async def handler(message):
+            if self._draining:
+                # Delivered before the broker saw the cancel: hand it straight back
+                # so another replica picks it up now rather than after our close()
+                self._returned += 1
+                await message.nack(requeue=True)
+                return
+            self._in_flight += 1
+            self._idle.clear()
+            try:
+                return await callback(message)
+            finally:
+                self._in_flight -= 1
+                self._handled += 1
+                if not self._in_flight:
+                    self._idle.set()
+        return handler
+
+    async def drain(self, timeout=None, flush=None):
+        """
+        Stop consuming and let in-flight work finish before close():
+        cancel the consumer tag so the broker stops pushing deliveries, requeue
+        anything that still arrives, wait up to `timeout` seconds
+        (RABBITMQ_DRAIN_TIMEOUT, default 20) for running handlers, then await
+        `flush` (e.g. a batcher that acks in bulk). Publishes are confirmed
+        before publish_message returns, so an idle consumer has nothing pending.
+        Returns drain statistics.
+        """
+        if timeout is None:
+            timeout = float(os.getenv("RABBITMQ_DRAIN_TIMEOUT", 20))
+        started = time.perf_counter()
+        handled_before = self._handled
+        in_flight_at_start = self._in_flight
+        self._draining = True
+
+        if self._consumer_tag and self.queue is not None and self.channel and not self.channel.is_closed:
+            try:
+                await self.queue.cancel(self._consumer_tag)
+            except Exception as e:
+                logger.warning("Failed to cancel consumer %s: %s", self._consumer_tag, e)
+        self._consumer_tag = None
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+
+        flushed = True
+        if flush is not None:
+            try:
+                await flush()
+            except Exception as e:
+                flushed = False
+                logger.error("Drain flush failed: %s", e)
+
+        stats = {
+            "queue": self.queue_name or self.exchange_name,
+            "in_flight_at_start": in_flight_at_start,
+            "completed": self._handled - handled_before,
+            "abandoned": self._in_flight,
+            "requeued": self._returned,
+            "timed_out": timed_out,
+            "flushed": flushed,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info("Drained consumer", extra={"drain": stats})
+        return stats
 
     async def close(self):
         if self.connection and not self.connection.is_closed:
             await self.connection.close()
             self._is_connected.clear()
-            logger.info("Closed RabbitMQ connection")
\ No newline at end of file
+            logger.info("Closed RabbitMQ connection")
+
+# Local load tests and profiling can run without a broker: BROKER_TRANSPORT=memory
+# swaps in the in-process stand-in behind the same interface.
+if os.getenv("BROKER_TRANSPORT", "amqp").lower() == "memory":
+    from shared.memory_broker import InMemoryRabbitMQ as RabbitMQ  # noqa: F811
@@ -12,12 +12,35 @@ class RedisUtil:
     def set_key(self, key, value, ttl=3600):
         self.client.set(key, value, ex=ttl)
 
+    def add_key(self, key, value, ttl=3600):
+        """Set key only if it does not exist; returns whether it was set"""
+        return bool(self.client.set(key, value, ex=ttl, nx=True))
+
     def get_key(self, key):
         return self.client.get(key)
 
     def delete_key(self, key):
         self.client.delete(key)
 
+    def get_many(self, keys):
+        """Fetch several keys in one round trip; missing keys come back as None"""
+        if not keys:
+            return []
+        return self.client.mget(keys)
+
+    def set_many(self, mapping, ttl=3600):
+        """Set several keys with the same TTL in one pipelined round trip"""
+        if not mapping:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ttl)
+        pipe.execute()
+
+    def delete_keys(self, *keys):
+        if keys:
+            self.client.delete(*keys)
+
     def get_keys_by_pattern(self, pattern):
         return self.client.keys(pattern)
 
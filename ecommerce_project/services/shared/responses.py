@@ -0,0 +1,54 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Same output through the stdlib encoder, just slower
+    orjson = None
+
+# int dict keys become strings, as the stdlib encoder does
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+def _default(value: Any):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # As FastAPI's jsonable_encoder renders NUMERIC columns: whole values as ints
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON bytes, in the form Starlette's JSONResponse would produce"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+def with_fields(encoded: bytes, **fields: Any) -> bytes:
+    """Add fields to an already encoded JSON object without decoding it"""
+    if not fields:
+        return encoded
+    extra = dumps(fields)
+    if encoded == b"{}":
+        return extra
+    return encoded[:-1] + b"," + extra[1:]
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class for the services: renders with orjson when installed.
+
+    Returning an instance from an endpoint skips FastAPI's response_model validation
+    and jsonable_encoder pass, so do that only for payloads the service built itself
+    from plain dicts/lists/str/int/datetime. Bytes content is sent as-is, for bodies
+    that are already encoded JSON (a cached entry, a broker message).
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
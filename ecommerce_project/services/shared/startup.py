@@ -0,0 +1,138 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+from fastapi import FastAPI, HTTPException
+
+logger = logging.getLogger(__name__)
+
+class _Step:
+    def __init__(self, name: str, start: Callable[[], Awaitable], after: Iterable[str], required: bool):
+        self.name = name
+        self.start = start
+        self.after = list(after)
+        self.required = required
+        self.done = asyncio.Event()
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+
+class StartupOrchestrator:
+    """
+    Runs a service's startup steps (DB pool, broker connections, consumers, warm-ups)
+    concurrently in the background and tracks readiness separately from liveness.
+    Steps only wait for the steps they list in `after`, so independent dependencies
+    such as the database and the broker connect in parallel.
+
+        startup = StartupOrchestrator("inventory")
+        startup.add("database", db._ensure_connection)
+        startup.add("rabbitmq", rabbitmq._ensure_connection)
+        startup.add("consumer", start_consumer, after=["database", "rabbitmq"])
+        startup.install_routes(app)   # GET /livez, GET /readyz
+
+    In the lifespan: `await startup.start()` before yield, `await startup.stop()` after.
+    """
+
+    def __init__(self, service: str):
+        self.service = service
+        self._steps: Dict[str, _Step] = {}
+        self._tasks = []
+        self._started_at: Optional[float] = None
+        self.ready = asyncio.Event()
+
+    def add(self, name: str, start: Callable[[], Awaitable], after: Iterable[str] = (), required: bool = True):
+        """Register a startup step; `start` is called with no arguments"""
+        self._steps[name] = _Step(name, start, after, required)
+
+    async def _run_step(self, step: _Step):
+        for dependency in step.after:
+            await self._steps[dependency].done.wait()
+            if self._steps[dependency].status != "ready":
+                step.status = "skipped"
+                step.error = f"dependency {dependency} {self._steps[dependency].status}"
+                step.done.set()
+                return
+
+        step.status = "starting"
+        step.started_at = time.perf_counter()
+        try:
+            await step.start()
+            step.status = "ready"
+        except asyncio.CancelledError:
+            step.status = "cancelled"
+            raise
+        except Exception as e:
+            step.status = "failed"
+            step.error = str(e)
+            logger.error("Startup step %s failed: %s", step.name, e, exc_info=True)
+        finally:
+            step.duration = time.perf_counter() - step.started_at
+            step.done.set()
+
+        logger.info("Startup step %s %s in %.3fs", step.name, step.status, step.duration)
+        if all(s.status == "ready" for s in self._steps.values() if s.required):
+            self.ready.set()
+            logger.info(
+                "%s ready in %.3fs", self.service, time.perf_counter() - self._started_at,
+                extra={"startup": self.timings()}
+            )
+
+    async def start(self):
+        """Launch every step in the background and return immediately"""
+        self._started_at = time.perf_counter()
+        if not any(step.required for step in self._steps.values()):
+            self.ready.set()
+        self._tasks = [asyncio.create_task(self._run_step(step)) for step in self._steps.values()]
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self):
+        """Cancel steps that are still running (e.g. retry loops during shutdown)"""
+        for task in self._tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    @property
+    def failed(self) -> bool:
+        return any(s.status in ("failed", "skipped") for s in self._steps.values() if s.required)
+
+    def timings(self) -> Dict[str, Optional[float]]:
+        return {name: step.duration for name, step in self._steps.items()}
+
+    def report(self) -> dict:
+        return {
+            "service": self.service,
+            "ready": self.ready.is_set(),
+            "dependencies": {
+                name: {
+                    "status": step.status,
+                    "required": step.required,
+                    "seconds": round(step.duration, 3) if step.duration is not None else None,
+                    **({"error": step.error} if step.error else {}),
+                }
+                for name, step in self._steps.items()
+            },
+        }
+
+    def install_routes(self, app: FastAPI):
+        """Add unauthenticated probe endpoints: /livez (process is healthy) and /readyz"""
+
+        @app.get("/livez", include_in_schema=False)
+        async def liveness():
+            # A required dependency that gave up retrying will not recover on its own
+            if self.failed:
+                raise HTTPException(status_code=503, detail=self.report())
+            return {"status": "alive"}
+
+        @app.get("/readyz", include_in_schema=False)
+        async def readiness():
+            if not self.ready.is_set():
+                raise HTTPException(status_code=503, detail=self.report(), headers={"Retry-After": "1"})
+            return self.report()
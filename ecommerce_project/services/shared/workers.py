@@ -0,0 +1,182 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import logging
+import multiprocessing
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# WORKER_ROLE as seen inside a worker process
+ROLE_ALL = "all"            # serves HTTP and runs message consumers (single-process default)
+ROLE_HTTP = "http"          # serves HTTP only
+ROLE_CONSUMER = "consumer"  # runs consumers only, no listening socket
+
+def worker_role() -> str:
+    return os.getenv("WORKER_ROLE", ROLE_ALL).lower()
+
+def runs_consumers() -> bool:
+    """Whether this process should start queue consumers"""
+    return worker_role() != ROLE_HTTP
+
+def is_primary_worker() -> bool:
+    """True in exactly one process per service instance; use it for one-off work such as DDL"""
+    return int(os.getenv("WORKER_INDEX", 0)) == 0
+
+def plan_pool_sizes(workers: int) -> Tuple[int, int]:
+    """
+    Split the instance's database connection budget evenly across its workers.
+    DB_CONNECTION_BUDGET is the most connections all workers together may hold
+    (defaults to DB_POOL_MAX_SIZE, so adding workers never adds connections).
+    Returns the per-worker (min_size, max_size).
+    """
+    budget = int(os.getenv("DB_CONNECTION_BUDGET", os.getenv("DB_POOL_MAX_SIZE", 10)))
+    if budget < workers:
+        raise ValueError(f"DB_CONNECTION_BUDGET={budget} cannot give {workers} workers a connection each")
+    max_size = budget // workers
+    min_size = min(int(os.getenv("DB_POOL_MIN_SIZE", 1)), max_size)
+    return min_size, max_size
+
+def _listen_socket(host: str, port: int, reuse_port: bool) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def _serve_http(app_path: str, host: str, port: int, sock: Optional[socket.socket]):
+    import uvicorn
+
+    if sock is None:
+        # SO_REUSEPORT: every worker owns a socket and the kernel balances connections
+        sock = _listen_socket(host, port, reuse_port=True)
+    config = uvicorn.Config(app_path, host=host, port=port, log_level="info")
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+    except KeyboardInterrupt:
+        # uvicorn re-raises Ctrl-C after its graceful shutdown has completed
+        pass
+
+async def _consume_until_stopped(app):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    # The app's lifespan starts the consumers on startup and drains them on shutdown
+    async with app.router.lifespan_context(app):
+        await stop.wait()
+
+def _run_consumer(app_path: str):
+    from uvicorn.importer import import_from_string
+
+    asyncio.run(_consume_until_stopped(import_from_string(app_path)))
+
+class WorkerSupervisor:
+    """
+    Starts the service's worker processes, restarts any that die and forwards
+    SIGTERM/SIGINT so every worker drains through its own lifespan.
+    Workers are spawned (not forked), so each one imports the app fresh and
+    opens its own asyncpg pool and AMQP connections.
+    """
+
+    def __init__(self, app_path: str, host: str, port: int, http_workers: int, consumer_workers: int):
+        self.app_path = app_path
+        self.host = host
+        self.port = port
+        self.http_workers = http_workers
+        self.consumer_workers = consumer_workers
+        self.pool_sizes = plan_pool_sizes(http_workers + consumer_workers)
+        self._ctx = multiprocessing.get_context("spawn")
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._stopping = False
+        self._shared_socket: Optional[socket.socket] = None
+        if not hasattr(socket, "SO_REUSEPORT"):
+            # Fall back to one inherited listening socket shared by all HTTP workers
+            self._shared_socket = _listen_socket(host, port, reuse_port=False)
+
+    def _role(self, index: int) -> str:
+        if index >= self.http_workers:
+            return ROLE_CONSUMER
+        return ROLE_HTTP if self.consumer_workers else ROLE_ALL
+
+    def _start(self, index: int):
+        role = self._role(index)
+        min_size, max_size = self.pool_sizes
+        # Spawned children copy the environment at start(), and services read
+        # these when their module-level Database() is created
+        os.environ.update({
+            "WORKER_ROLE": role,
+            "WORKER_INDEX": str(index),
+            "DB_POOL_MIN_SIZE": str(min_size),
+            "DB_POOL_MAX_SIZE": str(max_size),
+        })
+        if role == ROLE_CONSUMER:
+            process = self._ctx.Process(target=_run_consumer, args=(self.app_path,), name=f"consumer-{index}")
+        else:
+            process = self._ctx.Process(
+                target=_serve_http,
+                args=(self.app_path, self.host, self.port, self._shared_socket),
+                name=f"http-{index}",
+            )
+        process.start()
+        self._processes[index] = process
+        logger.info("Started worker %d (%s) pid=%d db_pool=%d-%d", index, role, process.pid, min_size, max_size)
+
+    def _handle_signal(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        signal.signal(signal.SIGINT, self._handle_signal)
+        logger.info(
+            "Running %s with %d HTTP and %d consumer workers on port %s",
+            self.app_path, self.http_workers, self.consumer_workers, self.port
+        )
+        for index in range(self.http_workers + self.consumer_workers):
+            self._start(index)
+
+        while not self._stopping:
+            time.sleep(0.5)
+            for index, process in list(self._processes.items()):
+                if not process.is_alive() and not self._stopping:
+                    logger.error("Worker %d exited with code %s; restarting", index, process.exitcode)
+                    time.sleep(1)
+                    self._start(index)
+
+        self.stop()
+
+    def stop(self):
+        # Workers drain consumers on shutdown, so give them the drain timeout plus headroom
+        grace = float(os.getenv("RABBITMQ_DRAIN_TIMEOUT", 20)) + 10
+        processes: List[multiprocessing.Process] = list(self._processes.values())
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Worker %s did not exit in %.0fs; killing it", process.name, grace)
+                process.kill()
+                process.join()
+        logger.info("All workers stopped")
+
+def run_workers(app_path: str, port: int, host: str = "0.0.0.0"):
+    """
+    Entry point for a service's __main__. WEB_WORKERS (default 1) HTTP workers
+    share the port; CONSUMER_WORKERS (default 0) extra processes only consume,
+    in which case HTTP workers stop consuming. With the defaults this is a
+    plain single-process uvicorn run.
+    """
+    http_workers = int(os.getenv("WEB_WORKERS", 1))
+    consumer_workers = int(os.getenv("CONSUMER_WORKERS", 0))
+    if http_workers <= 1 and consumer_workers <= 0:
+        import uvicorn
+        uvicorn.run(app_path, host=host, port=port, log_level="info")
+        return
+    WorkerSupervisor(app_path, host, port, max(1, http_workers), max(0, consumer_workers)).run()
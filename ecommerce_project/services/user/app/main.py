@@ -1,6 +1,8 @@
 # Main application file for user service
 import sys
 import os
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from dotenv import load_dotenv
 
@@ -12,13 +14,77 @@ shared_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../sha
 sys.path.append(shared_path)
 
 from shared.rabbitmq import RabbitMQ
+from shared.database import Database
+from shared.log_config import configure_logging
+from shared.startup import StartupOrchestrator
+from shared.responses import FastJSONResponse
+from shared.diagnostics import LoopDiagnostics
+from shared.workers import run_workers, is_primary_worker
 
-app = FastAPI()
+configure_logging("user")
+logger = logging.getLogger(__name__)
+
+db = Database()
+
+# The gateway's user id set refreshes with a keyset scan on (updated_at, id) that
+# also reads is_active, so the index covers it
+USER_INDEXES = {
+    "users_updated_at_id_idx": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS users_updated_at_id_idx
+        ON users (updated_at, id) INCLUDE (is_active)
+    """,
+}
+
+async def ensure_indexes():
+    """Create the user indexes and verify they are valid.
+    A failed CREATE INDEX CONCURRENTLY leaves an invalid index behind, which
+    IF NOT EXISTS would skip, so invalid indexes are dropped and rebuilt."""
+    query = """
+    SELECT c.relname AS name, i.indisvalid AS valid
+    FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = ANY($1::text[])
+    """
+    names = list(USER_INDEXES)
+    for attempt in range(2):
+        rows = await db.execute_query(query, [names], fetch=True)
+        state = {row["name"]: row["valid"] for row in rows}
+        pending = [name for name in names if not state.get(name)]
+        if not pending:
+            logger.info("User indexes verified: %s", ", ".join(names))
+            return
+        for name in pending:
+            if name in state:
+                logger.warning("Index %s is invalid; rebuilding", name)
+                await db.execute_query(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            logger.info("Creating index %s...", name)
+            await db.execute_query(USER_INDEXES[name])
+    raise RuntimeError(f"User indexes could not be created: {', '.join(pending)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    diagnostics.start()
+    await startup.start()
+    try:
+        yield
+    finally:
+        await startup.stop()
+        diagnostics.stop()
+        await db.close()
+
+diagnostics = LoopDiagnostics("user")
+startup = StartupOrchestrator("user")
+startup.add("database", db._ensure_connection)
+# Only one worker per instance runs the DDL; a slow build must not hold back readiness
+if is_primary_worker():
+    startup.add("indexes", ensure_indexes, after=["database"], required=False)
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+startup.install_routes(app)
+diagnostics.install_routes(app)
 
 @app.get("/status")
 def status():
     return {"status": "User service is running"}
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5005)
+    run_workers("app.main:app", port=int(os.getenv("PORT", 5005)))
@@ -0,0 +1,317 @@
+"""
+Unified synthetic data generator for load tests.
+
+Rows are generated in vectorized chunks with numpy, streamed into Postgres
+with COPY FROM STDIN (binary or CSV) and spread over a process pool. Every
+chunk is seeded from (seed, table, chunk index), so the same arguments
+always produce the same data regardless of the number of workers.
+
+Examples:
+    python synthetic_data.py users --rows 10000000 --workers 8
+    python synthetic_data.py products --rows 1000000 --format csv
+    python synthetic_data.py orders --rows 100000000 --chunk-size 200000
+"""
+import argparse
+import importlib
+import io
+import itertools
+import os
+import struct
+import time
+import zlib
+from datetime import datetime, timezone
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Database connection details
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME", "postgres"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", ""),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5432"),
+}
+
+# Table name -> module providing TABLE, COLUMNS and generate_chunk()
+TABLE_MODULES = {
+    "products": "synthetic_data_products",
+    "users": "synthetic_data_users",
+    "orders": "synthetic_data_orders",
+}
+
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+
+# Fixed-width binary encodings: pgtype -> (numpy dtype, field length)
+_BINARY_FIXED = {
+    "int4": (">i4", 4),
+    "int8": (">i8", 8),
+    "bool": ("u1", 1),
+    "timestamp": (">i8", 8),
+}
+
+
+def get_table(name):
+    """Import the generator module for a table"""
+    return importlib.import_module(TABLE_MODULES[name])
+
+
+def load_vocabulary():
+    """Word list used for names; Faker's lorem list keeps output deterministic"""
+    from faker.providers.lorem.en_US import Provider
+    return np.array(sorted(set(Provider.word_list)))
+
+
+def chunk_rng(seed, table, chunk_index):
+    """Independent, reproducible random stream for one chunk"""
+    return np.random.default_rng([seed, zlib.crc32(table.encode()), chunk_index])
+
+
+def random_timestamps(rng, as_of, count, max_age_days, min_age_days=0):
+    """Timestamps uniformly spread between max_age_days and min_age_days before as_of"""
+    ages = rng.integers(min_age_days * 86_400, max_age_days * 86_400, size=count)
+    return as_of - ages.astype("timedelta64[s]")
+
+
+def encode_csv(columns, chunk):
+    """Encode a chunk as CSV for COPY ... WITH (FORMAT csv)"""
+    frame = pd.DataFrame({name: chunk[name] for name, _ in columns})
+    buf = io.StringIO()
+    frame.to_csv(buf, header=False, index=False, date_format="%Y-%m-%d %H:%M:%S.%f")
+    buf.seek(0)
+    return buf
+
+
+def _binary_fields(pgtype, values):
+    """Encode one column into a list of length-prefixed binary fields"""
+    if pgtype == "text":
+        encoded = [value.encode() for value in values]
+        return [struct.pack(">i", len(value)) + value for value in encoded]
+
+    dtype, width = _BINARY_FIXED[pgtype]
+    if pgtype == "timestamp":
+        values = (values.astype("datetime64[us]") - PG_EPOCH).astype(np.int64)
+    packed = np.empty(len(values), dtype=[("len", ">i4"), ("value", dtype)])
+    packed["len"] = width
+    packed["value"] = values
+    raw = packed.tobytes()
+    step = 4 + width
+    return [raw[i:i + step] for i in range(0, len(raw), step)]
+
+
+def encode_binary(columns, chunk):
+    """Encode a chunk in the PGCOPY binary format"""
+    fields = [_binary_fields(pgtype, chunk[name]) for name, pgtype in columns]
+    count = len(fields[0]) if fields else 0
+    field_count = itertools.repeat(struct.pack(">h", len(columns)), count)
+    buf = io.BytesIO()
+    buf.write(PGCOPY_HEADER)
+    buf.write(b"".join(itertools.chain.from_iterable(zip(field_count, *fields))))
+    buf.write(PGCOPY_TRAILER)
+    buf.seek(0)
+    return buf
+
+
+def copy_chunk(cursor, table, columns, chunk, fmt):
+    """Stream a generated chunk into Postgres with COPY FROM STDIN"""
+    column_list = ", ".join(name for name, _ in columns)
+    if fmt == "binary":
+        buf = encode_binary(columns, chunk)
+        query = f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT binary)"
+    else:
+        buf = encode_csv(columns, chunk)
+        query = f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+    cursor.copy_expert(query, buf)
+
+
+# Per-process state, set up by the pool initializer
+_worker = {}
+
+
+def _init_worker(options):
+    _worker["options"] = options
+    _worker["conn"] = None if options["dry_run"] else psycopg2.connect(**DB_CONFIG)
+
+
+def _run_chunk(task):
+    """Generate one chunk and load it; returns per-stage timings"""
+    table_name, chunk_index, start_id, count = task
+    options = _worker["options"]
+    module = get_table(table_name)
+    rng = chunk_rng(options["seed"], table_name, chunk_index)
+
+    started = time.perf_counter()
+    chunk = module.generate_chunk(rng, start_id, count, options)
+    generated = time.perf_counter()
+    columns = options.get("columns") or module.COLUMNS
+
+    if options["dry_run"]:
+        if options["format"] == "binary":
+            encode_binary(columns, chunk)
+        else:
+            encode_csv(columns, chunk)
+    else:
+        conn = _worker["conn"]
+        with conn.cursor() as cursor:
+            copy_chunk(cursor, module.TABLE, columns, chunk, options["format"])
+        conn.commit()
+    loaded = time.perf_counter()
+
+    return count, generated - started, loaded - generated, chunk.get("_stages", {})
+
+
+def _max_id(table):
+    with psycopg2.connect(**DB_CONFIG) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+            return cursor.fetchone()[0]
+
+
+def _truncate(table):
+    with psycopg2.connect(**DB_CONFIG) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {table}")
+        connection.commit()
+
+
+def _prepare_table(module, options):
+    """
+    Run the module's prepare_table() hook, if any, and return the COLUMNS the table
+    actually has (a legacy unpartitioned orders table has no created_at)
+    """
+    with psycopg2.connect(**DB_CONFIG) as connection:
+        with connection.cursor() as cursor:
+            if hasattr(module, "prepare_table"):
+                module.prepare_table(cursor, options)
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_name = %s AND table_schema = current_schema()",
+                (module.TABLE,)
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+        connection.commit()
+    return [column for column in module.COLUMNS if column[0] in existing]
+
+
+def _sync_sequence(table):
+    """Move the SERIAL sequence past the explicitly generated ids"""
+    with psycopg2.connect(**DB_CONFIG) as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"GREATEST((SELECT MAX(id) FROM {table}), 1))"
+            )
+        connection.commit()
+
+
+def generate(table_name, rows, chunk_size=50_000, workers=None, fmt="binary", seed=0,
+             start_id=1, as_of=None, truncate=False, dry_run=False, **table_options):
+    """Generate rows for a table and stream them into Postgres"""
+    module = get_table(table_name)
+    as_of = as_of or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    options = {
+        "seed": seed,
+        "format": fmt,
+        "dry_run": dry_run,
+        "as_of": np.datetime64(as_of, "s"),
+        **table_options,
+    }
+    if hasattr(module, "resolve_options"):
+        module.resolve_options(options, _max_id if not dry_run else None)
+
+    if truncate and not dry_run:
+        _truncate(module.TABLE)
+    if not dry_run:
+        options["columns"] = _prepare_table(module, options)
+
+    tasks = [
+        (table_name, index, start_id + offset, min(chunk_size, rows - offset))
+        for index, offset in enumerate(range(0, rows, chunk_size))
+    ]
+
+    print(f"Generating {rows} {table_name} in {len(tasks)} chunks "
+          f"({fmt}, seed={seed}, as_of={as_of}{', dry run' if dry_run else ''})")
+    started = time.perf_counter()
+    done = 0
+    gen_seconds = copy_seconds = 0.0
+    stage_seconds = {}
+    with Pool(processes=workers, initializer=_init_worker, initargs=(options,)) as pool:
+        for count, gen_time, copy_time, stages in pool.imap_unordered(_run_chunk, tasks):
+            done += count
+            gen_seconds += gen_time
+            copy_seconds += copy_time
+            for stage, seconds in stages.items():
+                stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+            elapsed = time.perf_counter() - started
+            print(f"  {done}/{rows} rows ({done / elapsed:,.0f} rows/s)", end="\r", flush=True)
+
+    elapsed = time.perf_counter() - started
+    verb = "Generated" if dry_run else "Inserted"
+    print(f"\n{verb} {done} rows into {table_name} in {elapsed:.1f}s ({done / elapsed:,.0f} rows/s)")
+    # Stage times are summed over workers, so report per-worker-second throughput
+    print(f"  generate: {gen_seconds:.1f}s ({done / max(gen_seconds, 1e-9):,.0f} rows/s per worker)")
+    for stage, seconds in stage_seconds.items():
+        print(f"    {stage}: {seconds:.1f}s ({done / max(seconds, 1e-9):,.0f} rows/s per worker)")
+    label = "encode" if dry_run else "copy"
+    print(f"  {label}: {copy_seconds:.1f}s ({done / max(copy_seconds, 1e-9):,.0f} rows/s per worker)")
+
+    if not dry_run:
+        _sync_sequence(module.TABLE)
+    return done
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate synthetic load-test data")
+    parser.add_argument("table", choices=sorted(TABLE_MODULES))
+    parser.add_argument("--rows", type=int, default=100, help="Number of rows to generate")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="Rows per generated chunk")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Generator processes")
+    parser.add_argument("--format", choices=["binary", "csv"], default="binary", help="COPY format")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for reproducible output")
+    parser.add_argument("--start-id", type=int, default=1, help="First id to generate")
+    parser.add_argument("--as-of", help="Reference date for timestamps (YYYY-MM-DD, default today)")
+    parser.add_argument("--truncate", action="store_true", help="Truncate the table before loading")
+    parser.add_argument("--dry-run", action="store_true", help="Generate and encode without a database")
+    parser.add_argument("--max-product-id", type=int, help="Orders: highest product id (default MAX(id) of products)")
+    parser.add_argument("--max-user-id", type=int, help="Orders: highest user id (default MAX(id) of users)")
+    parser.add_argument("--password-scheme", choices=["sha256", "pbkdf2", "scrypt"], default="sha256",
+                        help="Users: password hash scheme")
+    parser.add_argument("--kdf-iterations", type=int, default=100_000, help="Users: PBKDF2 iterations")
+    parser.add_argument("--distinct-passwords", type=int, default=1000,
+                        help="Users: size of the pre-hashed password pool (0 hashes every user)")
+    parser.add_argument("--hash-workers", type=int, help="Users: processes hashing the password pool")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    generate(
+        args.table,
+        args.rows,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        fmt=args.format,
+        seed=args.seed,
+        start_id=args.start_id,
+        as_of=args.as_of,
+        truncate=args.truncate,
+        dry_run=args.dry_run,
+        max_product_id=args.max_product_id,
+        max_user_id=args.max_user_id,
+        password_scheme=args.password_scheme,
+        kdf_iterations=args.kdf_iterations,
+        distinct_passwords=args.distinct_passwords,
+        hash_workers=args.hash_workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
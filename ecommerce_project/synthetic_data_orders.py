@@ -0,0 +1,94 @@
+"""
+Synthetic order history matching the order service's orders table.
+
+Product ids follow a Zipf distribution so a few hot products receive most
+orders, like real traffic. Users and products must already exist.
+
+    python synthetic_data_orders.py --rows 100000000
+"""
+import sys
+
+import numpy as np
+import psycopg2.errors
+
+from synthetic_data import random_timestamps
+
+TABLE = "orders"
+COLUMNS = [
+    ("id", "int4"),
+    ("product_id", "int4"),
+    ("user_id", "int4"),
+    ("quantity", "int4"),
+    ("status", "text"),
+    ("updated_at", "timestamp"),
+    ("created_at", "timestamp"),
+]
+
+STATUSES = np.array(["received", "processing", "completed", "cancelled"])
+STATUS_WEIGHTS = [0.05, 0.10, 0.75, 0.10]
+
+# Zipf exponent for product popularity; lower is flatter
+PRODUCT_SKEW = 1.3
+
+# Orders are created up to MAX_AGE_DAYS before --as-of and last updated up to
+# MAX_UPDATE_DAYS after that
+MAX_AGE_DAYS = 365
+MAX_UPDATE_DAYS = 7
+
+
+def resolve_options(options, max_id):
+    """Fill in product/user id ranges from the database when not given"""
+    for option, table in (("max_product_id", "products"), ("max_user_id", "users")):
+        if options.get(option):
+            continue
+        if max_id is None:
+            raise ValueError(f"--{option.replace('_', '-')} is required with --dry-run")
+        options[option] = max_id(table)
+        if not options[option]:
+            raise ValueError(f"Table {table} is empty; generate it before orders")
+
+
+def prepare_table(cursor, options):
+    """
+    Give a partitioned orders table the monthly partitions the generated created_at
+    values fall into, named like the order service's. A month already covered by
+    another partition, such as a migrated legacy one, is left to that partition.
+    """
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (TABLE,))
+    row = cursor.fetchone()
+    if not row or not row[0]:
+        return
+    first = (options["as_of"] - np.timedelta64(MAX_AGE_DAYS, "D")).astype("datetime64[M]")
+    for month in np.arange(first, options["as_of"].astype("datetime64[M]") + 1):
+        cursor.execute("SAVEPOINT partition")
+        try:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE}_p{month.astype(object):%Y%m} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{month}-01') TO ('{month + 1}-01')"
+            )
+        except psycopg2.errors.InvalidObjectDefinition:
+            cursor.execute("ROLLBACK TO SAVEPOINT partition")
+        else:
+            cursor.execute("RELEASE SAVEPOINT partition")
+
+
+def generate_chunk(rng, start_id, count, options):
+    """Generate `count` orders starting at `start_id` as column arrays"""
+    max_product_id = options["max_product_id"]
+    product_ids = (rng.zipf(PRODUCT_SKEW, size=count) - 1) % max_product_id + 1
+    created_at = random_timestamps(rng, options["as_of"], count, max_age_days=MAX_AGE_DAYS)
+    updated_at = created_at + rng.integers(0, MAX_UPDATE_DAYS * 86_400, size=count).astype("timedelta64[s]")
+    return {
+        "id": np.arange(start_id, start_id + count, dtype=np.int64),
+        "product_id": product_ids,
+        "user_id": rng.integers(1, options["max_user_id"] + 1, size=count),
+        "quantity": rng.integers(1, 6, size=count),
+        "status": STATUSES[rng.choice(len(STATUSES), size=count, p=STATUS_WEIGHTS)],
+        "updated_at": np.minimum(updated_at, options["as_of"]),
+        "created_at": created_at,
+    }
+
+
+if __name__ == "__main__":
+    from synthetic_data import main
+    main([TABLE, *sys.argv[1:]])
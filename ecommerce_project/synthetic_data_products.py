@@ -1,73 +1,41 @@
-import pandas as pd
-import psycopg2
-from psycopg2.extras import execute_values
-from datetime import datetime, timedelta
-import random
-from dotenv import load_dotenv
-import os
-from faker import Faker
+"""
+Synthetic rows for the products table.
 
-# Load environment variables from .env file
-load_dotenv()
+    python synthetic_data_products.py --rows 1000000
+"""
+import sys
 
-# Database connection details
-DB_CONFIG = {
-    "dbname": os.getenv("DB_NAME", "postgres"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", ""),
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": os.getenv("DB_PORT", "5432"),
-}
+import numpy as np
 
-# Number of synthetic products to generate
-NUM_PRODUCTS = 100
+from synthetic_data import load_vocabulary, random_timestamps
 
-# Initialize Faker
-fake = Faker()
+TABLE = "products"
+COLUMNS = [
+    ("id", "int4"),
+    ("name", "text"),
+    ("stock", "int4"),
+    ("updated_at", "timestamp"),
+]
 
-# Generate synthetic product data
-product_data = []
-for _ in range(NUM_PRODUCTS):
-    name = fake.unique.word().capitalize() + " " + fake.unique.word().capitalize()
-    stock = random.randint(0, 1000)
-    updated_at = datetime.now() - timedelta(days=random.randint(0, 60))
-    product_data.append({
-        "name": name,
-        "stock": stock,
-        "updated_at": updated_at
-    })
+_vocabulary = None
 
-# Create DataFrame for products
-product_df = pd.DataFrame(product_data)
 
-# Insert synthetic product data into the database
-def insert_data(table_name, data):
-    """Insert data into the specified table"""
-    try:
-        with psycopg2.connect(**DB_CONFIG) as connection:
-            with connection.cursor() as cursor:
-                # Convert column names to lowercase to match PostgreSQL convention
-                columns = ", ".join([col.lower() for col in data.columns])
-                placeholders = ", ".join(["%s"] * len(data.columns))
+def generate_chunk(rng, start_id, count, options):
+    """Generate `count` products starting at `start_id` as column arrays"""
+    global _vocabulary
+    if _vocabulary is None:
+        _vocabulary = np.char.capitalize(load_vocabulary())
 
-                # Prepare the insert query with ON CONFLICT clause
-                query = f"""
-                INSERT INTO {table_name.lower()} ({columns}) 
-                VALUES %s 
-                ON CONFLICT (id) DO NOTHING
-                """
+    first = _vocabulary[rng.integers(0, len(_vocabulary), size=count)]
+    second = _vocabulary[rng.integers(0, len(_vocabulary), size=count)]
+    return {
+        "id": np.arange(start_id, start_id + count, dtype=np.int64),
+        "name": np.char.add(np.char.add(first, " "), second),
+        "stock": rng.integers(0, 1001, size=count),
+        "updated_at": random_timestamps(rng, options["as_of"], count, max_age_days=60),
+    }
 
-                # Convert DataFrame to list of tuples
-                values = [tuple(row) for row in data.to_numpy()]
-
-                # Use execute_values for batch insertion with a single placeholder
-                execute_values(cursor, query, values)
-                connection.commit()
-        print(f"Data inserted successfully into {table_name}")
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error inserting into {table_name}: {error}")
-
-
-# Insert synthetic data into the database
-insert_data("products", product_df)
 
+if __name__ == "__main__":
+    from synthetic_data import main
+    main([TABLE, *sys.argv[1:]])
@@ -1,82 +1,162 @@
-import pandas as pd
-import psycopg2
-from psycopg2.extras import execute_values
-from datetime import datetime, timedelta
-import random
-from dotenv import load_dotenv
-import os
-from faker import Faker
+"""
+Synthetic rows for the users table.
+
+Usernames and emails combine a first/last name vocabulary with the user id,
+so they are unique by construction instead of being tracked in a growing set.
+Passwords are derived from (seed, index) and can be hashed with a realistic
+slow KDF. Because slow KDFs cost milliseconds per call, the default is to hash
+a fixed pool of distinct passwords once over a process pool and assign them
+to users; --distinct-passwords 0 hashes every user's own password instead.
+
+    python synthetic_data_users.py --rows 10000000
+    python synthetic_data_users.py --rows 1000000 --password-scheme pbkdf2 --distinct-passwords 5000
+"""
+import base64
 import hashlib
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from synthetic_data import random_timestamps
+
+TABLE = "users"
+COLUMNS = [
+    ("id", "int4"),
+    ("username", "text"),
+    ("email", "text"),
+    ("password_hash", "text"),
+    ("is_active", "bool"),
+    ("created_at", "timestamp"),
+    ("updated_at", "timestamp"),
+]
+
+EMAIL_DOMAINS = np.array(["example.com", "example.org", "example.net", "mail.test"])
+
+PASSWORD_LENGTH = 12
+PASSWORD_ALPHABET = np.frombuffer(
+    b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%^&*", dtype="S1"
+)
+
+PASSWORD_SCHEMES = ("sha256", "pbkdf2", "scrypt")
+DEFAULT_KDF_ITERATIONS = 100_000
+
+_names = None
+
+
+def _load_names():
+    """Lowercase first and last name vocabularies from Faker's en_US person provider"""
+    from faker.providers.person.en_US import Provider
+    first = np.char.lower(np.array(sorted(Provider.first_names)))
+    last = np.char.lower(np.array(sorted(Provider.last_names)))
+    return first, last
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Database connection details
-DB_CONFIG = {
-    "dbname": os.getenv("DB_NAME", "postgres"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", ""),
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": os.getenv("DB_PORT", "5432"),
-}
-
-
-# Number of synthetic users to generate
-NUM_USERS = 100
-
-# Initialize Faker
-fake = Faker()
-
-# Generate synthetic user data
-user_data = []
-for i in range(NUM_USERS):
-    username = fake.user_name() + str(i)  # Ensure uniqueness
-    email = fake.unique.email()
-    password = fake.password(length=12)
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    is_active = fake.boolean(chance_of_getting_true=90)
-    created_at = fake.date_time_between(start_date='-2y', end_date='now')
-    updated_at = created_at + timedelta(days=random.randint(0, 365))
-    user_data.append({
-        "username": username,
-        "email": email,
-        "password_hash": password_hash,
-        "is_active": is_active,
-        "created_at": created_at,
-        "updated_at": updated_at
-    })
 
-# Create DataFrame for users
-user_df = pd.DataFrame(user_data)
+def generate_passwords(seed, start, count):
+    """Deterministic printable passwords for password indexes [start, start + count)"""
+    rng = np.random.default_rng([seed, 0x70617373, start])
+    chars = PASSWORD_ALPHABET[rng.integers(0, len(PASSWORD_ALPHABET), size=(count, PASSWORD_LENGTH))]
+    return np.ascontiguousarray(chars).view(f"S{PASSWORD_LENGTH}").ravel()
 
 
-def insert_data(table_name, data):
-    """Insert data into the specified table"""
-    try:
-        with psycopg2.connect(**DB_CONFIG) as connection:
-            with connection.cursor() as cursor:
-                # Convert column names to lowercase to match PostgreSQL convention
-                columns = ", ".join([col.lower() for col in data.columns])
-                placeholders = ", ".join(["%s"] * len(data.columns))
+def hash_password(password: bytes, scheme="sha256", iterations=DEFAULT_KDF_ITERATIONS):
+    """Hash a password; salted KDF output is stored as scheme$params$salt$digest"""
+    if scheme == "sha256":
+        return hashlib.sha256(password).hexdigest()
 
-                # Prepare the insert query with ON CONFLICT clause
-                query = f"""
-                INSERT INTO {table_name.lower()} ({columns}) 
-                VALUES %s 
-                ON CONFLICT (id) DO NOTHING
-                """
+    salt = hashlib.sha256(b"salt" + password).digest()[:16]
+    salt_text = base64.b64encode(salt).decode()
+    if scheme == "pbkdf2":
+        digest = hashlib.pbkdf2_hmac("sha256", password, salt, iterations)
+        return f"pbkdf2_sha256${iterations}${salt_text}${base64.b64encode(digest).decode()}"
+    if scheme == "scrypt":
+        digest = hashlib.scrypt(password, salt=salt, n=2 ** 14, r=8, p=1, dklen=32)
+        return f"scrypt$16384$8$1${salt_text}${base64.b64encode(digest).decode()}"
+    raise ValueError(f"Unknown password scheme '{scheme}'")
 
-                # Convert DataFrame to list of tuples
-                values = [tuple(row) for row in data.to_numpy()]
 
-                # Use execute_values for batch insertion with a single placeholder
-                execute_values(cursor, query, values)
-                connection.commit()
-        print(f"Data inserted successfully into {table_name}")
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error inserting into {table_name}: {error}")
+def _hash_batch(args):
+    passwords, scheme, iterations = args
+    return [hash_password(password, scheme, iterations) for password in passwords]
 
 
-# Insert synthetic user data into the database
-insert_data("users", user_df)
+def hash_passwords(passwords, scheme, iterations, workers=None, batch_size=256):
+    """Hash passwords over a process pool, preserving order"""
+    batches = [
+        (passwords[i:i + batch_size], scheme, iterations)
+        for i in range(0, len(passwords), batch_size)
+    ]
+    with Pool(processes=workers) as pool:
+        hashed = pool.map(_hash_batch, batches)
+    return np.array([value for batch in hashed for value in batch])
+
+
+def resolve_options(options, max_id):
+    """Hash the shared password pool once, before chunk workers start"""
+    options.setdefault("password_scheme", "sha256")
+    options.setdefault("kdf_iterations", DEFAULT_KDF_ITERATIONS)
+    distinct = options.get("distinct_passwords")
+    if not distinct:
+        return
+
+    started = time.perf_counter()
+    passwords = generate_passwords(options["seed"], 0, distinct)
+    options["password_pool"] = hash_passwords(
+        passwords, options["password_scheme"], options["kdf_iterations"], options.get("hash_workers")
+    )
+    elapsed = time.perf_counter() - started
+    print(f"Hashed {distinct} distinct passwords ({options['password_scheme']}) "
+          f"in {elapsed:.1f}s ({distinct / elapsed:,.0f} hashes/s)")
+
+
+def generate_chunk(rng, start_id, count, options):
+    """Generate `count` users starting at `start_id` as column arrays"""
+    global _names
+    if _names is None:
+        _names = _load_names()
+    first_names, last_names = _names
+    stages = {}
+
+    started = time.perf_counter()
+    ids = np.arange(start_id, start_id + count, dtype=np.int64)
+    # first.last + id is unique by construction
+    first = first_names[rng.integers(0, len(first_names), size=count)]
+    last = last_names[rng.integers(0, len(last_names), size=count)]
+    usernames = np.char.add(np.char.add(np.char.add(first, "."), last), ids.astype(str))
+    domains = EMAIL_DOMAINS[rng.integers(0, len(EMAIL_DOMAINS), size=count)]
+    emails = np.char.add(np.char.add(usernames, "@"), domains)
+    stages["names"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pool = options.get("password_pool")
+    if pool is not None:
+        password_hashes = pool[rng.integers(0, len(pool), size=count)]
+    else:
+        # Chunk workers already run in a process pool, so hash in place
+        passwords = generate_passwords(options["seed"], start_id, count)
+        scheme, iterations = options["password_scheme"], options["kdf_iterations"]
+        password_hashes = np.array([hash_password(p, scheme, iterations) for p in passwords])
+    stages["passwords"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    created_at = random_timestamps(rng, options["as_of"], count, max_age_days=730)
+    updated_at = created_at + rng.integers(0, 365 * 86_400, size=count).astype("timedelta64[s]")
+    is_active = rng.random(count) < 0.9
+    stages["attributes"] = time.perf_counter() - started
+
+    return {
+        "id": ids,
+        "username": usernames,
+        "email": emails,
+        "password_hash": password_hashes,
+        "is_active": is_active,
+        "created_at": created_at,
+        "updated_at": np.minimum(updated_at, options["as_of"]),
+        "_stages": stages,
+    }
+
 
+if __name__ == "__main__":
+    from synthetic_data import main
+    main([TABLE, *sys.argv[1:]])
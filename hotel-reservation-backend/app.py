@@ -1,7 +1,18 @@
 from flask import Flask, jsonify, request
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from flask_cors import CORS,cross_origin
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import threading
+import codecs
+import json
+import csv
+import io
+import time
 import os
 
 app = Flask(__name__)
@@ -23,6 +34,756 @@ def get_db_connection():
     conn = psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
     return conn
 
+# Search settings
+SEARCH_MAX_LIMIT = 100
+SEARCH_MAX_PAGE = 50
+SEARCH_MAX_QUERY_LENGTH = 100
+SEARCH_SIMILARITY_THRESHOLD = float(os.getenv("SEARCH_SIMILARITY_THRESHOLD", 0.4))
+# Spellings tried per query word, and how many postings are counted to find the rarest word
+SEARCH_CANDIDATES_PER_WORD = 5
+SEARCH_POSTINGS_SAMPLE = 1000
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 10000))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 30))
+
+# Typo-tolerant search works on words. Every hotel's name and city words are kept
+# in hotel_search_terms, next to its price, city and all of its words, by statement
+# triggers on hotels, so "hotels with these words" is one index-only range read in
+# price order however many hotels share a word. The distinct words also go to
+# hotel_search_words, whose trigram index maps each query word to its closest known
+# words. Words are never removed from it; a word no hotel uses any more just matches
+# nothing.
+SEARCH_SCHEMA = """
+CREATE OR REPLACE FUNCTION hotel_search_split(text) RETURNS text[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT coalesce(array_agg(DISTINCT word), '{}')
+    FROM regexp_split_to_table(lower($1), '[^[:alnum:]]+') AS word
+    WHERE word <> ''
+$$;
+
+CREATE TABLE IF NOT EXISTS hotel_search_words (
+    word TEXT PRIMARY KEY
+);
+CREATE INDEX IF NOT EXISTS hotel_search_words_trgm_idx ON hotel_search_words USING gist (word gist_trgm_ops);
+
+CREATE TABLE IF NOT EXISTS hotel_search_terms (
+    hotel_id INT NOT NULL,
+    word TEXT NOT NULL,
+    price NUMERIC(10, 2),
+    city_key TEXT NOT NULL,
+    words TEXT[] NOT NULL,
+    PRIMARY KEY (hotel_id, word)
+);
+CREATE INDEX IF NOT EXISTS hotel_search_terms_word_price_idx
+    ON hotel_search_terms (word, price, hotel_id) INCLUDE (city_key, words);
+
+CREATE OR REPLACE FUNCTION hotel_search_sync() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM hotel_search_terms t USING old_rows o WHERE t.hotel_id = o.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO hotel_search_words (word)
+        SELECT DISTINCT w FROM new_rows n, unnest(hotel_search_split(n.name || ' ' || n.city)) AS w
+        ORDER BY w
+        ON CONFLICT DO NOTHING;
+        INSERT INTO hotel_search_terms (hotel_id, word, price, city_key, words)
+        SELECT n.id, w, n.price, lower(n.city), hotel_search_split(n.name || ' ' || n.city)
+        FROM new_rows n, unnest(hotel_search_split(n.name || ' ' || n.city)) AS w
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'hotels_search_insert') THEN
+        CREATE TRIGGER hotels_search_insert AFTER INSERT ON hotels
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION hotel_search_sync();
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'hotels_search_update') THEN
+        CREATE TRIGGER hotels_search_update AFTER UPDATE ON hotels
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION hotel_search_sync();
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'hotels_search_delete') THEN
+        CREATE TRIGGER hotels_search_delete AFTER DELETE ON hotels
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION hotel_search_sync();
+    END IF;
+END
+$$;
+"""
+
+# Fills in the words of hotels that have none yet (rows from before the triggers),
+# a batch of ids per statement. FOR SHARE makes a concurrent update either wait for
+# the batch or be seen by it, so the batch never stores a row's old words after the
+# trigger has replaced them.
+SEARCH_BACKFILL_SQL = """
+WITH batch AS (
+    SELECT h.id, h.name, h.city, h.price FROM hotels h
+    WHERE h.id > %s AND NOT EXISTS (SELECT 1 FROM hotel_search_terms t WHERE t.hotel_id = h.id)
+    ORDER BY h.id
+    LIMIT %s
+    FOR SHARE
+), words AS (
+    INSERT INTO hotel_search_words (word)
+    SELECT DISTINCT w FROM batch b, unnest(hotel_search_split(b.name || ' ' || b.city)) AS w
+    ORDER BY w
+    ON CONFLICT DO NOTHING
+), terms AS (
+    INSERT INTO hotel_search_terms (hotel_id, word, price, city_key, words)
+    SELECT b.id, w, b.price, lower(b.city), hotel_search_split(b.name || ' ' || b.city)
+    FROM batch b, unnest(hotel_search_split(b.name || ' ' || b.city)) AS w
+    ON CONFLICT DO NOTHING
+)
+SELECT max(id) AS last_id FROM batch
+"""
+SEARCH_BACKFILL_BATCH = 10000
+
+# name -> (table, definition). Listings without q: by city, then price, or by price
+# alone; bulk reservation imports look up a guest's stays per hotel.
+SCHEMA_INDEXES = {
+    "hotels_city_price_idx": ("hotels", "(lower(city), price, id)"),
+    "hotels_price_idx": ("hotels", "(price, id)"),
+    "reservations_hotel_guest_idx": ("reservations", "(hotel_id, guest_name, check_in)"),
+}
+
+def ensure_schema():
+    """
+    Create the search tables, triggers and indexes if they are missing, then index
+    the words of hotels that predate the triggers. Indexes are built CONCURRENTLY,
+    so hotels and reservations stay writable during a long build; an index left
+    invalid by an interrupted build is dropped and built again, and one whose table
+    does not exist is skipped. A session advisory lock keeps several app processes
+    from running the setup at once.
+    """
+    conn = get_db_connection()
+    conn.autocommit = True  # CREATE INDEX CONCURRENTLY cannot run in a transaction
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_lock(hashtext('hotel_reservation_schema'))")
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(SEARCH_SCHEMA)
+            for name, (table, columns) in SCHEMA_INDEXES.items():
+                cursor.execute(
+                    """
+                    SELECT to_regclass(%s) IS NOT NULL AS table_exists,
+                           (SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s)) AS valid
+                    """,
+                    (table, name)
+                )
+                state = cursor.fetchone()
+                if not state["table_exists"] or state["valid"]:
+                    continue
+                if state["valid"] is not None:
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                cursor.execute(f"CREATE INDEX CONCURRENTLY {name} ON {table} {columns}")
+            last_id = 0
+            while last_id is not None:
+                cursor.execute(SEARCH_BACKFILL_SQL, (last_id, SEARCH_BACKFILL_BATCH))
+                last_id = cursor.fetchone()["last_id"]
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(hashtext('hotel_reservation_schema'))")
+            cursor.close()
+    finally:
+        conn.close()
+
+_schema_started = False
+_schema_lock = threading.Lock()
+
+def _build_schema():
+    try:
+        ensure_schema()
+    except Exception:
+        # Searches answer 503 until the search tables exist; the next start retries
+        app.logger.exception("Setting up hotel search failed")
+
+@app.before_request
+def start_schema_setup():
+    """
+    Set up search in the background on the first request, whichever way the app is
+    served (flask run, a WSGI server or __main__). Requests are served meanwhile;
+    searches miss hotels whose words are not indexed yet.
+    """
+    global _schema_started
+    if _schema_started:
+        return
+    with _schema_lock:
+        if _schema_started:
+            return
+        _schema_started = True
+    threading.Thread(target=_build_schema, name="ensure-schema", daemon=True).start()
+
+# Search runs on pooled connections; opening a connection per request costs more
+# than the indexed query itself
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises once all connections are out instead of waiting,
+# so checkouts are bounded here and extra requests queue for a free connection
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(1, DB_POOL_MAX_SIZE, **DB_CONFIG, cursor_factory=RealDictCursor)
+    return _pool
+
+@contextmanager
+def pooled_connection():
+    if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise PoolError(f"No database connection free after {DB_POOL_TIMEOUT}s")
+    try:
+        pool = _get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            broken = conn.closed
+            try:
+                if not broken:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            finally:
+                # A broken connection is closed rather than handed to the next request
+                pool.putconn(conn, close=bool(broken))
+    finally:
+        _pool_slots.release()
+
+class SearchCache:
+    """
+    Thread-safe LRU of search results with a TTL; clear() drops everything.
+    clear() also bumps `generation`: a search reads it before querying and passes it
+    to set(), which drops the result if a write cleared the cache in between, so a
+    result read before the write cannot be cached after it.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+search_cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+def _resolve_terms(cursor, q):
+    """
+    For each word of q, the known words closest to it by trigram similarity (ties
+    included) and their distance. None when some word has no close enough match.
+    """
+    cursor.execute(
+        f"""
+        SET LOCAL pg_trgm.similarity_threshold = {SEARCH_SIMILARITY_THRESHOLD:f};
+        SELECT q.pos, m.word, m.distance
+        FROM unnest(hotel_search_split(%s)) WITH ORDINALITY AS q(term, pos)
+        LEFT JOIN LATERAL (
+            SELECT w.word, w.word <-> q.term AS distance
+            FROM hotel_search_words w
+            WHERE w.word %% q.term
+            ORDER BY w.word <-> q.term
+            LIMIT {SEARCH_CANDIDATES_PER_WORD}
+        ) m ON true
+        ORDER BY q.pos, m.distance;
+        """,
+        (q,)
+    )
+    terms = {}
+    for row in cursor.fetchall():
+        if row["word"] is None:
+            return None
+        best = terms.setdefault(row["pos"], (row["distance"], []))
+        if row["distance"] == best[0]:
+            best[1].append(row["word"])
+    return list(terms.values()) or None
+
+def search_hotels(q, city, max_price, page, limit):
+    """
+    Hotels whose name or city holds, for every word of q, that word or its closest
+    known spelling (typo tolerant), cheapest first. Without q, hotels are listed by
+    price. `city` is an exact case-insensitive filter. Returns one extra row to tell
+    whether there is a next page.
+    """
+    offset = (page - 1) * limit
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        if not q:
+            conditions = []
+            params = []
+            if city:
+                conditions.append("lower(city) = lower(%s)")
+                params.append(city)
+            if max_price is not None:
+                conditions.append("price <= %s")
+                params.append(max_price)
+            where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+            cursor.execute(
+                f"""
+                SELECT id, name, city, price, NULL::real AS score
+                FROM hotels
+                {where}
+                ORDER BY price, id
+                LIMIT %s OFFSET %s;
+                """,
+                params + [limit + 1, offset]
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+
+        terms = _resolve_terms(cursor, q)
+        if terms is None:
+            cursor.close()
+            return []
+        score = 1 - sum(distance for distance, _ in terms) / len(terms)
+
+        # Scan the postings of the rarest word; the others are checked against the
+        # words stored with each posting
+        if len(terms) > 1:
+            sizes = []
+            for _, words in terms:
+                cursor.execute(
+                    """
+                    SELECT count(*) AS n FROM (
+                        SELECT 1 FROM hotel_search_terms WHERE word = ANY(%s) LIMIT %s
+                    ) AS p
+                    """,
+                    (words, SEARCH_POSTINGS_SAMPLE)
+                )
+                sizes.append(cursor.fetchone()["n"])
+            terms.insert(0, terms.pop(sizes.index(min(sizes))))
+
+        conditions = ["t.word = d.word"]
+        params = [terms[0][1]]  # unnested as d
+        if city:
+            conditions.append("t.city_key = lower(%s)")
+            params.append(city)
+        if max_price is not None:
+            conditions.append("t.price <= %s")
+            params.append(max_price)
+        for _, words in terms[1:]:
+            conditions.append("t.words && %s::text[]")
+            params.append(words)
+        # Each driver word contributes at most the rows up to the requested page
+        cursor.execute(
+            f"""
+            SELECT h.id, h.name, h.city, h.price, %s::real AS score
+            FROM (
+                SELECT DISTINCT m.hotel_id, m.price
+                FROM unnest(%s::text[]) AS d(word)
+                CROSS JOIN LATERAL (
+                    SELECT t.hotel_id, t.price
+                    FROM hotel_search_terms t
+                    WHERE {" AND ".join(conditions)}
+                    ORDER BY t.price, t.hotel_id
+                    LIMIT %s
+                ) AS m
+                ORDER BY m.price, m.hotel_id
+                LIMIT %s OFFSET %s
+            ) AS p
+            JOIN hotels h ON h.id = p.hotel_id
+            ORDER BY p.price, p.hotel_id;
+            """,
+            [score] + params + [offset + limit + 1, limit + 1, offset]
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+    return rows
+
+# Bulk import: bodies are streamed, rows validated one at a time and COPYed into a
+# temporary staging table, then checked and merged with set-based SQL
+BULK_MAX_ERRORS = 1000
+BULK_READ_SIZE = 64 * 1024
+# A body without line breaks would otherwise be buffered whole
+BULK_MAX_LINE_LENGTH = 64 * 1024
+# Anything the tables would refuse (out of range, too long, NUL bytes) would abort
+# the whole COPY or merge, so the row parsers reject it as a row error instead
+MAX_PRICE = Decimal("99999999.99")
+MAX_INT = 2 ** 31 - 1
+MAX_TEXT_LENGTH = 255
+CSV_TYPES = ("text/csv", "application/csv")
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+class BulkImportError(Exception):
+    """The upload as a whole is unusable; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _body_lines():
+    """
+    Decoded lines of the request body, line endings kept, read in fixed-size chunks.
+    A line longer than BULK_MAX_LINE_LENGTH fails the upload.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        chunk = request.stream.read(BULK_READ_SIZE)
+        try:
+            pending += decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as e:
+            raise BulkImportError(f"Request body is not valid UTF-8: {e.reason}")
+        *lines, pending = pending.split("\n")
+        for line in lines + [pending]:
+            if len(line) > BULK_MAX_LINE_LENGTH:
+                raise BulkImportError(f"Lines must be at most {BULK_MAX_LINE_LENGTH} characters")
+        for line in lines:
+            yield line + "\n"
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+def _body_records():
+    """(row number, record dict or None, parse error or None) for a CSV or NDJSON body"""
+    if request.mimetype in CSV_TYPES:
+        # csv reassembles quoted fields that span lines
+        records = enumerate(csv.DictReader(_body_lines()), start=1)
+        while True:
+            try:
+                row_no, record = next(records)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # An unterminated quote leaves nothing to resynchronise on
+                raise BulkImportError(f"Invalid CSV: {e}")
+            yield row_no, record, None
+    elif request.mimetype in NDJSON_TYPES:
+        for row_no, line in enumerate(_body_lines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_no, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row_no, None, "Expected a JSON object"
+                continue
+            yield row_no, record, None
+
+def _required(record, *fields):
+    values = [record.get(field) for field in fields]
+    if any(value is None or str(value).strip() == "" for value in values):
+        raise ValueError("Missing required fields")
+    return values
+
+def _text(value, field):
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    value = value.strip()
+    if "\x00" in value:
+        raise ValueError(f"{field} contains a NUL character")
+    if len(value) > MAX_TEXT_LENGTH:
+        raise ValueError(f"{field} is longer than {MAX_TEXT_LENGTH} characters")
+    return value
+
+def _positive_int(value, field):
+    # JSON true/false and 1.7 are not ids or counts, and int() would accept both
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{field} must be an integer")
+    if isinstance(value, str):
+        if not value.strip().isdigit():
+            raise ValueError(f"{field} must be an integer")
+        value = int(value)
+    if not 0 < value <= MAX_INT:
+        raise ValueError(f"{field} must be between 1 and {MAX_INT}")
+    return value
+
+def _date(value, field):
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a YYYY-MM-DD date")
+    try:
+        return date.fromisoformat(value.strip())
+    except ValueError:
+        raise ValueError(f"{field} must be a YYYY-MM-DD date")
+
+def parse_hotel_row(record):
+    name, city, price = _required(record, "name", "city", "price")
+    if isinstance(price, bool) or not isinstance(price, (int, float, str)):
+        raise ValueError("price must be a number")
+    try:
+        price = Decimal(str(price).strip())
+        # Round the way NUMERIC(10, 2) will, so 0.001 is rejected here rather than stored as 0.00
+        if price.is_finite():
+            price = price.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError("price must be a number")
+    if not price.is_finite() or not 0 < price <= MAX_PRICE:
+        raise ValueError(f"price must be between 0.01 and {MAX_PRICE}")
+    return [_text(name, "name"), _text(city, "city"), price]
+
+def parse_reservation_row(record):
+    hotel_id, guest_name, check_in, check_out, num_guests = _required(
+        record, "hotel_id", "guest_name", "check_in", "check_out", "num_guests"
+    )
+    check_in = _date(check_in, "check_in")
+    check_out = _date(check_out, "check_out")
+    if check_out <= check_in:
+        raise ValueError("check_out must be after check_in")
+    return [
+        _positive_int(hotel_id, "hotel_id"),
+        _text(guest_name, "guest_name"),
+        check_in,
+        check_out,
+        _positive_int(num_guests, "num_guests"),
+    ]
+
+class _CopySource:
+    """
+    File-like object for cursor.copy_expert: pulls records from the body,
+    validates them and hands over valid rows as CSV, a read() at a time.
+    Rejected rows are counted and the first BULK_MAX_ERRORS are kept.
+    """
+
+    def __init__(self, records, parse_row):
+        self._records = records
+        self._parse_row = parse_row
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = ""
+        self.failure = None
+        self.received = 0
+        self.rejected = 0
+        self.errors = []
+
+    def _reject(self, row_no, error):
+        self.rejected += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"row": row_no, "error": error})
+
+    def _next_line(self):
+        try:
+            return self._next_valid_line()
+        except BulkImportError as e:
+            # Raising inside copy_expert would surface as a database error; end the
+            # data instead and let bulk_import report it once COPY has returned
+            self.failure = e
+            return None
+
+    def _next_valid_line(self):
+        for row_no, record, error in self._records:
+            self.received += 1
+            if error is None:
+                try:
+                    self._writer.writerow([row_no] + self._parse_row(record))
+                except (ValueError, TypeError, ArithmeticError) as e:
+                    error = str(e) or type(e).__name__
+            if error is not None:
+                self._reject(row_no, error)
+                continue
+            line = self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+            return line
+        return None
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            line = self._next_line()
+            if line is None:
+                break
+            self._pending += line
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+def bulk_import(staging_sql, copy_sql, validate_sql, merge, parse_row):
+    """
+    Run one bulk import in a single transaction:
+    stage the valid rows with COPY, mark rows failing `validate_sql` (statements
+    setting staging.error), then `merge(cursor)` the rest, which returns counts.
+    """
+    if request.mimetype not in CSV_TYPES + NDJSON_TYPES:
+        raise BulkImportError(f"Content-Type must be one of {', '.join(CSV_TYPES + NDJSON_TYPES)}", status=415)
+    source = _CopySource(_body_records(), parse_row)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(staging_sql)
+        cursor.copy_expert(copy_sql, source, size=BULK_READ_SIZE)
+        if source.failure is not None:
+            raise source.failure
+        for statement in validate_sql:
+            cursor.execute(statement)
+        cursor.execute(
+            "SELECT row_no, error FROM staging WHERE error IS NOT NULL ORDER BY row_no LIMIT %s",
+            (BULK_MAX_ERRORS,)
+        )
+        checked = [{"row": row["row_no"], "error": row["error"]} for row in cursor.fetchall()]
+        cursor.execute("SELECT count(*) AS n FROM staging WHERE error IS NOT NULL")
+        rejected = cursor.fetchone()["n"]
+        counts = merge(cursor)
+        conn.commit()
+        cursor.close()
+
+    errors = sorted(source.errors + checked, key=lambda error: error["row"])
+    return {
+        "received": source.received,
+        **counts,
+        "rejected": source.rejected + rejected,
+        "errors": errors[:BULK_MAX_ERRORS],
+        "errors_truncated": source.rejected + rejected > BULK_MAX_ERRORS,
+    }
+
+HOTEL_STAGING_SQL = """
+CREATE TEMP TABLE staging (
+    row_no INT NOT NULL,
+    name TEXT NOT NULL,
+    city TEXT NOT NULL,
+    price NUMERIC(10, 2) NOT NULL,
+    hotel_id INT,
+    error TEXT
+) ON COMMIT DROP;
+"""
+
+HOTEL_VALIDATE_SQL = [
+    # Two concurrent imports of the same new hotel would both insert it
+    "SELECT pg_advisory_xact_lock(hashtext('hotels_bulk_import'));",
+    # The same hotel twice in one upload: the last row wins
+    """
+    UPDATE staging s SET error = 'Duplicate of row ' || d.last_row
+    FROM (
+        SELECT row_no, max(row_no) OVER (PARTITION BY lower(name), lower(city)) AS last_row FROM staging
+    ) d
+    WHERE s.row_no = d.row_no AND d.row_no <> d.last_row;
+    """,
+    # Hotels that exist already (same name and city) are updated instead of duplicated
+    """
+    UPDATE staging s SET hotel_id = h.id
+    FROM (
+        SELECT DISTINCT ON (lower(name), lower(city)) id, lower(name) AS name, lower(city) AS city
+        FROM hotels ORDER BY lower(name), lower(city), id
+    ) h
+    WHERE s.error IS NULL AND lower(s.name) = h.name AND lower(s.city) = h.city;
+    """,
+]
+
+def merge_hotels(cursor):
+    cursor.execute(
+        """
+        UPDATE hotels h SET price = s.price
+        FROM staging s
+        WHERE s.hotel_id = h.id AND s.error IS NULL AND h.price IS DISTINCT FROM s.price;
+        """
+    )
+    updated = cursor.rowcount
+    cursor.execute(
+        """
+        INSERT INTO hotels (name, city, price)
+        SELECT name, city, price FROM staging
+        WHERE error IS NULL AND hotel_id IS NULL
+        ORDER BY row_no;
+        """
+    )
+    return {"inserted": cursor.rowcount, "updated": updated}
+
+RESERVATION_STAGING_SQL = """
+CREATE TEMP TABLE staging (
+    row_no INT PRIMARY KEY,
+    hotel_id INT NOT NULL,
+    guest_name TEXT NOT NULL,
+    check_in DATE NOT NULL,
+    check_out DATE NOT NULL,
+    num_guests INT NOT NULL,
+    error TEXT
+) ON COMMIT DROP;
+"""
+
+RESERVATION_VALIDATE_SQL = [
+    "CREATE INDEX ON staging (hotel_id, guest_name, check_in);",
+    "ANALYZE staging;",
+    # Concurrent imports would not see each other's rows in the overlap checks
+    "SELECT pg_advisory_xact_lock(hashtext('reservations_bulk_import'));",
+    """
+    UPDATE staging s SET error = 'Unknown hotel_id'
+    WHERE NOT EXISTS (SELECT 1 FROM hotels h WHERE h.id = s.hotel_id);
+    """,
+    # A guest cannot hold overlapping stays at the same hotel
+    """
+    UPDATE staging s SET error = 'Overlaps reservation ' || r.id
+    FROM reservations r
+    WHERE s.error IS NULL
+      AND r.hotel_id = s.hotel_id AND r.guest_name = s.guest_name
+      AND r.check_in < s.check_out AND s.check_in < r.check_out;
+    """,
+    # Within the upload rows are taken in file order: a row is rejected only if it
+    # overlaps an earlier row that was kept. One UPDATE would compare every row with
+    # the state before any was marked, so in a chain A-B-C where only A-B and B-C
+    # overlap it would reject C as well. The loop only visits rows that overlap some
+    # earlier row, and decides them in row order.
+    """
+    DO $$
+    DECLARE
+        r RECORD;
+        earlier INT;
+    BEGIN
+        FOR r IN
+            SELECT s.row_no, s.hotel_id, s.guest_name, s.check_in, s.check_out FROM staging s
+            WHERE s.error IS NULL AND EXISTS (
+                SELECT 1 FROM staging o
+                WHERE o.error IS NULL AND o.row_no < s.row_no
+                  AND o.hotel_id = s.hotel_id AND o.guest_name = s.guest_name
+                  AND o.check_in < s.check_out AND s.check_in < o.check_out
+            )
+            ORDER BY s.row_no
+        LOOP
+            SELECT o.row_no INTO earlier FROM staging o
+            WHERE o.error IS NULL AND o.row_no < r.row_no
+              AND o.hotel_id = r.hotel_id AND o.guest_name = r.guest_name
+              AND o.check_in < r.check_out AND r.check_in < o.check_out
+            ORDER BY o.row_no LIMIT 1;
+            IF FOUND THEN
+                UPDATE staging SET error = 'Overlaps row ' || earlier WHERE row_no = r.row_no;
+            END IF;
+        END LOOP;
+    END
+    $$;
+    """,
+]
+
+def merge_reservations(cursor):
+    cursor.execute(
+        """
+        INSERT INTO reservations (hotel_id, guest_name, check_in, check_out, num_guests)
+        SELECT hotel_id, guest_name, check_in, check_out, num_guests FROM staging
+        WHERE error IS NULL
+        ORDER BY row_no;
+        """
+    )
+    return {"inserted": cursor.rowcount}
+
 @app.route("/hotels", methods=["GET"])
 def get_hotels():
     try:
@@ -36,6 +797,38 @@ def get_hotels():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/hotels/search", methods=["GET"])
+def search():
+    q = (request.args.get("q") or "").strip()
+    city = (request.args.get("city") or "").strip()
+    max_price = request.args.get("max_price", type=float)
+    page = request.args.get("page", 1, type=int)
+    limit = request.args.get("limit", 20, type=int)
+    if not 1 <= page <= SEARCH_MAX_PAGE or not 1 <= limit <= SEARCH_MAX_LIMIT:
+        return jsonify({"error": f"page must be 1-{SEARCH_MAX_PAGE} and limit 1-{SEARCH_MAX_LIMIT}"}), 400
+
+    if len(q) > SEARCH_MAX_QUERY_LENGTH:
+        return jsonify({"error": f"q must be at most {SEARCH_MAX_QUERY_LENGTH} characters"}), 400
+
+    key = (q.lower(), city.lower(), max_price, page, limit)
+    result = search_cache.get(key)
+    if result is None:
+        generation = search_cache.generation
+        try:
+            rows = search_hotels(q, city, max_price, page, limit)
+        except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedFunction):
+            return jsonify({"error": "Search is being set up, try again shortly"}), 503
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        result = {
+            "results": rows[:limit],
+            "page": page,
+            "limit": limit,
+            "next_page": page + 1 if len(rows) > limit and page < SEARCH_MAX_PAGE else None,
+        }
+        search_cache.set(key, result, generation)
+    return jsonify(result)
+
 @app.route("/hotels", methods=["POST"])
 def add_hotel():
     data = request.json
@@ -61,10 +854,30 @@ def add_hotel():
         conn.commit()
         cursor.close()
         conn.close()
+        # Any cached search may now be missing the new hotel
+        search_cache.clear()
         return jsonify({"hotel_id": hotel_id}), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/hotels/bulk", methods=["POST"])
+def add_hotels_bulk():
+    """CSV (name,city,price header) or NDJSON; existing hotels with the same name and city get the new price"""
+    try:
+        result = bulk_import(
+            HOTEL_STAGING_SQL,
+            "COPY staging (row_no, name, city, price) FROM STDIN WITH (FORMAT csv)",
+            HOTEL_VALIDATE_SQL,
+            merge_hotels,
+            parse_hotel_row,
+        )
+    except BulkImportError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    search_cache.clear()
+    return jsonify(result), 200
+
 
 @app.route("/reservations/<int:hotel_id>", methods=["POST"])
 @cross_origin()
@@ -97,6 +910,23 @@ def create_reservation(hotel_id):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/reservations/bulk", methods=["POST"])
+def create_reservations_bulk():
+    """CSV (hotel_id,guest_name,check_in,check_out,num_guests header) or NDJSON"""
+    try:
+        result = bulk_import(
+            RESERVATION_STAGING_SQL,
+            "COPY staging (row_no, hotel_id, guest_name, check_in, check_out, num_guests) FROM STDIN WITH (FORMAT csv)",
+            RESERVATION_VALIDATE_SQL,
+            merge_reservations,
+            parse_reservation_row,
+        )
+    except BulkImportError as e:
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(result), 200
+
 @app.route("/reservations/<int:reservation_id>", methods=["DELETE"])
 def delete_reservation(reservation_id):
     try:
@@ -0,0 +1,148 @@
+"""
+Latency benchmark for GET /hotels/search.
+
+Fills a scratch database with generated hotels (1M by default), sets up search
+through app.ensure_schema() (word tables, triggers and indexes, then the words of
+the loaded hotels) and times search_hotels() for a mix
+of query shapes: name words, misspelled words, cities, combined filters and the
+price listing without q. Results are served from the database, not the cache.
+
+    python benchmark_search.py                      # load 1M hotels, then measure
+    python benchmark_search.py --skip-load -n 2000  # reuse the loaded rows
+"""
+import time
+import random
+import argparse
+import statistics
+import psycopg2
+
+import app
+
+PREFIXES = ["Grand", "Royal", "Golden", "Blue", "Park", "Central", "Old Town", "Harbor", "Palace",
+            "Garden", "Riverside", "Sunset", "Imperial", "Crown", "Silver", "Ocean", "Mountain",
+            "City", "Plaza", "Boutique"]
+NAMES = ["Hilton", "Marriott", "Regent", "Savoy", "Astoria", "Continental", "Majestic", "Metropole",
+         "Excelsior", "Belvedere", "Ambassador", "Windsor", "Carlton", "Bristol", "Victoria",
+         "Waldorf", "Beaumont", "Meridian", "Lancaster", "Kensington", "Montclair", "Ritz",
+         "Sheraton", "Radisson", "Hyatt", "Westin", "Fairmont", "Intercontinental", "Novotel", "Mercure"]
+KINDS = ["Hotel", "Inn", "Suites", "Resort", "Lodge"]
+CITIES = ["Paris", "London", "Rome", "Berlin", "Madrid", "Lisbon", "Vienna", "Prague", "Budapest",
+          "Warsaw", "Amsterdam", "Brussels", "Copenhagen", "Stockholm", "Oslo", "Helsinki", "Dublin",
+          "Edinburgh", "Barcelona", "Milan", "Venice", "Florence", "Munich", "Hamburg", "Zurich",
+          "Geneva", "Athens", "Istanbul", "New York", "Chicago", "Boston", "Seattle", "San Francisco",
+          "Los Angeles", "Miami", "Toronto", "Montreal", "Vancouver", "Mexico City", "Buenos Aires",
+          "Sao Paulo", "Lima", "Bogota", "Santiago", "Tokyo", "Osaka", "Kyoto", "Seoul", "Beijing",
+          "Shanghai", "Hong Kong", "Singapore", "Bangkok", "Sydney", "Melbourne", "Auckland",
+          "Cape Town", "Cairo", "Marrakesh", "Dubai"]
+
+def sql_array(values):
+    return "ARRAY[" + ", ".join("'" + v.replace("'", "''") + "'" for v in values) + "]"
+
+LOAD_SQL = f"""
+SELECT setseed(0.42);
+INSERT INTO hotels (name, city, price)
+SELECT p[1 + floor(random() * array_length(p, 1))::int] || ' '
+       || n[1 + floor(random() * array_length(n, 1))::int] || ' '
+       || k[1 + floor(random() * array_length(k, 1))::int],
+       c[1 + floor(random() * array_length(c, 1))::int],
+       round((40 + random() * 460)::numeric, 2)
+FROM generate_series(1, %s),
+     (SELECT {sql_array(PREFIXES)} AS p, {sql_array(NAMES)} AS n,
+             {sql_array(KINDS)} AS k, {sql_array(CITIES)} AS c) AS vocab;
+"""
+
+def ensure_database(name):
+    conn = psycopg2.connect(**{**app.DB_CONFIG, "database": "postgres"})
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (name,))
+    if cursor.fetchone() is None:
+        cursor.execute(f'CREATE DATABASE "{name}"')
+    cursor.close()
+    conn.close()
+
+def load(rows):
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS hotels ("
+        "id SERIAL PRIMARY KEY, name VARCHAR(255) NOT NULL, city VARCHAR(255) NOT NULL, price NUMERIC(10, 2) NOT NULL)"
+    )
+    cursor.execute("SELECT count(*) AS n FROM hotels")
+    existing = cursor.fetchone()["n"]
+    if existing < rows:
+        print(f"Loading {rows - existing} hotels...")
+        started = time.perf_counter()
+        cursor.execute(LOAD_SQL, (rows - existing,))
+        conn.commit()
+        print(f"Loaded in {time.perf_counter() - started:.1f}s")
+    cursor.close()
+    conn.close()
+
+    started = time.perf_counter()
+    app.ensure_schema()
+    print(f"Search ready in {time.perf_counter() - started:.1f}s")
+    conn = app.get_db_connection()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    for table in ("hotels", "hotel_search_words", "hotel_search_terms"):
+        cursor.execute(f"VACUUM ANALYZE {table}")
+    cursor.close()
+    conn.close()
+
+def typo(word):
+    i = random.randrange(len(word))
+    return word[:i] + word[i + 1:]
+
+# name -> function returning search_hotels(q, city, max_price, page, limit) arguments
+QUERIES = {
+    "name word": lambda: (random.choice(NAMES), "", None, 1, 20),
+    "misspelled name": lambda: (typo(random.choice(NAMES)), "", None, 1, 20),
+    "two words": lambda: (f"{random.choice(PREFIXES)} {random.choice(NAMES)}", "", None, 1, 20),
+    "unrelated words": lambda: (" ".join(random.sample(NAMES, 2)), "", None, 1, 20),
+    "city as q": lambda: (random.choice(CITIES), "", None, 1, 20),
+    "misspelled city": lambda: (typo(random.choice(CITIES)), "", None, 1, 20),
+    "q + city": lambda: (random.choice(NAMES), random.choice(CITIES), None, 1, 20),
+    "q + max_price": lambda: (random.choice(NAMES), "", random.choice([80, 150, 300]), 1, 20),
+    "q page 5": lambda: (random.choice(NAMES), "", None, 5, 20),
+    "city by price": lambda: ("", random.choice(CITIES), None, 1, 20),
+    "price listing": lambda: ("", "", random.choice([80, 150, 300]), 1, 20),
+    "no match": lambda: ("zzqxv", "", None, 1, 20),
+}
+
+def measure(iterations):
+    random.seed(7)
+    print(f"\n{'query':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    worst = 0.0
+    for name, make_args in QUERIES.items():
+        for _ in range(20):  # warm the pool and the cache of index pages
+            app.search_hotels(*make_args())
+        timings = []
+        for _ in range(iterations):
+            args = make_args()
+            started = time.perf_counter()
+            app.search_hotels(*args)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        worst = max(worst, p99)
+        print(f"{name:<18}{statistics.median(timings):>9.2f}{timings[int(len(timings) * 0.95) - 1]:>9.2f}"
+              f"{p99:>9.2f}{timings[-1]:>9.2f}")
+    print(f"\nWorst p99: {worst:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="hotel_reservation_bench", help="Scratch database to use")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("-n", "--iterations", type=int, default=1000, help="Searches per query shape")
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args()
+
+    ensure_database(args.database)
+    app.DB_CONFIG["database"] = args.database
+    if not args.skip_load:
+        load(args.rows)
+    measure(args.iterations)
+
+if __name__ == "__main__":
+    main()
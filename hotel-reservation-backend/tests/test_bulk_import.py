@@ -0,0 +1,266 @@
+"""
+Bulk import tests. The parser and streaming tests need no database; the import
+tests create a scratch database next to the one in app.DB_CONFIG (credentials
+from there, name from HOTEL_TEST_DATABASE) and are skipped when PostgreSQL is
+not reachable.
+"""
+import io
+import os
+import sys
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import app  # noqa: E402
+
+TEST_DATABASE = os.getenv("HOTEL_TEST_DATABASE", "hotel_reservation_test")
+
+TABLES_SQL = """
+CREATE TABLE hotels (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    city VARCHAR(255) NOT NULL,
+    price NUMERIC(10, 2) NOT NULL
+);
+CREATE TABLE reservations (
+    id SERIAL PRIMARY KEY,
+    hotel_id INT NOT NULL REFERENCES hotels (id),
+    guest_name VARCHAR(255) NOT NULL,
+    check_in DATE NOT NULL,
+    check_out DATE NOT NULL,
+    num_guests INT NOT NULL
+);
+"""
+
+def ndjson(*records):
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+# Row parsers
+
+def test_parse_hotel_row_normalises_values():
+    row = app.parse_hotel_row({"name": " Grand Hotel ", "city": "Paris", "price": "120.455"})
+    assert row == ["Grand Hotel", "Paris", Decimal("120.46")]
+
+@pytest.mark.parametrize("record, error", [
+    ({"name": "A", "city": "B"}, "Missing required fields"),
+    ({"name": " ", "city": "B", "price": 10}, "Missing required fields"),
+    ({"name": "A", "city": "B", "price": True}, "price must be a number"),
+    ({"name": "A", "city": "B", "price": "ten"}, "price must be a number"),
+    ({"name": "A", "city": "B", "price": "0.001"}, "price must be between"),
+    ({"name": "A", "city": "B", "price": "NaN"}, "price must be between"),
+    ({"name": "A", "city": "B", "price": "100000000"}, "price must be between"),
+    ({"name": "A" * 256, "city": "B", "price": 10}, "name is longer than 255"),
+    ({"name": "A\x00", "city": "B", "price": 10}, "name contains a NUL"),
+    ({"name": 5, "city": "B", "price": 10}, "name must be a string"),
+])
+def test_parse_hotel_row_rejects(record, error):
+    with pytest.raises(ValueError, match=error):
+        app.parse_hotel_row(record)
+
+def test_parse_reservation_row_accepts_csv_strings():
+    row = app.parse_reservation_row({
+        "hotel_id": "7", "guest_name": "Ann", "check_in": "2026-05-01",
+        "check_out": "2026-05-03", "num_guests": "2",
+    })
+    assert row == [7, "Ann", date(2026, 5, 1), date(2026, 5, 3), 2]
+
+@pytest.mark.parametrize("changes, error", [
+    ({"hotel_id": True}, "hotel_id must be an integer"),
+    ({"hotel_id": 1.5}, "hotel_id must be an integer"),
+    ({"hotel_id": "-1"}, "hotel_id must be an integer"),
+    ({"hotel_id": 2 ** 31}, "hotel_id must be between"),
+    ({"num_guests": 0}, "num_guests must be between"),
+    ({"check_in": "01/05/2026"}, "check_in must be a YYYY-MM-DD date"),
+    ({"check_out": "2026-05-01"}, "check_out must be after check_in"),
+])
+def test_parse_reservation_row_rejects(changes, error):
+    record = {
+        "hotel_id": 1, "guest_name": "Ann", "check_in": "2026-05-01",
+        "check_out": "2026-05-03", "num_guests": 2, **changes,
+    }
+    with pytest.raises(ValueError, match=error):
+        app.parse_reservation_row(record)
+
+# Streaming
+
+def test_copy_source_pulls_records_as_it_is_read():
+    consumed = []
+
+    def records():
+        for row_no in range(1, 1001):
+            consumed.append(row_no)
+            yield row_no, {"name": f"Hotel {row_no}", "city": "Rome", "price": "50"}, None
+
+    source = app._CopySource(records(), app.parse_hotel_row)
+    first = source.read(64)
+    assert len(first) == 64
+    assert len(consumed) < 10
+    rest = source.read(-1)
+    assert len(consumed) == 1000
+    lines = (first + rest).splitlines()
+    assert lines[0] == "1,Hotel 1,Rome,50.00"
+    assert len(lines) == 1000
+    assert source.read(64) == ""
+
+def test_copy_source_skips_invalid_rows():
+    records = iter([
+        (1, {"name": "A", "city": "Rome", "price": "50"}, None),
+        (2, None, "Invalid JSON: boom"),
+        (3, {"name": "B", "city": "Rome", "price": "-1"}, None),
+        (4, {"name": "C", "city": "Rome", "price": "60"}, None),
+    ])
+    source = app._CopySource(records, app.parse_hotel_row)
+    assert source.read(-1) == "1,A,Rome,50.00\r\n4,C,Rome,60.00\r\n"
+    assert source.received == 4
+    assert source.rejected == 2
+    assert [error["row"] for error in source.errors] == [2, 3]
+
+def test_copy_source_ends_the_data_on_upload_errors():
+    def records():
+        yield 1, {"name": "A", "city": "Rome", "price": "50"}, None
+        raise app.BulkImportError("Request body is not valid UTF-8: invalid start byte")
+
+    source = app._CopySource(records(), app.parse_hotel_row)
+    assert source.read(-1) == "1,A,Rome,50.00\r\n"
+    assert isinstance(source.failure, app.BulkImportError)
+
+def test_body_lines_reassembles_lines_across_chunks(monkeypatch):
+    monkeypatch.setattr(app, "BULK_READ_SIZE", 3)
+    body = "﻿name,city\nCafé,København\nlast".encode("utf-8")
+    with app.app.test_request_context(data=body):
+        assert list(app._body_lines()) == ["name,city\n", "Café,København\n", "last"]
+
+def test_body_lines_caps_the_line_length(monkeypatch):
+    monkeypatch.setattr(app, "BULK_MAX_LINE_LENGTH", 10)
+    with app.app.test_request_context(data=b"short\n" + b"x" * 11):
+        with pytest.raises(app.BulkImportError, match="at most 10 characters"):
+            list(app._body_lines())
+    # A line without a break is refused before the whole body is buffered
+    monkeypatch.setattr(app, "BULK_READ_SIZE", 4)
+    body = io.BytesIO(b"x" * 1000)
+    with app.app.test_request_context(input_stream=body, content_length=1000):
+        with pytest.raises(app.BulkImportError):
+            next(app._body_lines())
+    assert body.tell() <= 16
+
+# Imports against PostgreSQL
+
+@pytest.fixture(scope="module")
+def database():
+    admin_config = {**app.DB_CONFIG, "database": "postgres"}
+    try:
+        admin = psycopg2.connect(**admin_config)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+    admin.autocommit = True
+    cursor = admin.cursor()
+    cursor.execute(f'DROP DATABASE IF EXISTS "{TEST_DATABASE}"')
+    cursor.execute(f'CREATE DATABASE "{TEST_DATABASE}"')
+
+    original = app.DB_CONFIG["database"]
+    app.DB_CONFIG["database"] = TEST_DATABASE
+    conn = app.get_db_connection()
+    conn.cursor().execute(TABLES_SQL)
+    conn.commit()
+    conn.close()
+    app.ensure_schema()
+    app._schema_started = True
+    try:
+        yield
+    finally:
+        if app._pool is not None:
+            app._pool.closeall()
+            app._pool = None
+        app.DB_CONFIG["database"] = original
+        cursor.execute(f'DROP DATABASE IF EXISTS "{TEST_DATABASE}"')
+        admin.close()
+
+@pytest.fixture
+def client(database):
+    conn = app.get_db_connection()
+    conn.cursor().execute("TRUNCATE reservations, hotels RESTART IDENTITY")
+    conn.commit()
+    conn.close()
+    return app.app.test_client()
+
+def query(sql, params=()):
+    conn = app.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def test_duplicate_hotels_keep_the_last_row(client):
+    client.post("/hotels", json={"name": "Savoy", "city": "London", "price": 300})
+    body = "name,city,price\nRitz,Paris,500\nritz,PARIS,450\nSavoy,london,320\nSavoy,London,310\n"
+    response = client.post("/hotels/bulk", data=body, content_type="text/csv")
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["inserted"] == 1
+    assert result["updated"] == 1
+    assert result["errors"] == [
+        {"row": 1, "error": "Duplicate of row 2"},
+        {"row": 3, "error": "Duplicate of row 4"},
+    ]
+    rows = query("SELECT name, city, price FROM hotels ORDER BY id")
+    assert [(row["name"], row["city"], row["price"]) for row in rows] == [
+        ("Savoy", "London", Decimal("310.00")),
+        ("ritz", "PARIS", Decimal("450.00")),
+    ]
+
+def test_overlap_chain_keeps_the_first_and_last_stay(client):
+    client.post("/hotels", json={"name": "Savoy", "city": "London", "price": 300})
+    stay = {"hotel_id": 1, "guest_name": "Ann", "num_guests": 2}
+    body = ndjson(
+        {**stay, "check_in": "2026-05-01", "check_out": "2026-05-04"},  # A
+        {**stay, "check_in": "2026-05-03", "check_out": "2026-05-06"},  # B overlaps A
+        {**stay, "check_in": "2026-05-05", "check_out": "2026-05-08"},  # C overlaps B only
+        {**stay, "check_in": "2026-05-07", "check_out": "2026-05-09"},  # D overlaps C
+        {**stay, "guest_name": "Bob", "check_in": "2026-05-03", "check_out": "2026-05-06"},
+    )
+    response = client.post("/reservations/bulk", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["inserted"] == 3
+    assert result["errors"] == [
+        {"row": 2, "error": "Overlaps row 1"},
+        {"row": 4, "error": "Overlaps row 3"},
+    ]
+    rows = query("SELECT guest_name, check_in FROM reservations ORDER BY id")
+    assert [(row["guest_name"], row["check_in"].isoformat()) for row in rows] == [
+        ("Ann", "2026-05-01"), ("Ann", "2026-05-05"), ("Bob", "2026-05-03"),
+    ]
+
+def test_reservations_overlapping_stored_stays_are_rejected(client):
+    client.post("/hotels", json={"name": "Savoy", "city": "London", "price": 300})
+    stay = {"hotel_id": 1, "guest_name": "Ann", "num_guests": 2}
+    first = ndjson({**stay, "check_in": "2026-05-01", "check_out": "2026-05-04"})
+    client.post("/reservations/bulk", data=first, content_type="application/x-ndjson")
+
+    body = ndjson(
+        {**stay, "check_in": "2026-05-03", "check_out": "2026-05-05"},
+        {**stay, "hotel_id": 99, "check_in": "2026-06-01", "check_out": "2026-06-02"},
+    )
+    result = client.post("/reservations/bulk", data=body, content_type="application/x-ndjson").get_json()
+    assert result["inserted"] == 0
+    assert result["errors"] == [
+        {"row": 1, "error": "Overlaps reservation 1"},
+        {"row": 2, "error": "Unknown hotel_id"},
+    ]
+
+def test_overlong_line_fails_the_upload(client, monkeypatch):
+    monkeypatch.setattr(app, "BULK_MAX_LINE_LENGTH", 100)
+    body = "name,city,price\nRitz,Paris,500\n" + "x" * 101 + "\n"
+    response = client.post("/hotels/bulk", data=body, content_type="text/csv")
+
+    assert response.status_code == 400
+    assert "at most 100 characters" in response.get_json()["error"]
+    assert query("SELECT count(*) AS n FROM hotels")[0]["n"] == 0
@@ -1,40 +1,177 @@
+import os
 import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI
 import pika
 import threading
 
+from app.senders import get_sender
+
 app = FastAPI()
 
+sender = get_sender()
+
+# Concurrent consumer settings
+PREFETCH_COUNT = int(os.getenv("EMAIL_PREFETCH", 50))
+WORKER_COUNT = int(os.getenv("EMAIL_WORKERS", 16))
+ACK_BATCH_SIZE = int(os.getenv("EMAIL_ACK_BATCH", 20))
+ACK_INTERVAL = float(os.getenv("EMAIL_ACK_INTERVAL", 0.2))  # seconds
+
+def parse_email(body):
+    """Accept both {"email": ...} events and plain email strings"""
+    text = body.decode()
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(payload, dict):
+        return payload["email"]
+    return str(payload)
+
 def callback(ch, method, properties, body):
     try:
-        email = body.decode()
+        email = parse_email(body)
         print(f"Processing message: {email}")
-        print(f"Welcome email sent to {email}")
+        sender.send(email)
         ch.basic_ack(delivery_tag=method.delivery_tag)
         print("Message acknowledged")
     except Exception as e:
         print(f"Error processing message: {e}")
         ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
 
+def _declare_topology(channel):
+    exchange_name = 'user_events'
+    queue_name = 'user_registered'
+    channel.exchange_declare(exchange=exchange_name, exchange_type='direct', durable=True)
+    channel.queue_declare(queue=queue_name, durable=True)
+    channel.queue_bind(exchange=exchange_name, queue=queue_name, routing_key='user_registered')
+    return queue_name
+
+class BatchAcker:
+    """
+    Tracks deliveries handed to the worker pool and acknowledges them in batches.
+    Must only be used from the connection thread; workers report back through
+    add_callback_threadsafe.
+    """
+
+    def __init__(self, channel, batch_size):
+        self.channel = channel
+        self.batch_size = batch_size
+        self.pending = {}  # delivery_tag -> None (in flight) / True (sent) / False (failed)
+        self.acked = 0
+        self.nacked = 0
+
+    def track(self, delivery_tag):
+        self.pending[delivery_tag] = None
+
+    def complete(self, delivery_tag, ok):
+        self.pending[delivery_tag] = ok
+        if not ok:
+            self.flush()
+        elif self._ready_count() >= self.batch_size:
+            self.flush()
+
+    def _ready_count(self):
+        count = 0
+        for result in self.pending.values():
+            if result is None:
+                break
+            count += 1
+        return count
+
+    def flush(self):
+        """Ack the longest finished prefix with one multiple=True frame, nack failures"""
+        last_ok = None
+        for tag in sorted(self.pending):
+            result = self.pending[tag]
+            if result is None:
+                break
+            if result:
+                last_ok = tag
+            else:
+                # Ack everything before the failure, then requeue the failed delivery
+                if last_ok is not None:
+                    self.channel.basic_ack(delivery_tag=last_ok, multiple=True)
+                    last_ok = None
+                self.channel.basic_nack(delivery_tag=tag, requeue=True)
+                self.nacked += 1
+            del self.pending[tag]
+            if result:
+                self.acked += 1
+        if last_ok is not None:
+            self.channel.basic_ack(delivery_tag=last_ok, multiple=True)
+
+def start_concurrent_consumer(prefetch=PREFETCH_COUNT, workers=WORKER_COUNT,
+                              ack_batch=ACK_BATCH_SIZE, ack_interval=ACK_INTERVAL):
+    """
+    Consume with a larger prefetch window and send emails on a thread pool.
+    Completed deliveries are acknowledged in batches with basic_ack(multiple=True).
+    """
+    while True:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="email-sender")
+        try:
+            connection = pika.BlockingConnection(pika.ConnectionParameters(host='rabbitmq'))
+            print(f"Connected to RabbitMQ (prefetch={prefetch}, workers={workers}, ack_batch={ack_batch})")
+            channel = connection.channel()
+            channel.basic_qos(prefetch_count=prefetch)
+            queue_name = _declare_topology(channel)
+            acker = BatchAcker(channel, ack_batch)
+            started = time.monotonic()
+
+            def send_in_worker(delivery_tag, body):
+                ok = True
+                try:
+                    sender.send(parse_email(body))
+                except Exception as e:
+                    print(f"Error processing message: {e}")
+                    ok = False
+                # Channel operations must happen on the connection thread
+                connection.add_callback_threadsafe(lambda: acker.complete(delivery_tag, ok))
+
+            def on_message(ch, method, properties, body):
+                acker.track(method.delivery_tag)
+                executor.submit(send_in_worker, method.delivery_tag, body)
+
+            def periodic_flush():
+                acker.flush()
+                connection.call_later(ack_interval, periodic_flush)
+
+            channel.basic_consume(queue=queue_name, on_message_callback=on_message, auto_ack=False)
+            connection.call_later(ack_interval, periodic_flush)
+            print('Waiting for UserRegistered events (concurrent mode). To exit press CTRL+C')
+            try:
+                channel.start_consuming()
+            except KeyboardInterrupt:
+                channel.stop_consuming()
+                executor.shutdown(wait=True)
+                connection.process_data_events(time_limit=0)
+                acker.flush()
+                elapsed = time.monotonic() - started
+                print(f"Acked {acker.acked} messages ({acker.acked / elapsed:.1f}/s), nacked {acker.nacked}")
+                connection.close()
+                sender.close()
+                return
+        except pika.exceptions.AMQPConnectionError:
+            print("RabbitMQ is not ready. Retrying in 5 seconds...")
+            time.sleep(5)
+        finally:
+            executor.shutdown(wait=False)
+
 def start_rabbitmq_consumer():
     while True:
         try:
             connection = pika.BlockingConnection(pika.ConnectionParameters(host='rabbitmq'))
             print("Connected to RabbitMQ")
             channel = connection.channel()
-
-            exchange_name = 'user_events'
-            queue_name = 'user_registered'
-            channel.exchange_declare(exchange=exchange_name, exchange_type='direct', durable=True)
-            channel.queue_declare(queue=queue_name, durable=True)
-            channel.queue_bind(exchange=exchange_name, queue=queue_name, routing_key='user_registered')
+            queue_name = _declare_topology(channel)
 
             channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=False)
             print('Waiting for UserRegistered events. To exit press CTRL+C')
             channel.start_consuming()
         except pika.exceptions.AMQPConnectionError:
             print("RabbitMQ is not ready. Retrying in 5 seconds...")
-            import time
             time.sleep(5)
 
 # Start the RabbitMQ consumer in a separate thread
@@ -46,4 +183,7 @@ def start_rabbitmq_consumer():
 
 if __name__ == "__main__":
     if "--consumer" in sys.argv:
-        start_rabbitmq_consumer()
+        if "--concurrent" in sys.argv or os.getenv("EMAIL_CONSUMER_MODE") == "concurrent":
+            start_concurrent_consumer()
+        else:
+            start_rabbitmq_consumer()
@@ -0,0 +1,80 @@
+import os
+import smtplib
+import threading
+from email.message import EmailMessage
+
+
+class ConsoleSender:
+    """Prints the welcome email instead of sending it (the original behaviour)."""
+
+    def send(self, email: str):
+        print(f"Welcome email sent to {email}")
+
+    def close(self):
+        pass
+
+
+class SMTPSender:
+    """
+    Sends the welcome email over SMTP.
+    Each worker thread keeps its own connection so sends can run concurrently.
+    """
+
+    def __init__(self, host=None, port=None, sender=None, timeout=10):
+        self.host = host or os.getenv("SMTP_HOST", "localhost")
+        self.port = int(port or os.getenv("SMTP_PORT", 1025))
+        self.sender = sender or os.getenv("SMTP_FROM", "no-reply@example.com")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _build_message(self, email: str):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        msg["To"] = email
+        msg["Subject"] = "Welcome!"
+        msg.set_content("Thanks for registering.")
+        return msg
+
+    def send(self, email: str):
+        msg = self._build_message(email)
+        try:
+            self._connection().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, OSError):
+            # Connection went stale; reconnect once and retry
+            self._local.conn = None
+            self._connection().send_message(msg)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.quit()
+            except Exception:
+                pass
+
+
+SENDERS = {
+    "console": ConsoleSender,
+    "smtp": SMTPSender,
+}
+
+
+def get_sender(name=None):
+    """Build the sender backend selected by name or the EMAIL_SENDER env var."""
+    name = (name or os.getenv("EMAIL_SENDER", "console")).lower()
+    try:
+        return SENDERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown email sender '{name}'. Choose one of: {', '.join(SENDERS)}")
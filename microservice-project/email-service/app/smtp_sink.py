@@ -0,0 +1,82 @@
+"""
+Minimal local SMTP server that accepts and discards mail.
+Used as a stand-in for a real mail relay when benchmarking the consumer:
+
+    python -m app.smtp_sink --port 1025 --latency-ms 50
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+        self.wfile.flush()
+
+    def handle(self):
+        self._reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+
+            if command.startswith(("HELO", "EHLO")):
+                self._reply("250 smtp-sink")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                # Simulate the round trip to a real relay
+                if self.server.latency:
+                    time.sleep(self.server.latency)
+                self.server.count_message()
+                self._reply("250 OK: queued")
+            elif command == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, latency_ms=0.0):
+        super().__init__(address, SMTPSinkHandler)
+        self.latency = latency_ms / 1000.0
+        self.received = 0
+        self._lock = threading.Lock()
+
+    def count_message(self):
+        with self._lock:
+            self.received += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SMTP sink for benchmarks")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Artificial delay per message to mimic a real relay")
+    args = parser.parse_args()
+
+    with SMTPSink((args.host, args.port), latency_ms=args.latency_ms) as server:
+        print(f"SMTP sink listening on {args.host}:{args.port} (latency {args.latency_ms}ms)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            print(f"SMTP sink received {server.received} messages")
+
+
+if __name__ == "__main__":
+    main()